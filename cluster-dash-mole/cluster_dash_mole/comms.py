@@ -1,6 +1,7 @@
 
 import json
 import queue
+import threading
 from concurrent import futures
 import datetime
 
@@ -41,14 +42,24 @@ class Sender(metaclass=abc.ABCMeta):
             pass
 
         time_now = datetime.datetime.now()
-        if self.last_updated is None or \
-                ((time_now - self.last_updated).total_seconds() > self.min_interval_in_secs):
+        if self._is_due(time_now):
             job = self._create_job(dict_in)
             if job is not None:
                 future = _thread_pool.submit(job)
                 future.add_done_callback(raise_exception_from_future)
             self.last_updated = time_now
 
+    def _is_due(self, time_now):
+        return self.last_updated is None or \
+            ((time_now - self.last_updated).total_seconds() > self.min_interval_in_secs)
+
+    def seconds_until_due(self, time_now):
+        """
+        Seconds until this sender wants to send again, or None to just go
+        with the poll interval.
+        """
+        return None
+
     @abc.abstractmethod
     def _create_job(self, dict_in):
         raise NotImplementedError
@@ -96,6 +107,12 @@ class GoogleSheetSender(Sender):
 class JsonSender(Sender):
     """
     Sends the data as a JSON to a server.
+
+    The server's reply suggests when to report next (``next_report_secs``,
+    plus a one-off ``backoff_secs`` when it is overloaded). If
+    ``hinted_interval_min_secs`` and ``hinted_interval_max_secs`` are set,
+    these are followed, clamped to that range; otherwise, or until the first
+    reply, reports go out every ``min_interval_in_secs``/poll as before.
     """
     def __init__(self):
         json_sender_config = settings_loader.get_config_parser()["Json_Sender_Logger"]
@@ -104,6 +121,51 @@ class JsonSender(Sender):
         self.send_address = json_sender_config["address_in"]
         self.auth_code = json_sender_config["auth_code"]
 
+        self.hinted_interval_min = json_sender_config.get("hinted_interval_min_secs")
+        self.hinted_interval_max = json_sender_config.get("hinted_interval_max_secs")
+        self._hinted_interval = None
+        self._backoff = 0
+        self._hints_lock = threading.Lock()
+
+    def _take_hints(self, json_back):
+        """Adopt the report interval and backoff suggested in a server reply."""
+        if self.hinted_interval_min is None or self.hinted_interval_max is None:
+            return
+        interval = json_back.get("next_report_secs")
+        if not isinstance(interval, (int, float)):
+            return
+        interval = min(max(interval, self.hinted_interval_min, self.min_interval_in_secs),
+                       self.hinted_interval_max)
+        backoff = json_back.get("backoff_secs", 0)
+        if not isinstance(backoff, (int, float)):
+            backoff = 0
+        backoff = min(max(backoff, 0), self.hinted_interval_max)
+        with self._hints_lock:
+            if interval != self._hinted_interval:
+                log = logging_utils.get_log()
+                log.info(f"Server suggests reporting every {interval} secs.")
+            self._hinted_interval = interval
+            self._backoff = backoff
+
+    def _next_due_secs(self):
+        """Seconds after the last report that the next one is due, or None without hints."""
+        with self._hints_lock:
+            if self._hinted_interval is None:
+                return None
+            return self._hinted_interval + self._backoff
+
+    def _is_due(self, time_now):
+        due_secs = self._next_due_secs()
+        if due_secs is None or self.last_updated is None:
+            return super()._is_due(time_now)
+        return (time_now - self.last_updated).total_seconds() >= due_secs
+
+    def seconds_until_due(self, time_now):
+        due_secs = self._next_due_secs()
+        if due_secs is None or self.last_updated is None:
+            return None
+        return max(due_secs - (time_now - self.last_updated).total_seconds(), 0)
+
     def _add_supp(self, dict_in):
         dict_in["auth_code"] = self.auth_code
         dict_in["hostname"] = general_machine_data.MachineData.get_hostname()
@@ -112,7 +174,10 @@ class JsonSender(Sender):
     def _create_job(self, dict_in):
         self._add_supp(dict_in)
         json_to_send = json.dumps(dict_in)
-        req = create_request(self.send_address, json_to_send)
+        with self._hints_lock:
+            # the backoff only delays the one report after it was suggested
+            self._backoff = 0
+        req = create_request(self.send_address, json_to_send, on_reply=self._take_hints)
         return req
 
 
@@ -135,7 +200,7 @@ def raise_exception_from_future(future):
         kill_msgs.put(ex.message)
 
 
-def create_request(address, json_in):
+def create_request(address, json_in, on_reply=None):
     def req():
         log = logging_utils.get_log()
         global request_fails
@@ -148,6 +213,8 @@ def create_request(address, json_in):
             jsonBack = r.json()
 
             log.info("The request was a success?: {}, {}".format(jsonBack["success"], jsonBack["msg"]))
+            if on_reply is not None:
+                on_reply(jsonBack)
 
         except (requests.Timeout, requests.HTTPError) as ex:
             log.info("Request failed.")
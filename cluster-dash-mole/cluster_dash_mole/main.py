@@ -1,4 +1,5 @@
 
+import datetime
 import time
 
 
@@ -38,7 +39,20 @@ class MainRunner(object):
             log.debug("Sending data: {}".format(str(data)))
             for c_ in self.comm_senders:
                 c_.work(data)
-            time.sleep(settings["Poll_Settings"]["poll_interval_in_secs"])
+            time.sleep(self.get_sleep_secs(settings["Poll_Settings"]["poll_interval_in_secs"]))
+
+    def get_sleep_secs(self, poll_interval_in_secs):
+        """
+        Time until the next poll: the poll interval, or sooner if a sender
+        (following server hints) is due before then.
+        """
+        time_now = datetime.datetime.now()
+        waits = [poll_interval_in_secs]
+        for c_ in self.comm_senders:
+            wait = c_.seconds_until_due(time_now)
+            if wait is not None:
+                waits.append(wait)
+        return max(min(waits), 1)
 
     def get_data(self):
         log = logging_utils.get_log()
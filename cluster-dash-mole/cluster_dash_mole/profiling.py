@@ -0,0 +1,125 @@
+"""
+On-demand profiling of a running mole, started by sending it SIGUSR1, e.g.
+
+    kill -USR1 $(pgrep -f smart_startup.py)
+
+Each signal runs one capture of ``duration_in_secs`` (settings in the
+optional ``[Profiling]`` section of the config) and writes it to
+``output_dir``:
+
+- ``mode = "sample"`` (default): a background thread snapshots every
+  thread's stack, the main loop's ``MainRunner.get_data`` and the senders'
+  thread pool alike, and writes collapsed stacks (``thread;outer;...;inner
+  count`` lines for flamegraph.pl or speedscope);
+- ``mode = "cprofile"``: cProfile runs on the main thread (polling and
+  handing reports to the senders) until a SIGALRM ends it, and writes a
+  pstats file.
+
+Until a signal arrives nothing but the signal handler is installed.
+"""
+
+import collections
+import cProfile
+import os
+import signal
+import sys
+import tempfile
+import threading
+import time
+
+from . import logging_utils
+
+_capturing = threading.Lock()
+
+
+def _sample_stacks(duration_secs, interval_secs):
+    """Counts of every other thread's collapsed stack, sampled for ``duration_secs``."""
+    counts = collections.Counter()
+    me = threading.get_ident()
+    deadline = time.monotonic() + duration_secs
+    while time.monotonic() < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            labels = []
+            while frame is not None:
+                code = frame.f_code
+                labels.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            labels.append(names.get(ident, str(ident)))
+            labels.reverse()
+            counts[";".join(label.replace(";", ":").replace(" ", "_") for label in labels)] += 1
+        time.sleep(interval_secs)
+    return counts
+
+
+def _output_path(output_dir, suffix):
+    os.makedirs(output_dir, exist_ok=True)
+    name = time.strftime("cluster-dash-mole-%Y%m%d-%H%M%S", time.localtime())
+    return os.path.join(output_dir, f"{name}-{os.getpid()}{suffix}")
+
+
+def _sample(settings):
+    log = logging_utils.get_log()
+    try:
+        counts = _sample_stacks(settings["duration_in_secs"], settings["sample_interval_in_secs"])
+        path = _output_path(settings["output_dir"], ".collapsed")
+        with open(path, "w") as fo:
+            for stack, count in counts.most_common():
+                fo.write(f"{stack} {count}\n")
+        log.info(f"Profile written to {path}")
+    except Exception as ex:
+        log.warning(f"Profiling failed: {ex}")
+    finally:
+        _capturing.release()
+
+
+def _start_cprofile(settings):
+    profile = cProfile.Profile()
+
+    def stop(signum, frame):
+        profile.disable()
+        signal.signal(signal.SIGALRM, signal.SIG_DFL)
+        log = logging_utils.get_log()
+        try:
+            path = _output_path(settings["output_dir"], ".pstats")
+            profile.dump_stats(path)
+            log.info(f"Profile written to {path}")
+        except Exception as ex:
+            log.warning(f"Profiling failed: {ex}")
+        finally:
+            _capturing.release()
+
+    signal.signal(signal.SIGALRM, stop)
+    signal.setitimer(signal.ITIMER_REAL, settings["duration_in_secs"])
+    profile.enable()
+
+
+def install_signal_handler(config):
+    """
+    Start a capture on SIGUSR1, with the settings of the config's
+    ``[Profiling]`` section (``config``, may be empty).
+    """
+    settings = {
+        "mode": config.get("mode", "sample"),
+        "duration_in_secs": config.get("duration_in_secs", 30),
+        "sample_interval_in_secs": config.get("sample_interval_in_secs", 0.01),
+        "output_dir": config.get("output_dir", tempfile.gettempdir()),
+    }
+    if settings["mode"] not in ("sample", "cprofile"):
+        raise ValueError(f"unknown profiling mode: {settings['mode']}")
+
+    def start(signum, frame):
+        log = logging_utils.get_log()
+        if not _capturing.acquire(blocking=False):
+            log.info("Already profiling, ignoring signal.")
+            return
+        log.info(f"Profiling ({settings['mode']}) for {settings['duration_in_secs']} secs.")
+        if settings["mode"] == "cprofile":
+            _start_cprofile(settings)
+        else:
+            threading.Thread(target=_sample, args=(settings,), name="profiler", daemon=True).start()
+
+    # signals only run handlers on the main thread, where cProfile then profiles
+    signal.signal(signal.SIGUSR1, start)
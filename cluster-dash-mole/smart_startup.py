@@ -49,6 +49,10 @@ def main():
 
     osp.join = patched_join
 
+    # kill -USR1 <pid> profiles the running mole (see cluster_dash_mole/profiling.py)
+    from cluster_dash_mole import profiling
+    profiling.install_signal_handler(settings_loader.get_config_parser().get("Profiling", {}))
+
     print(f"Starting cluster monitor with config: {config_file}")
     cdm = MainRunner()
     try:
@@ -0,0 +1,60 @@
+import datetime
+
+import pytest
+
+from cluster_dash_mole import comms, settings_loader
+
+
+@pytest.fixture
+def make_sender(monkeypatch):
+    def make(**hint_limits):
+        monkeypatch.setattr(settings_loader, "_config", {
+            "Json_Sender_Logger": {
+                "min_interval_in_secs": 5,
+                "address_in": "http://localhost:8088",
+                "auth_code": "pass",
+                **hint_limits,
+            },
+        })
+        return comms.JsonSender()
+    return make
+
+
+def test_hints_are_clamped_to_the_configured_range(make_sender):
+    sender = make_sender(hinted_interval_min_secs=30, hinted_interval_max_secs=540)
+    sender._take_hints({"next_report_secs": 300, "backoff_secs": 0})
+    assert sender._next_due_secs() == 300
+
+    sender._take_hints({"next_report_secs": 1, "backoff_secs": 0})
+    assert sender._next_due_secs() == 30
+    sender._take_hints({"next_report_secs": 10000, "backoff_secs": 10000})
+    assert sender._next_due_secs() == 540 + 540
+    sender._take_hints({"next_report_secs": 60, "backoff_secs": -5})
+    assert sender._next_due_secs() == 60
+
+
+def test_min_interval_stays_a_floor(make_sender):
+    sender = make_sender(hinted_interval_min_secs=0, hinted_interval_max_secs=540)
+    sender._take_hints({"next_report_secs": 1})
+    assert sender._next_due_secs() == 5
+
+
+def test_malformed_hints_are_ignored(make_sender):
+    sender = make_sender(hinted_interval_min_secs=30, hinted_interval_max_secs=540)
+    sender._take_hints({"success": True})
+    sender._take_hints({"next_report_secs": "soon"})
+    assert sender._next_due_secs() is None
+    sender._take_hints({"next_report_secs": 60, "backoff_secs": "later"})
+    assert sender._next_due_secs() == 60
+
+
+def test_hints_are_ignored_without_limits(make_sender):
+    sender = make_sender()
+    sender._take_hints({"next_report_secs": 300, "backoff_secs": 10})
+    assert sender._next_due_secs() is None
+
+    # reports go out every min_interval_in_secs as before
+    now = datetime.datetime.now()
+    sender.last_updated = now
+    assert not sender._is_due(now + datetime.timedelta(seconds=5))
+    assert sender._is_due(now + datetime.timedelta(seconds=6))
@@ -0,0 +1,115 @@
+"""
+Time a backfill end to end, from report files to rows in the history partitions.
+
+Writes reports from ``--hosts`` hosts every 5 minutes over ``--days`` days
+to an .ndjson file. The reports are modelled on etc/example_data1.json (see
+synthetic.py), with 8 GPUs per host, each busy or idle. The file is then
+loaded twice, each time into a fresh instance folder:
+
+1. summarised up front and handed to the single writer, timing the writer
+   alone, which is what a load reaches with enough worker processes (the
+   backfill aims for 100,000 rows/s or more);
+2. end to end with ``backfill.run``, as ``python -m
+   cluster_dash_server.backfill`` would with ``--workers``.
+
+Usage (from cluster-dash-server/):
+
+    python benchmarks/bench_backfill.py --hosts 200 --days 7 --workers 4
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from cluster_dash_server import backfill, create_app  # noqa: E402
+from synthetic import make_report  # noqa: E402
+
+REPORT_SECS = 300
+
+
+def write_reports(path, args):
+    """Write the reports, oldest first; returns how many."""
+    rng = random.Random(args.seed)
+    # one report per host to vary, so each host keeps its GPUs
+    templates = [make_report(f"host{i:04d}", rng=rng) for i in range(args.hosts)]
+    steps = args.days * 86400 // REPORT_SECS
+    start = time.time() - steps * REPORT_SECS
+    with open(path, "w") as f:
+        for step in range(steps):
+            for report in templates:
+                report["timestamp"] = start + step * REPORT_SECS + rng.uniform(0, 10)
+                for gpu in report["gpu"].values():
+                    if gpu["users"]:
+                        gpu["gpu_util"] = rng.randrange(40, 100)
+                f.write(json.dumps(report) + "\n")
+    return steps * args.hosts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--hosts", type=int, default=200)
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 1) - 1))
+    parser.add_argument("--batch-size", type=int, default=2000)
+    parser.add_argument("--no-validate", action="store_true")
+    parser.add_argument("--rebuild-indexes", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "reports.ndjson")
+        num_reports = write_reports(path, args)
+        print(f"{num_reports:,} reports from {args.hosts} hosts over {args.days} days "
+              f"({os.path.getsize(path) / 1e6:,.0f} MB)", flush=True)
+
+        validate = not args.no_validate
+
+        # the single writer on its own: what a load reaches once there are
+        # enough workers to keep it busy
+        create_app(
+            {"PASSCODE": "bench", "HISTORY_RETENTION_ENABLED": False},
+            instance_path=os.path.join(tmp, "writer"),
+        )
+        batches = [
+            backfill.summarize_work(work, validate)
+            for work in backfill.iter_work([path], args.batch_size)
+        ]
+        loader = backfill.Loader(rebuild_indexes=args.rebuild_indexes)
+        started = time.perf_counter()
+        for batch in batches:
+            loader.load(batch.summaries)
+        loader.finish()
+        elapsed = time.perf_counter() - started
+        print(f"writer alone: {loader.rows:,} rows in {elapsed:.1f} s, "
+              f"{loader.rows / elapsed:,.0f} rows/s", flush=True)
+        del batches
+
+        create_app(
+            {"PASSCODE": "bench", "HISTORY_RETENTION_ENABLED": False},
+            instance_path=os.path.join(tmp, "instance"),
+        )
+        started = time.perf_counter()
+        totals = backfill.run(
+            [path],
+            batch_size=args.batch_size,
+            workers=args.workers,
+            validate=validate,
+            rebuild_indexes=args.rebuild_indexes,
+        )
+        elapsed = time.perf_counter() - started
+
+    print(
+        f"end to end: {totals['rows']:,} rows ({totals['read']:,} reports read, "
+        f"{totals['rejected']:,} rejected) in {elapsed:.1f} s with {args.workers} workers, "
+        f"{totals['rows'] / elapsed:,.0f} rows/s, {totals['read'] / elapsed:,.0f} reports/s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Benchmark /data-out/gpu-data-simple against the old deepcopy-per-request version.
+
+Usage (from cluster-dash-server/):
+
+    python benchmarks/bench_gpu_data_simple.py --hosts 64 --requests 500
+"""
+
+import argparse
+import copy
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from flask import jsonify
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from cluster_dash_server import create_app  # noqa: E402
+from synthetic import make_report  # noqa: E402
+
+
+def add_legacy_route(app, reports):
+    """The pre-serialization implementation, working off the same raw reports."""
+    @app.route("/bench/gpu-data-simple-deepcopy")
+    def gpu_data_simple_deepcopy():
+        out = {}
+        for name, results in sorted(reports.items(), key=lambda x: x[0]):
+            out[name] = copy.deepcopy(results.get("gpu", {}))
+            for gpu_name, gpu_res in out[name].items():
+                gpu_res["received_timestamp"] = (
+                    time.time() - results["received_timestamp"]
+                )
+                gpu_res["time_received_mins"] = round(
+                    gpu_res["received_timestamp"] / 60
+                )
+        return jsonify(out)
+
+
+def measure(client, url, num_requests):
+    latencies = []
+    for _ in range(num_requests):
+        start = time.perf_counter()
+        response = client.get(url)
+        latencies.append(time.perf_counter() - start)
+        assert response.status_code == 200
+
+    tracemalloc.start()
+    client.get(url)
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        "peak_kb": peak / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--hosts", type=int, default=64)
+    parser.add_argument("--gpus", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as instance_path:
+        app = create_app(
+            {"PASSCODE": "bench", "HISTORY_RETENTION_ENABLED": False},
+            instance_path=instance_path,
+        )
+        reports = {}
+        add_legacy_route(app, reports)
+        client = app.test_client()
+
+        for i in range(args.hosts):
+            report = make_report(f"host{i:03d}", num_gpus=args.gpus, auth_code="bench")
+            client.post("/", json=report)
+            report.pop("auth_code")
+            report["received_timestamp"] = time.time()
+            reports[report["hostname"]] = report
+
+        print(f"{args.hosts} hosts x {args.gpus} GPUs, {args.requests} requests each")
+        for label, url in (
+            ("deepcopy (old)", "/bench/gpu-data-simple-deepcopy"),
+            ("pre-serialized", "/data-out/gpu-data-simple"),
+        ):
+            result = measure(client, url, args.requests)
+            print(
+                f"{label:>16}: p50 {result['p50_ms']:.2f} ms, "
+                f"p99 {result['p99_ms']:.2f} ms, "
+                f"peak allocated per request {result['peak_kb']:.0f} KiB"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Time one-host history queries (/api/history/<hostname>).
+
+Fills the monthly history partitions with ``--rows`` synthetic raw snapshots
+(``--hosts`` hosts every 5 minutes), then:
+
+1. times ``history.query_host_history`` for random hosts over 1, 7 and 30
+   day ranges;
+2. with ``--compare``, swaps the covering index for the old hostname-only
+   one and times the same queries again.
+
+That the queries use the covering indexes at all is checked by
+tests/test_history_indexes.py.
+
+Usage (from cluster-dash-server/):
+
+    python benchmarks/bench_host_history.py --rows 10000000 --compare
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from cluster_dash_server import create_app, history  # noqa: E402
+
+SNAPSHOT_SECS = 300
+RANGES_DAYS = (1, 7, 30)
+
+
+def fill(args, end):
+    """Write the synthetic snapshots ending at ``end``; returns (first ts, hostnames)."""
+    hostnames = [f"host{i:04d}" for i in range(args.hosts)]
+    steps = args.rows // args.hosts
+    first = end - steps * SNAPSHOT_SECS
+    rng = random.Random(args.seed)
+
+    by_partition = {}
+    for step in range(steps):
+        ts = first + step * SNAPSHOT_SECS
+        by_partition.setdefault(history.partition_name(ts), []).append(ts)
+
+    for name, timestamps in sorted(by_partition.items()):
+        history.ensure_partition(name)
+        conn = sqlite3.connect(history.partition_path(name))
+        try:
+            with conn:
+                conn.executemany(
+                    f"INSERT INTO gpu_snapshots ({history._SNAPSHOT_COLUMNS}) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        (ts, hostname, 8, rng.randrange(9), rng.uniform(0, 100),
+                         rng.uniform(0, 100), rng.uniform(0, 100))
+                        for ts in timestamps
+                        for hostname in hostnames
+                    ),
+                )
+        finally:
+            conn.close()
+        print(f"  {name}: {len(timestamps) * len(hostnames):,} rows", flush=True)
+    return first, hostnames
+
+
+def time_queries(hostnames, first, end, num_queries, seed):
+    rng = random.Random(seed)
+    results = {}
+    for days in RANGES_DAYS:
+        span = days * 86400
+        if span > end - first:
+            continue
+        bucket_secs = history.bucket_size_for_range(span, 2000)
+        latencies = []
+        for _ in range(num_queries):
+            start = rng.uniform(first, end - span)
+            hostname = rng.choice(hostnames)
+            t = time.perf_counter()
+            out = history.query_host_history(hostname, start, start + span, bucket_secs)
+            latencies.append(time.perf_counter() - t)
+        latencies.sort()
+        results[days] = (
+            statistics.median(latencies) * 1000,
+            latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+            len(out["timestamps"]),
+        )
+    return results
+
+
+def swap_to_old_index():
+    """Replace the covering index with the hostname-only index it superseded."""
+    for name in history.list_partitions():
+        conn = sqlite3.connect(history.partition_path(name))
+        try:
+            conn.execute("DROP INDEX IF EXISTS idx_snapshots_host_time")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_snapshots_hostname ON gpu_snapshots(hostname)"
+            )
+        finally:
+            conn.close()
+
+
+def print_timings(label, results):
+    print(label)
+    for days, (p50, p99, points) in results.items():
+        print(f"  {days:>3} days: p50 {p50:8.2f} ms, p99 {p99:8.2f} ms ({points} buckets)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--hosts", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=50, help="per range")
+    parser.add_argument("--compare", action="store_true",
+                        help="also time the old hostname-only index")
+    parser.add_argument("--instance-path", help="keep the instance folder here")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        instance_path = args.instance_path or tmp
+        create_app(
+            {"PASSCODE": "bench", "HISTORY_RETENTION_ENABLED": False},
+            instance_path=instance_path,
+        )
+        end = time.time()
+        print(f"filling {args.rows:,} snapshots for {args.hosts} hosts", flush=True)
+        t = time.perf_counter()
+        first, hostnames = fill(args, end)
+        print(f"  took {time.perf_counter() - t:.1f} s")
+
+        print_timings(
+            "covering (hostname, timestamp, ...) index:",
+            time_queries(hostnames, first, end, args.queries, args.seed),
+        )
+        if args.compare:
+            swap_to_old_index()
+            print_timings(
+                "old hostname-only index:",
+                time_queries(hostnames, first, end, args.queries, args.seed),
+            )
+
+
+if __name__ == "__main__":
+    main()
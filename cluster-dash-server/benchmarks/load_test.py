@@ -0,0 +1,364 @@
+"""
+Load-test ingest and read endpoints with a simulated fleet of moles.
+
+Each of ``--hosts`` simulated hosts POSTs a synthetic report (see
+synthetic.py) every ``--interval`` seconds, spread evenly over the interval,
+while readers fetch /api/dashboard-data and /api/history-data at fixed rates.
+Requests are scheduled open-loop, so a server that falls behind shows up as
+a lag and a lower achieved rate rather than as the load quietly backing off.
+
+Targets:
+
+- ``--target client`` (default): the Flask test client, in process.
+- ``--target waitress``: a waitress server on a local port, in process.
+- ``--url http://host:port``: an already-running server (pass its PASSCODE
+  with ``--auth-code``). SQLite lock errors can't be seen from here.
+
+For in-process targets the server's output is scanned for "database is
+locked" to count SQLite lock errors (ingests swallow history write errors).
+
+Usage (from cluster-dash-server/):
+
+    python benchmarks/load_test.py --hosts 500 --interval 10 --seconds 30
+    python benchmarks/load_test.py --target waitress --threads 8 --output baseline.json
+"""
+
+import argparse
+import contextlib
+import http.client
+import io
+import json
+import os
+import queue
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from cluster_dash_server import create_app, history  # noqa: E402
+from synthetic import make_report  # noqa: E402
+
+LOCK_ERROR = "database is locked"
+
+
+class LockErrorCounter(io.TextIOBase):
+    """Stream that counts SQLite lock errors in what is written to it."""
+    def __init__(self, wrapped, quiet):
+        self.wrapped = wrapped
+        self.quiet = quiet
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def write(self, text):
+        if LOCK_ERROR in text:
+            with self._lock:
+                self.count += text.count(LOCK_ERROR)
+        if not self.quiet:
+            self.wrapped.write(text)
+        return len(text)
+
+    def flush(self):
+        self.wrapped.flush()
+
+
+class TestClientTransport:
+    """Requests through the Flask test client; one client per thread."""
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def request(self, method, path, body=None):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        if method == "POST":
+            response = client.post(path, data=body, content_type="application/json")
+        else:
+            response = client.get(path)
+        return response.status_code, len(response.data)
+
+
+class HttpTransport:
+    """Requests over HTTP, keeping one connection per thread alive."""
+    def __init__(self, url):
+        parsed = urllib.parse.urlsplit(url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self._local = threading.local()
+
+    def request(self, method, path, body=None):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(
+                self.host, self.port, timeout=60
+            )
+        headers = {"Content-Type": "application/json"} if body else {}
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            self._local.conn = None
+            raise
+        return response.status, len(data)
+
+
+def start_waitress(app, threads):
+    """Serve ``app`` with waitress on a free local port; returns its URL."""
+    import waitress.server
+
+    server = waitress.server.create_server(
+        app, host="127.0.0.1", port=0, threads=threads
+    )
+    threading.Thread(target=server.run, daemon=True).start()
+    return f"http://127.0.0.1:{server.effective_port}", server
+
+
+class EndpointStats:
+    """Latencies, lags and failures for one stream of requests."""
+    def __init__(self, name, rate):
+        self.name = name
+        self.rate = rate
+        self.latencies = []
+        self.lags = []
+        self.statuses = {}
+        self.errors = []
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+    def record(self, lag, latency, status=None, size=0, error=None):
+        with self._lock:
+            self.lags.append(lag)
+            if error is not None:
+                self.errors.append(error)
+                return
+            self.latencies.append(latency)
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            self.bytes += size
+
+    def summary(self, seconds):
+        latencies = sorted(self.latencies)
+        ok = sum(n for status, n in self.statuses.items() if status in (200, 304))
+
+        def pct(p):
+            if not latencies:
+                return None
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+        return {
+            "target_rate": self.rate,
+            "achieved_rate": ok / seconds,
+            "requests": len(self.lags),
+            "ok": ok,
+            "failed": len(self.lags) - ok,
+            "statuses": {str(k): v for k, v in sorted(self.statuses.items())},
+            "p50_ms": pct(0.50),
+            "p99_ms": pct(0.99),
+            "max_lag_ms": max(self.lags) * 1000 if self.lags else None,
+            "mean_bytes": self.bytes / len(latencies) if latencies else None,
+            "errors": self.errors[:5],
+        }
+
+
+def run_paced(stats, rate, workers, make_request, transport, seconds, stop):
+    """
+    Issue ``rate`` requests per second for ``seconds`` from ``workers``
+    threads; returns the threads. ``make_request(n)`` gives (method, path, body).
+    """
+    jobs = queue.Queue()
+
+    def schedule():
+        start = time.perf_counter()
+        n = 0
+        while not stop.is_set():
+            due = start + n / rate
+            if due - start >= seconds:
+                break
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            jobs.put((n, due))
+            n += 1
+        for _ in range(workers):
+            jobs.put(None)
+
+    def work():
+        while True:
+            job = jobs.get()
+            if job is None:
+                return
+            n, due = job
+            method, path, body = make_request(n)
+            started = time.perf_counter()
+            try:
+                status, size = transport.request(method, path, body)
+            except Exception as ex:
+                stats.record(started - due, None, error=repr(ex))
+            else:
+                stats.record(started - due, time.perf_counter() - started, status, size)
+
+    threads = [threading.Thread(target=schedule)]
+    threads += [threading.Thread(target=work) for _ in range(workers)]
+    for t in threads:
+        t.start()
+    return threads
+
+
+def make_fleet(args, auth_code):
+    """Pre-serialized report variants per host, so sending costs no JSON work."""
+    rng = random.Random(args.seed)
+    return [
+        [
+            json.dumps(make_report(
+                f"host{i:04d}", num_gpus=args.gpus, pids_per_gpu=args.pids,
+                auth_code=auth_code, rng=rng,
+            ))
+            for _variant in range(args.variants)
+        ]
+        for i in range(args.hosts)
+    ]
+
+
+def run(args, transport, auth_code):
+    fleet = make_fleet(args, auth_code)
+    ingest_rate = args.hosts / args.interval
+    history_path = f"/api/history-data?hours={args.history_hours}"
+    if args.history_format == "columns":
+        history_path += "&format=columns"
+
+    def ingest_request(n):
+        host = fleet[n % len(fleet)]
+        return "POST", "/", host[(n // len(fleet)) % len(host)]
+
+    streams = [
+        ("POST /", ingest_rate, args.ingest_workers, ingest_request),
+        ("GET /api/dashboard-data", args.dashboard_rate, args.read_workers,
+         lambda n: ("GET", "/api/dashboard-data", None)),
+        ("GET /api/history-data", args.history_rate, args.read_workers,
+         lambda n: ("GET", history_path, None)),
+    ]
+
+    stop = threading.Event()
+    results = []
+    threads = []
+    started = time.perf_counter()
+    for name, rate, workers, make_request in streams:
+        if rate <= 0:
+            continue
+        stats = EndpointStats(name, rate)
+        results.append(stats)
+        threads += run_paced(stats, rate, workers, make_request, transport, args.seconds, stop)
+    try:
+        for t in threads:
+            t.join()
+    except KeyboardInterrupt:
+        stop.set()
+        for t in threads:
+            t.join()
+    elapsed = time.perf_counter() - started
+    return {stats.name: stats.summary(elapsed) for stats in results}, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--target", choices=("client", "waitress"), default="client")
+    parser.add_argument("--url", help="load an already-running server instead")
+    parser.add_argument("--auth-code", default="bench", help="PASSCODE of --url")
+    parser.add_argument("--instance-path", help="reuse an instance folder (e.g. with history)")
+    parser.add_argument("--threads", type=int, default=4, help="waitress threads")
+    parser.add_argument("--hosts", type=int, default=200)
+    parser.add_argument("--gpus", type=int, default=8)
+    parser.add_argument("--pids", type=int, default=2, help="processes per busy GPU")
+    parser.add_argument("--variants", type=int, default=3, help="reports per host to cycle through")
+    parser.add_argument("--interval", type=float, default=10, help="seconds between a host's reports")
+    parser.add_argument("--dashboard-rate", type=float, default=20, help="requests/s")
+    parser.add_argument("--history-rate", type=float, default=1, help="requests/s")
+    parser.add_argument("--history-hours", type=int, default=24)
+    parser.add_argument("--history-format", choices=("columns", "rows"), default="columns",
+                        help="/api/history-data format (the history page uses columns)")
+    parser.add_argument("--ingest-workers", type=int, default=8)
+    parser.add_argument("--read-workers", type=int, default=4)
+    parser.add_argument("--record-every-post", action="store_true",
+                        help="record history on every ingest, not every "
+                             f"{history.SNAPSHOT_MIN_INTERVAL_SECS} s per host")
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the results as JSON here")
+    parser.add_argument("--verbose", action="store_true", help="show server output")
+    args = parser.parse_args()
+
+    config = {"PASSCODE": args.auth_code, "HISTORY_RETENTION_ENABLED": False}
+    counter = None
+    with contextlib.ExitStack() as stack:
+        if args.url:
+            transport = HttpTransport(args.url)
+            target = args.url
+        else:
+            instance_path = args.instance_path or stack.enter_context(
+                tempfile.TemporaryDirectory()
+            )
+            counter = LockErrorCounter(sys.stdout, quiet=not args.verbose)
+            stderr_counter = LockErrorCounter(sys.stderr, quiet=not args.verbose)
+            stdout = sys.stdout
+            stack.enter_context(contextlib.redirect_stdout(counter))
+            stack.enter_context(contextlib.redirect_stderr(stderr_counter))
+            app = create_app(config, instance_path=instance_path)
+            if args.record_every_post:
+                history.SNAPSHOT_MIN_INTERVAL_SECS = 0
+            if args.target == "waitress":
+                url, server = start_waitress(app, args.threads)
+                stack.callback(server.close)
+                transport = HttpTransport(url)
+                target = f"waitress ({args.threads} threads)"
+            else:
+                transport = TestClientTransport(app)
+                target = "flask test client"
+
+        results, elapsed = run(args, transport, args.auth_code)
+
+    lock_errors = None if counter is None else counter.count + stderr_counter.count
+    out = stdout if counter is not None else sys.stdout
+    print(
+        f"{target}: {args.hosts} hosts x {args.gpus} GPUs every {args.interval:g} s "
+        f"for {elapsed:.1f} s",
+        file=out,
+    )
+    for name, result in results.items():
+        p50 = "-" if result["p50_ms"] is None else f"{result['p50_ms']:.1f}"
+        p99 = "-" if result["p99_ms"] is None else f"{result['p99_ms']:.1f}"
+        print(
+            f"{name:>24}: {result['achieved_rate']:8.1f}/s of {result['target_rate']:g}/s, "
+            f"p50 {p50} ms, p99 {p99} ms, max lag {result['max_lag_ms'] or 0:.0f} ms, "
+            f"{result['failed']} failed",
+            file=out,
+        )
+        for error in result["errors"]:
+            print(f"{'':>26}{error}", file=out)
+    print(
+        "SQLite lock errors: " + ("n/a (remote server)" if lock_errors is None else str(lock_errors)),
+        file=out,
+    )
+
+    if args.output:
+        with open(args.output, "w") as fo:
+            json.dump({
+                "target": target,
+                "args": vars(args),
+                "elapsed_secs": elapsed,
+                "sqlite_lock_errors": lock_errors,
+                "endpoints": results,
+            }, fo, indent=2)
+
+    failed = any(result["failed"] for result in results.values()) or bool(lock_errors)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Synthetic mole reports, modelled on etc/example_data1.json."""
+
+import random
+import time
+import uuid as uuid_lib
+
+
+def make_report(hostname, num_gpus=8, pids_per_gpu=2, auth_code="pass", rng=random):
+    """Build one mole POST payload with ``num_gpus`` GPUs and busy/idle mixes."""
+    now = time.time()
+    gpus = {}
+    for index in range(num_gpus):
+        gpu_uuid = "GPU-" + str(uuid_lib.UUID(int=rng.getrandbits(128)))
+        total_mem = 24265.8125
+        busy = rng.random() < 0.6
+        users = {}
+        used_mem = 19.8125
+        if busy:
+            for p in range(pids_per_gpu):
+                user = f"user{rng.randrange(20)}"
+                mem = rng.uniform(500, total_mem / pids_per_gpu)
+                used_mem += mem
+                users.setdefault(user, {})[str(rng.randrange(1000, 99999))] = {
+                    "mem": mem,
+                    "time": rng.uniform(0, 86400),
+                    "name": "python",
+                }
+        gpus[f"{index}_NVIDIA-GeForce-RTX-3090_{gpu_uuid[4:10]}"] = {
+            "name": "NVIDIA GeForce RTX 3090",
+            "uuid": gpu_uuid,
+            "index": index,
+            "total_mem": total_mem,
+            "used_mem": used_mem,
+            "users": users,
+            "gpu_util": rng.randrange(40, 100) if busy else 0,
+            "memory_util": rng.randrange(10, 60) if busy else 0,
+        }
+
+    return {
+        "hostname": hostname,
+        "timestamp": now,
+        "auth_code": auth_code,
+        "general": {
+            "hostname": hostname,
+            "system_time": now,
+            "boottime": now - 86400 * 7,
+        },
+        "memory": {
+            "total_gb": 125.64807891845703,
+            "available_gb": 116.22850799560547,
+            "used_gb": 8.084880828857422,
+        },
+        "disk": {
+            "/dev/nvme0n1p2": {
+                "mount_point": "/",
+                "total_gb": 0.4990081787109375,
+                "used_gb": 0.005100250244140625,
+                "percent_used": 1.0,
+            },
+        },
+        "cpu": {
+            "cpu_percent": rng.uniform(0, 100),
+            "num_cpus": 64,
+            "load_avgs": [0.31, 0.28, 0.31],
+        },
+        "gpu": gpus,
+    }
+
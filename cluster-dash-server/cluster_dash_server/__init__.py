@@ -10,30 +10,64 @@ Routes:
     GET  /              - Serve the live dashboard
     GET  /history       - GPU usage history / waste report
     GET  /api/dashboard-data   - JSON API for live dashboard data
+    GET  /api/stream           - Redirect to the push server's Server-Sent Events stream
     GET  /api/history-data     - JSON API for historical time-series
+    GET  /api/gpu-history      - JSON API for per-GPU and per-user history
+    GET  /api/history/export   - Streamed CSV/NDJSON export of host or GPU history
+    GET  /api/history/<hostname> - One host's history over a range, in buckets
+    GET  /api/usage-by-user    - Per-user GPU-hours from the daily usage totals
     GET  /api/gpu-summary      - CLI-friendly text summary (with ANSI colors)
+    GET  /api/free-gpus        - Compact JSON list of free GPUs for job launchers
+    GET  /api/wait-for-gpus    - Redirect to the push server's long poll for free GPUs
+    GET  /api/idle-allocations - Processes holding memory on idle GPUs for too long
+    GET  /api/events           - Hosts going offline/online, with uptime per host
     GET  /data-out/gpu-data-simple - Legacy API (kept for compatibility)
+    GET  /metrics              - Prometheus metrics for the ingest and read paths
+    GET  /api/admin/retention  - History retention status and DB size (admin)
+    POST /api/admin/retention  - Run a retention/compaction pass now, or with
+                                 vacuum=1 a full VACUUM of older DB files (admin)
+    GET  /api/admin/profile    - Profiler status and captures written (admin)
+    POST /api/admin/profile    - Start a time-bounded sampling/cProfile capture (admin)
 """
 
-import copy
 from os import path as osp
+import csv
+import io
 import json
+import re
 import time
 
 import jsonschema
 from flask import (
     Flask,
+    Response,
     render_template,
     current_app,
     jsonify,
     abort,
+    g,
+    redirect,
     request,
+    send_from_directory,
 )
 from werkzeug.exceptions import BadRequest
 
+from . import free_gpus
 from . import history
+from . import host_events
+from . import metrics
+from .idle_allocations import IdleAllocationTracker
+from .profiling import Profiler
+from .report_hints import ReportPacer
+from . import retention
+from . import usage
+from .host_state import ONLINE_MAX_MINS, HostState
+from .response_cache import ResponseCache
+from . import state_store
+from .stream import PushServer, format_event
 
 _machine_post_schema = None
+_machine_post_validator = None
 
 
 def get_machine_post_schema():
@@ -46,16 +80,89 @@ def get_machine_post_schema():
     return _machine_post_schema
 
 
-def create_app(test_config=None):
+def get_machine_post_validator():
+    """
+    Build and cache a validator for the machine post schema.
+
+    ``jsonschema.validate`` checks the schema itself on every call, which
+    costs far more than validating a report against it, so the schema is
+    checked once here and the validator reused.
+    """
+    global _machine_post_validator
+    if _machine_post_validator is None:
+        schema = get_machine_post_schema()
+        validator_cls = jsonschema.validators.validator_for(schema)
+        validator_cls.check_schema(schema)
+        _machine_post_validator = validator_cls(schema)
+    return _machine_post_validator
+
+
+def create_app(test_config=None, instance_path=None):
     """Create and configure an instance of the Flask application."""
-    app = Flask(__name__)
+    app = Flask(__name__, instance_path=instance_path)
     app.config.from_mapping(
         PASSCODE="pass",
+        # waitress threads, for ingest, dashboard polls and history queries
+        # (cluster_dash_server.serve starts waitress with this many)
+        REQUEST_THREADS=4,
+        # live streams and /api/wait-for-gpus waiters hold no waitress
+        # threads: they are served by the push server (see stream.py), one
+        # event loop thread for all of them, on PUSH_HOST:PUSH_PORT. It is
+        # started by cluster_dash_server.serve, or here when PUSH_PORT is
+        # set (0 picks a free port). PUSH_URL overrides the address clients
+        # are sent to, e.g. when a reverse proxy forwards to it
+        PUSH_HOST="127.0.0.1",
+        PUSH_PORT=None,
+        PUSH_URL=None,
+        STREAM_MAX_CLIENTS=1000,
+        STREAM_MAX_SECS=300,
+        STREAM_HEARTBEAT_SECS=15,
+        STREAM_COALESCE_SECS=1.0,
+        # keep the latest report per host in instance/latest_state.db so it
+        # survives restarts and can be shared by several server processes
+        LATEST_STATE_PERSIST=True,
+        LATEST_STATE_REFRESH_SECS=1.0,
+        # open connections the push server accepts for /api/wait-for-gpus
+        WAIT_MAX_CLIENTS=1000,
+        WAIT_MAX_SECS=300,
+        WAIT_RECHECK_SECS=15,
+        # per-user accounting credits at most this long between two reports
+        USAGE_MAX_GAP_SECS=ONLINE_MAX_MINS * 60,
+        # processes holding at least IDLE_ALLOC_MIN_MEM_MB on a GPU at or
+        # below IDLE_ALLOC_MAX_GPU_UTIL % are flagged after IDLE_ALLOC_SECS
+        IDLE_ALLOC_SECS=3600,
+        IDLE_ALLOC_MAX_GPU_UTIL=5,
+        IDLE_ALLOC_MIN_MEM_MB=1024,
+        IDLE_ALLOC_MAX_TRACKED=100000,
+        # closed history buckets kept in memory (0 disables the cache), and
+        # whether to also keep them in instance/history_cache.db
+        HISTORY_CACHE_MAX_BUCKETS=50000,
+        HISTORY_CACHE_PERSIST=False,
+        # most points /api/history-data sends for a series
+        HISTORY_MAX_POINTS=2000,
+        # report intervals suggested to moles (see report_hints): while nobody
+        # watches, while a dashboard is open, and at most (inside the online
+        # threshold); never so short that the fleet passes the reports/s
+        # limit below, and stretched once ingest passes either limit
+        REPORT_IDLE_SECS=300,
+        REPORT_LIVE_SECS=30,
+        REPORT_MAX_SECS=ONLINE_MAX_MINS * 60 - 60,
+        REPORT_VIEWER_SECS=90,
+        INGEST_MAX_REPORTS_PER_SEC=50,
+        # ingests queued on the SQLite writer; keep below REQUEST_THREADS
+        INGEST_MAX_IN_FLIGHT=2,
+        # longest capture /api/admin/profile will run
+        PROFILE_MAX_SECS=120,
+        # hosts go offline once they miss this many of the reports they were
+        # asked for (see host_events), but never sooner than
+        # HOST_OFFLINE_MIN_SECS after their last one nor later than the
+        # ONLINE_MAX_MINS threshold
+        HOST_OFFLINE_MISSED_REPORTS=2,
+        HOST_OFFLINE_MIN_SECS=120,
     )
 
-    # In-memory storage for server data
-    # Key: hostname, Value: data dict with received_timestamp
-    stored_results_ = {}
+    # Serialized read-endpoint responses, invalidated on every ingest
+    response_cache_ = ResponseCache()
 
     if test_config is None:
         app.config.from_pyfile("config.py", silent=True)
@@ -64,11 +171,155 @@ def create_app(test_config=None):
         app.config.from_mapping(test_config)
 
     history.init_db(app)
+    retention.init_retention(app)
+
+    # Suggests how often moles should report, from ingest load and viewers
+    pacer_ = ReportPacer(
+        idle_secs=app.config["REPORT_IDLE_SECS"],
+        live_secs=app.config["REPORT_LIVE_SECS"],
+        max_secs=app.config["REPORT_MAX_SECS"],
+        max_reports_per_sec=app.config["INGEST_MAX_REPORTS_PER_SEC"],
+        max_in_flight=app.config["INGEST_MAX_IN_FLIGHT"],
+        viewer_secs=app.config["REPORT_VIEWER_SECS"],
+    )
+
+    # On-demand profiles of the running server, written to instance/profiles
+    profiler_ = Profiler(
+        app,
+        osp.join(app.instance_path, "profiles"),
+        max_secs=app.config["PROFILE_MAX_SECS"],
+    )
+
+    # Processes sitting on GPU memory without using the GPU
+    idle_tracker_ = IdleAllocationTracker(
+        threshold_secs=app.config["IDLE_ALLOC_SECS"],
+        max_gpu_util=app.config["IDLE_ALLOC_MAX_GPU_UTIL"],
+        min_mem_mb=app.config["IDLE_ALLOC_MIN_MEM_MB"],
+        stale_secs=ONLINE_MAX_MINS * 60,
+        max_allocations=app.config["IDLE_ALLOC_MAX_TRACKED"],
+    )
+
+    def host_status_changed(change):
+        # statuses are part of the cached read responses
+        response_cache_.bump()
+        try:
+            host_events.record_event(change)
+        except Exception as e:
+            print(f"Host event recording error: {e}")
+            metrics.HISTORY_ERRORS.inc()
+
+    # Online/offline per host from report deadlines, recorded in host_events
+    status_tracker_ = host_events.HostStatusTracker(
+        min_secs=app.config["HOST_OFFLINE_MIN_SECS"],
+        max_secs=ONLINE_MAX_MINS * 60,
+        missed_reports=app.config["HOST_OFFLINE_MISSED_REPORTS"],
+        on_change=host_status_changed,
+    )
+    status_tracker_.seed(host_events.latest_statuses())
+
+    def state_changed_elsewhere(snapshot):
+        # another server process ingested a report (or we just started up)
+        idle_tracker_.sync(snapshot)
+        status_tracker_.sync(snapshot)
+        response_cache_.bump()
+        push_.notify(snapshot.version, snapshot.free_version)
+
+    # Storage for server data: copy-on-write snapshots of
+    # hostname -> HostState parsed from the latest report
+    stored_results_ = state_store.open_store(app, on_change=state_changed_elsewhere)
+    status_tracker_.start(refresh=stored_results_.snapshot)
+
+    def stream_event(since):
+        # runs on the push server's loop thread
+        with app.app_context():
+            current = stored_results_.snapshot().version
+            name, build = dashboard_data_builder(since)
+            body = response_cache_.get(response_cache_.key(name), build)
+        return current, format_event(body, event="update", event_id=current)
+
+    def find_gpus(args, now):
+        # runs on the push server's loop thread
+        snapshot = stored_results_.snapshot()
+        matches = free_gpus.find_free_gpus(snapshot, now, **free_gpus.filters_from_args(args))
+        return bool(matches), free_gpus.payload(snapshot, now, matches)
+
+    # Live dashboard streams and GPU waiters, all served from one event loop thread
+    push_ = PushServer(
+        stream_event,
+        find_gpus,
+        refresh=stored_results_.snapshot,
+        max_streams=app.config["STREAM_MAX_CLIENTS"],
+        max_secs=app.config["STREAM_MAX_SECS"],
+        heartbeat_secs=app.config["STREAM_HEARTBEAT_SECS"],
+        coalesce_secs=app.config["STREAM_COALESCE_SECS"],
+        max_waiters=app.config["WAIT_MAX_CLIENTS"],
+        wait_max_secs=app.config["WAIT_MAX_SECS"],
+        recheck_secs=app.config["WAIT_RECHECK_SECS"],
+    )
+    app.extensions["push_server"] = push_
+    if app.config["PUSH_PORT"] is not None:
+        push_.start(app.config["PUSH_HOST"], app.config["PUSH_PORT"])
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def observe_request_time(response):
+        started = g.get("request_started")
+        if started is not None:
+            # label by rule, not path, so hostnames etc. don't blow up the series
+            rule = request.url_rule.rule if request.url_rule else "unmatched"
+            metrics.REQUEST_SECONDS.observe(
+                time.perf_counter() - started,
+                method=request.method, route=rule, status=str(response.status_code),
+            )
+        return response
 
     @app.errorhandler(400)
     def resource_not_found(e):
         return jsonify(dict(success=False, msg=str(e))), 400
 
+    @app.errorhandler(403)
+    def forbidden(e):
+        return jsonify(dict(success=False, msg=str(e))), 403
+
+    @app.errorhandler(409)
+    def conflict(e):
+        return jsonify(dict(success=False, msg=str(e))), 409
+
+    @app.errorhandler(503)
+    def unavailable(e):
+        return jsonify(dict(success=False, msg=str(e))), 503
+
+    def require_admin():
+        """Abort unless the request carries the admin passcode.
+
+        Accepted as an ``X-Auth-Code`` header or ``auth_code`` query param;
+        ADMIN_PASSCODE falls back to PASSCODE when not configured.
+        """
+        auth_code = request.headers.get("X-Auth-Code") or request.args.get("auth_code")
+        expected = current_app.config.get("ADMIN_PASSCODE") or current_app.config["PASSCODE"]
+        if auth_code != expected:
+            abort(403, "invalid auth code")
+
+    def cached_response(name, build, mimetype):
+        """
+        Serve ``build()``'s body from the response cache with an ETag,
+        answering 304 when the client already has the current version.
+        """
+        # picks up other processes' ingests (and drops stale cache entries)
+        stored_results_.snapshot()
+        key = response_cache_.key(name)
+        etag = response_cache_.etag(key)
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = Response(response_cache_.get(key, build), mimetype=mimetype)
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = "no-cache"
+        return response
+
     @app.route("/", methods=("GET", "POST"))
     def index():
         """
@@ -78,54 +329,99 @@ def create_app(test_config=None):
         """
         if request.method == "POST":
             # Data ingestion from mole agents
-            try:
+            with pacer_.ingest():
+                return ingest_report()
+        else:
+            # Serve the single-page dashboard
+            stream_url = "/api/stream"
+            if push_.port is not None:
+                stream_url = push_url("/api/stream")
+            return render_template("dashboard.html", stream_url=stream_url)
+
+    def push_url(path):
+        """``path`` on the push server, as reached by this request's client."""
+        base = current_app.config["PUSH_URL"]
+        if base is None:
+            # same host the client used for us, on the push server's port
+            host = re.sub(r":\d+$", "", request.host)
+            base = f"{request.scheme}://{host}:{push_.port}"
+        return base.rstrip("/") + path
+
+    def ingest_report():
+        """Validate, publish and record one mole report; replies with report-rate hints."""
+        try:
+            with metrics.INGEST_STAGE_SECONDS.time(stage="parse"):
                 json_back = request.json
-            except BadRequest as ex:
-                print(f"Bad request: {ex}")
-                abort(400, "no json posted")
-            else:
-                schema = get_machine_post_schema()
-                try:
-                    jsonschema.validate(json_back, schema)
-                except jsonschema.ValidationError as ex:
-                    print(f"Schema validation error: {ex}")
-                    abort(400, "schema validation error")
-
-            if json_back["auth_code"] != current_app.config["PASSCODE"]:
-                abort(400, "invalid auth code")
-            json_back.pop("auth_code")
-
-            json_back["received_timestamp"] = time.time()
-            stored_results_[json_back["hostname"]] = json_back
-
+        except BadRequest as ex:
+            print(f"Bad request: {ex}")
+            metrics.INGEST_REJECTED.inc(reason="bad_json")
+            abort(400, "no json posted")
+        else:
+            validator = get_machine_post_validator()
             try:
-                history.record_snapshot(json_back["hostname"], json_back)
-            except Exception as e:
-                print(f"History recording error: {e}")
+                with metrics.INGEST_STAGE_SECONDS.time(stage="validate"):
+                    validator.validate(json_back)
+            except jsonschema.ValidationError as ex:
+                print(f"Schema validation error: {ex}")
+                metrics.INGEST_REJECTED.inc(reason="schema")
+                abort(400, "schema validation error")
+
+        if json_back["auth_code"] != current_app.config["PASSCODE"]:
+            metrics.INGEST_REJECTED.inc(reason="auth")
+            abort(400, "invalid auth code")
+        json_back.pop("auth_code")
+
+        json_back["received_timestamp"] = time.time()
+        previous = stored_results_.snapshot().hosts.get(json_back["hostname"])
+        with metrics.INGEST_STAGE_SECONDS.time(stage="publish"):
+            state = HostState(json_back)
+            version = stored_results_.publish(state)
+            response_cache_.bump()
+            push_.notify(version, stored_results_.snapshot().free_version)
+        with metrics.INGEST_STAGE_SECONDS.time(stage="idle"):
+            idle_tracker_.update(state)
+        metrics.INGEST_REPORTS.inc(hostname=state.hostname)
+
+        try:
+            with metrics.INGEST_STAGE_SECONDS.time(stage="history"):
+                history.record_snapshot(state)
+        except Exception as e:
+            print(f"History recording error: {e}")
+            metrics.HISTORY_ERRORS.inc()
+
+        try:
+            with metrics.INGEST_STAGE_SECONDS.time(stage="usage"):
+                usage.record_usage(
+                    previous, state, current_app.config["USAGE_MAX_GAP_SECS"]
+                )
+        except Exception as e:
+            print(f"Usage accounting error: {e}")
+            metrics.HISTORY_ERRORS.inc()
 
-            return jsonify({"success": True, "msg": "stored result"})
+        hints = pacer_.hints(
+            time.time(), push_.num_clients, len(stored_results_.snapshot().hosts)
+        )
+        status_tracker_.update(state, hints["next_report_secs"] + hints["backoff_secs"])
 
-        else:
-            # Serve the single-page dashboard
-            return render_template("dashboard.html")
+        out = {"success": True, "msg": "stored result"}
+        out.update(hints)
+        return jsonify(out)
 
     @app.route("/data-out/gpu-data-simple")
     def gpu_data_simple():
         """
         Legacy API endpoint for GPU data.
         Kept for backwards compatibility with existing integrations.
+
+        The GPU data is serialized once per ingest (see HostState); only the
+        age fields are filled in per request.
         """
-        out = {}
-        for name, results in sorted(stored_results_.items(), key=lambda x: x[0]):
-            out[name] = copy.deepcopy(results.get("gpu", {}))
-            for gpu_name, gpu_res in out[name].items():
-                gpu_res["received_timestamp"] = (
-                    time.time() - results["received_timestamp"]
-                )
-                gpu_res["time_received_mins"] = round(
-                    gpu_res["received_timestamp"] / 60
-                )
-        return jsonify(out)
+        current_time = time.time()
+        body = b"{" + b", ".join(
+            json.dumps(name).encode() + b": " + state.legacy_gpu_json(current_time)
+            for name, state in stored_results_.snapshot().sorted_hosts
+        ) + b"}"
+        return Response(body, mimetype="application/json")
 
     @app.route("/api/gpu-summary")
     def gpu_summary():
@@ -133,43 +429,20 @@ def create_app(test_config=None):
         CLI-friendly text summary with ANSI color codes.
         Useful for quick terminal checks: curl http://server:8080/api/gpu-summary
         """
-        servers = []
+        return cached_response("gpu-summary", build_gpu_summary, "text/plain")
 
-        for name, results in sorted(stored_results_.items(), key=lambda x: x[0]):
-            time_diff_mins = round((time.time() - results["received_timestamp"]) / 60)
-            status = "online" if time_diff_mins <= 10 else "offline"
-
-            gpu_data = results.get("gpu", {})
-            total_gpus = len(gpu_data)
-
-            gpu_memory_percentages = []
-            for gpu_info in gpu_data.values():
-                total_mem = gpu_info.get("total_mem", 0)
-                used_mem = gpu_info.get("used_mem", 0)
-                memory_percent = (used_mem / total_mem) * 100 if total_mem > 0 else 0
-                gpu_memory_percentages.append(memory_percent)
-
-            gpu_utils = [
-                gpu_info.get("gpu_util", 0) for gpu_info in gpu_data.values()
-            ]
-            free_gpus = sum(
-                1 for mem_pct, util_pct in zip(gpu_memory_percentages, gpu_utils)
-                if mem_pct < 30 and util_pct < 30
-            )
-            avg_gpu_usage = (
-                round(sum(gpu_memory_percentages) / len(gpu_memory_percentages))
-                if gpu_memory_percentages
-                else 0
-            )
-            cpu_usage = round(results.get("cpu", {}).get("cpu_percent", 0))
+    def build_gpu_summary():
+        current_time = time.time()
+        servers = []
 
+        for name, state in stored_results_.snapshot().sorted_hosts:
             servers.append({
                 "name": name,
-                "total_gpus": total_gpus,
-                "free_gpus": free_gpus,
-                "avg_gpu_usage": avg_gpu_usage,
-                "cpu_usage": cpu_usage,
-                "status": status,
+                "total_gpus": state.total_gpus,
+                "free_gpus": state.free_gpus,
+                "avg_gpu_usage": round(state.avg_gpu_memory_percent),
+                "cpu_usage": round(state.cpu_percent),
+                "status": status_tracker_.status(state, current_time),
             })
 
         # ANSI color codes for terminal output
@@ -199,7 +472,94 @@ def create_app(test_config=None):
                 f"{status_color}{server['status']}{RESET}"
             )
 
-        return "\n".join(lines), 200, {"Content-Type": "text/plain"}
+        return "\n".join(lines)
+
+    @app.route("/api/free-gpus")
+    def free_gpu_finder():
+        """
+        Free GPUs for job launchers, answered from the free-GPU index.
+
+        Filters: ``min_free_mem_mb`` (free memory per GPU), ``model``
+        (substring of the GPU name, e.g. ``3090``), ``count`` (only hosts with
+        at least this many matching GPUs) and ``max_age_secs`` (only hosts
+        that reported this recently; defaults to the online threshold).
+        """
+        snapshot = stored_results_.snapshot()
+        now = time.time()
+        matches = free_gpus.find_free_gpus(
+            snapshot, now, **free_gpus.filters_from_args(request.args)
+        )
+        out = free_gpus.payload(snapshot, now, matches)
+        return Response(json.dumps(out, separators=(",", ":")), mimetype="application/json")
+
+    @app.route("/api/wait-for-gpus")
+    def wait_for_gpus():
+        """
+        Long-poll version of /api/free-gpus: takes the same filters plus
+        ``timeout`` (seconds, capped at WAIT_MAX_SECS) and answers as soon as
+        some GPUs match, or with ``"matched": false`` once the timeout runs
+        out. Waits are served by the push server (see stream.py) so they
+        don't hold waitress threads; this only redirects there, or answers
+        503 if it isn't running.
+        """
+        if push_.port is None:
+            abort(503, "waiting is not available; poll /api/free-gpus instead")
+        # someone wants fresh data, so ask moles to report more often
+        pacer_.viewer_seen(time.time())
+        return redirect(push_url(request.full_path.rstrip("?")), code=307)
+
+    @app.route("/api/idle-allocations")
+    def idle_allocations():
+        """
+        Processes holding GPU memory on an otherwise idle GPU for at least
+        ``min_idle_secs`` (default IDLE_ALLOC_SECS), longest idle first;
+        optionally for one ``hostname``.
+        """
+        stored_results_.snapshot()
+        now = time.time()
+        flagged = idle_tracker_.flagged(
+            now,
+            min_idle_secs=request.args.get("min_idle_secs", type=float),
+            hostname=request.args.get("hostname"),
+        )
+        return jsonify({
+            "timestamp": now,
+            "threshold_secs": idle_tracker_.threshold_secs,
+            "total_mem_mb": round(sum(a.mem_mb for _h, _t, a in flagged)),
+            "allocations": [
+                {
+                    "hostname": hostname,
+                    "gpu_index": allocation.gpu_index,
+                    "gpu_uuid": allocation.gpu_uuid,
+                    "gpu_name": allocation.gpu_name,
+                    "pid": allocation.pid,
+                    "username": allocation.username,
+                    "process_name": allocation.process_name,
+                    "mem_mb": round(allocation.mem_mb),
+                    "idle_since": allocation.idle_since,
+                    "idle_secs": round(last_seen - allocation.idle_since),
+                    "last_seen_secs": round(now - last_seen),
+                }
+                for hostname, last_seen, allocation in flagged
+            ],
+        })
+
+    @app.route("/api/events")
+    def host_status_events():
+        """
+        Hosts going offline and back online between Unix timestamps
+        ``start`` and ``end`` (default: the last ``hours``, 24), oldest first,
+        with each host's time online and offline and its number of outages
+        over the window; optionally for one ``hostname``.
+        """
+        hours = request.args.get("hours", 24, type=float)
+        end = request.args.get("end", time.time(), type=float)
+        start = request.args.get("start", end - hours * 3600, type=float)
+        if end <= start:
+            abort(400, "end must be after start")
+        out = host_events.query_events(start, end, hostname=request.args.get("hostname"))
+        out["generated_at"] = time.time()
+        return jsonify(out)
 
     @app.route("/api/dashboard-data")
     def dashboard_data():
@@ -208,91 +568,64 @@ def create_app(test_config=None):
 
         Returns all server data in a structured format optimized for
         frontend rendering with summary cards and GPU detail panels.
+
+        With ``?since=<version>`` (the ``version`` of a previous response)
+        only hosts that reported after that version are sent in full, along
+        with every host's status so the client can spot removals and hosts
+        going offline.
+        """
+        since = request.args.get("since", 0, type=int)
+        # someone is looking, so ask moles to report more often
+        pacer_.viewer_seen(time.time())
+        name, build = dashboard_data_builder(since)
+        return cached_response(name, build, "application/json")
+
+    def dashboard_data_builder(since):
+        """Cache name and builder for a full or delta dashboard payload."""
+        if since <= 0 or since > stored_results_.snapshot().version:
+            # no baseline, or one from before a server restart
+            return "dashboard-data", lambda: build_dashboard_data(None)
+        return (
+            f"dashboard-data-since{since}",
+            lambda: build_dashboard_data(since),
+        )
+
+    @app.route("/api/stream")
+    def dashboard_stream():
+        """
+        Server-Sent Events stream of dashboard updates, served by the push
+        server (see stream.py) so open streams don't hold waitress threads;
+        this only redirects there, or answers 503 if it isn't running.
         """
+        if push_.port is None:
+            abort(503, "live updates are not running; poll /api/dashboard-data instead")
+        return redirect(push_url(request.full_path.rstrip("?")), code=307)
+
+    def build_dashboard_data(since):
         current_time = time.time()
+        snapshot = stored_results_.snapshot()
         servers = {}
-
-        for hostname, results in sorted(stored_results_.items(), key=lambda x: x[0]):
-            # Calculate time since last update
-            time_diff = current_time - results.get("received_timestamp", current_time)
-            last_seen_mins = round(time_diff / 60)
-
-            # Server is "offline" if no update in 10+ minutes
-            status = "online" if last_seen_mins <= 10 else "offline"
-
-            # CPU data
-            cpu_data = results.get("cpu", {})
-            cpu_info = {
-                "cpu_percent": round(cpu_data.get("cpu_percent", 0)),
-                "num_cpus": cpu_data.get("num_cpus", 0)
-            }
-
-            # GPU data - transform from dict to sorted list
-            gpu_dict = results.get("gpu", {})
-            gpus = []
-            memory_percentages = []
-            gpu_error = None
-
-            for gpu_key, gpu_info in gpu_dict.items():
-                # Check if this entry is an error report
-                if gpu_info.get("error") or gpu_info.get("name") == "error":
-                    gpu_error = gpu_info.get("error", "Unknown GPU error")
-                    continue
-
-                total_mem = gpu_info.get("total_mem", 0)
-                used_mem = gpu_info.get("used_mem", 0)
-                memory_percent = round((used_mem / total_mem) * 100) if total_mem > 0 else 0
-                memory_percentages.append(memory_percent)
-
-                gpus.append({
-                    "index": gpu_info.get("index", 0),
-                    "name": gpu_info.get("name", "Unknown GPU"),
-                    "total_mem_mb": round(total_mem),
-                    "used_mem_mb": round(used_mem),
-                    "memory_percent": memory_percent,
-                    "gpu_util": gpu_info.get("gpu_util", 0),
-                    "users": gpu_info.get("users", {})
-                })
-
-            # Sort GPUs by index
-            gpus.sort(key=lambda x: x["index"])
-
-            # Summary calculations
-            total_gpus = len(gpus)
-            free_gpus = sum(
-                1 for gpu in gpus if gpu["memory_percent"] < 30 and gpu["gpu_util"] < 30
-            )
-            avg_memory_percent = (
-                round(sum(memory_percentages) / len(memory_percentages))
-                if memory_percentages else 0
-            )
-            gpu_utils = [gpu["gpu_util"] for gpu in gpus]
-            avg_gpu_util = (
-                round(sum(gpu_utils) / len(gpu_utils))
-                if gpu_utils else 0
-            )
-
-            server_data = {
-                "status": status,
-                "last_seen_mins": last_seen_mins,
-                "cpu": cpu_info,
-                "gpus": gpus,
-                "summary": {
-                    "total_gpus": total_gpus,
-                    "free_gpus": free_gpus,
-                    "avg_gpu_memory_percent": avg_memory_percent,
-                    "avg_gpu_util": avg_gpu_util
+        statuses = {}
+
+        for hostname, state in snapshot.sorted_hosts:
+            status = status_tracker_.status(state, current_time)
+            if since is None or snapshot.host_versions[hostname] > since:
+                servers[hostname] = state.dashboard_entry(current_time, status)
+            if since is not None:
+                statuses[hostname] = {
+                    "status": status,
+                    "last_seen_mins": state.last_seen_mins(current_time),
                 }
-            }
-            if gpu_error:
-                server_data["gpu_error"] = gpu_error
 
-            servers[hostname] = server_data
-
-        return jsonify({
+        out = {
             "timestamp": current_time,
-            "servers": servers
-        })
+            "version": snapshot.version,
+            "full": since is None,
+            "servers": servers,
+        }
+        if since is not None:
+            out["statuses"] = statuses
+        return current_app.json.dumps(out)
 
     @app.route("/history")
     def history_page():
@@ -301,17 +634,254 @@ def create_app(test_config=None):
 
     @app.route("/api/history-data")
     def history_data():
-        """JSON API for historical GPU usage time-series."""
+        """
+        JSON API for historical GPU usage time-series.
+
+        Covers the last ``hours``, or Unix timestamps ``start`` to ``end``
+        (default now). ``max_points`` bounds the number of points, keeping
+        spikes and dips through LTTB downsampling; it defaults to
+        HISTORY_MAX_POINTS for ``start``/``end`` ranges, and can't exceed it.
+
+        ``format=columns`` returns the series as parallel arrays (see
+        ``history.query_cluster_history_columns``) instead of one object per
+        time bucket, which is much smaller and quicker to build and parse
+        over long ranges.
+        """
         hours = request.args.get("hours", 24, type=int)
+        start = request.args.get("start", type=float)
+        end = request.args.get("end", type=float) if start is not None else None
+        max_points = request.args.get("max_points", type=int)
+        limit = current_app.config["HISTORY_MAX_POINTS"]
+        if max_points is not None:
+            max_points = max(10, min(max_points, limit))
+        elif start is not None:
+            max_points = limit
+        window = dict(hours=hours, start=start, end=end)
+
+        if request.args.get("format") == "columns":
+            out = {
+                "hours": hours,
+                "start": start,
+                "end": end,
+                "max_points": max_points,
+                "format": "columns",
+                "series": history.query_cluster_history_columns(**window, max_points=max_points),
+                "stats": history.query_waste_stats(**window),
+                "generated_at": time.time(),
+            }
+            return Response(json.dumps(out, separators=(",", ":")), mimetype="application/json")
 
-        series = history.query_cluster_history(hours=hours)
-        stats = history.query_waste_stats(hours=hours)
+        series = history.query_cluster_history(**window, max_points=max_points)
+        stats = history.query_waste_stats(**window)
 
         return jsonify({
             "hours": hours,
+            "start": start,
+            "end": end,
+            "max_points": max_points,
             "series": series,
             "stats": stats,
             "generated_at": time.time(),
         })
 
+    @app.route("/api/gpu-history")
+    def gpu_history_data():
+        """JSON API for per-GPU series and per-user usage, optionally for one host."""
+        hours = request.args.get("hours", 24, type=int)
+        hostname = request.args.get("hostname")
+
+        return jsonify({
+            "hours": hours,
+            "gpus": history.query_gpu_history(hours=hours, hostname=hostname),
+            "users": history.query_user_usage(hours=hours, hostname=hostname),
+            "generated_at": time.time(),
+        })
+
+    @app.route("/api/usage-by-user")
+    def usage_by_user():
+        """
+        Per-user GPU-hours and GPU-memory GB-hours over the last ``days``
+        days, or whole days between Unix timestamps ``start`` and ``end``;
+        optionally for one ``hostname`` and with ``by_day=1`` for a
+        per-day breakdown.
+        """
+        days = request.args.get("days", 30, type=float)
+        end = request.args.get("end", time.time(), type=float)
+        start = request.args.get("start", end - days * 86400, type=float)
+        out = usage.query_usage_by_user(
+            start,
+            end,
+            hostname=request.args.get("hostname"),
+            by_day=request.args.get("by_day", 0, type=int) == 1,
+        )
+        out["generated_at"] = time.time()
+        return jsonify(out)
+
+    @app.route("/api/history/export")
+    def history_export():
+        """
+        Stream host summaries (``kind=hosts``) or per-GPU samples
+        (``kind=gpus``) as ``format=csv`` or ``ndjson``.
+
+        ``start``/``end`` are Unix timestamps (default: everything up to now)
+        and ``hostname`` may be repeated to pick hosts. Rows are written as
+        they come off the database, so the first bytes go out straight away.
+        """
+        kind = request.args.get("kind", "hosts")
+        fmt = request.args.get("format", "csv")
+        start = request.args.get("start", 0, type=float)
+        end = request.args.get("end", time.time(), type=float)
+        hostnames = request.args.getlist("hostname")
+        if kind not in history.EXPORT_COLUMNS:
+            abort(400, f"kind must be one of {', '.join(history.EXPORT_COLUMNS)}")
+        if fmt not in ("csv", "ndjson"):
+            abort(400, "format must be csv or ndjson")
+
+        columns = history.EXPORT_COLUMNS[kind]
+        batches = history.iter_export_rows(kind, start, end, hostnames)
+
+        def csv_chunks():
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(columns)
+            for rows in batches:
+                writer.writerows(rows)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            # the header on its own when there are no rows
+            if buffer.tell():
+                yield buffer.getvalue()
+
+        def ndjson_chunks():
+            for rows in batches:
+                yield "".join(
+                    json.dumps(dict(zip(columns, row))) + "\n" for row in rows
+                )
+
+        if fmt == "csv":
+            body, mimetype = csv_chunks(), "text/csv"
+        else:
+            body, mimetype = ndjson_chunks(), "application/x-ndjson"
+        return Response(
+            body,
+            mimetype=mimetype,
+            headers={
+                "Content-Disposition": f"attachment; filename=gpu-history-{kind}.{fmt}",
+            },
+        )
+
+    @app.route("/api/history/<hostname>")
+    def host_history(hostname):
+        """
+        One host's history between Unix timestamps ``start`` and ``end``
+        (default: the last ``hours``, 24), averaged into ``bucket_secs``
+        buckets (one of ``history.RANGE_BUCKET_SIZES``; by default the finest
+        giving at most HISTORY_MAX_POINTS of them). A host called ``export``
+        is shadowed by /api/history/export.
+        """
+        max_points = current_app.config["HISTORY_MAX_POINTS"]
+        hours = request.args.get("hours", 24, type=float)
+        end = request.args.get("end", time.time(), type=float)
+        start = request.args.get("start", end - hours * 3600, type=float)
+        if end <= start:
+            abort(400, "end must be after start")
+
+        bucket_secs = request.args.get("bucket_secs", type=int)
+        if bucket_secs is None:
+            bucket_secs = history.bucket_size_for_range(end - start, max_points)
+        elif bucket_secs not in history.RANGE_BUCKET_SIZES:
+            sizes = ", ".join(str(size) for size in history.RANGE_BUCKET_SIZES)
+            abort(400, f"bucket_secs must be one of {sizes}")
+        elif (end - start) / bucket_secs > max_points:
+            abort(400, f"more than {max_points} buckets; use larger bucket_secs")
+
+        out = history.query_host_history(hostname, start, end, bucket_secs)
+        out["generated_at"] = time.time()
+        return Response(json.dumps(out, separators=(",", ":")), mimetype="application/json")
+
+    @app.route("/metrics")
+    def metrics_endpoint():
+        """Prometheus metrics; state and DB-size gauges are read at scrape time."""
+        snapshot = stored_results_.snapshot()
+        metrics.STATE_HOSTS.set(len(snapshot.hosts))
+        metrics.STATE_GPUS.set(sum(state.total_gpus for state in snapshot.hosts.values()))
+        metrics.STATE_REPORT_BYTES.set(
+            sum(state.gpu_json_bytes for state in snapshot.hosts.values())
+        )
+        metrics.STATE_VERSION.set(snapshot.version)
+        metrics.RESPONSE_CACHE_ENTRIES.set(len(response_cache_))
+        metrics.IDLE_ALLOCATIONS_TRACKED.set(len(idle_tracker_))
+        host_counts = status_tracker_.counts()
+        for status in (host_events.ONLINE, host_events.OFFLINE):
+            metrics.HOSTS_BY_STATUS.set(host_counts[status], status=status)
+        interval, pressure = pacer_.interval(
+            time.time(), push_.num_clients, len(snapshot.hosts)
+        )
+        metrics.REPORT_INTERVAL_HINT_SECS.set(interval)
+        metrics.INGEST_PRESSURE.set(pressure)
+
+        db_paths = {"history": history.db_file_paths()}
+        if isinstance(stored_results_, state_store.DurableStateStore):
+            db_paths["latest_state"] = [stored_results_.db_path]
+        for db, paths in db_paths.items():
+            size = sum(
+                osp.getsize(p)
+                for db_path in paths
+                for p in (db_path, db_path + "-wal")
+                if osp.exists(p)
+            )
+            metrics.DB_SIZE_BYTES.set(size, db=db)
+
+        return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+    @app.route("/api/admin/retention", methods=("GET", "POST"))
+    def admin_retention():
+        """
+        History retention status; POST runs a compaction pass first, or with
+        ``vacuum=1`` switches history files from before incremental
+        auto-vacuum over with a full VACUUM (which blocks ingest while it runs).
+        """
+        require_admin()
+        out = {}
+        if request.method == "POST":
+            if request.args.get("vacuum", 0, type=int):
+                out["vacuumed"] = retention.vacuum()
+            else:
+                retention.run_compaction()
+        out.update(retention.retention_status())
+        return jsonify(out)
+
+    @app.route("/api/admin/profile", methods=("GET", "POST", "DELETE"))
+    def admin_profile():
+        """
+        Profiler status and the captures written so far. A POST starts a
+        capture in the background (``mode=sample`` for collapsed stacks of
+        every thread, or ``cprofile`` for pstats of the request handlers) for
+        ``secs`` seconds, at most PROFILE_MAX_SECS; a DELETE ends it early.
+        """
+        require_admin()
+        if request.method == "POST":
+            try:
+                name = profiler_.start(
+                    request.args.get("mode", "sample"),
+                    request.args.get("secs", 30, type=float),
+                )
+            except ValueError as ex:
+                abort(400, str(ex))
+            except RuntimeError as ex:
+                abort(409, str(ex))
+            return jsonify({"file": name, **profiler_.status()}), 202
+        if request.method == "DELETE":
+            profiler_.stop()
+        return jsonify(profiler_.status())
+
+    @app.route("/api/admin/profile/<name>")
+    def admin_profile_file(name):
+        """Download a capture listed by /api/admin/profile."""
+        require_admin()
+        if name not in profiler_.files():
+            abort(404)
+        return send_from_directory(profiler_.out_dir, name, as_attachment=True)
+
     return app
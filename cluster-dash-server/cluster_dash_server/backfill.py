@@ -0,0 +1,417 @@
+"""Bulk-load old reports into the history database.
+
+For filling in history the server never saw, e.g. after an outage or when a
+new history feature wants older data. Reads
+
+- mole reports as ``.json`` files (one report, or a list of them, in the
+  ``etc/example_data*.json`` format) or ``.ndjson``/``.jsonl`` dumps with one
+  report per line, any of them optionally gzipped;
+- ``.csv`` downloads of the sheets ``GoogleSheetSender`` writes. These carry
+  no GPU memory or identity, so they only give host summaries, with memory
+  use recorded as 0 and free GPUs judged on utilisation alone.
+
+Reports are validated against the ingest schema and summarised as on
+ingest, keeping at most one per host per
+``history.SNAPSHOT_MIN_INTERVAL_SECS``, and turned into rows by the same
+``history.snapshot_rows`` that ``history.record_snapshot`` uses; parsing,
+validating and summarising run in worker processes a batch at a time, and a
+single writer inserts each batch with ``history.write_rows`` in one
+transaction. Snapshots already stored with
+the same host and timestamp are not duplicated, so a load can be repeated.
+
+Usage (from cluster-dash-server/):
+
+    python -m cluster_dash_server.backfill etc/example_data1.json dumps/*.ndjson.gz
+    python -m cluster_dash_server.backfill --rebuild-indexes big-dump.ndjson
+    python -m cluster_dash_server.backfill --hostname molgpu02 molgpu02.csv
+"""
+
+import argparse
+import collections
+import csv
+import datetime
+import gzip
+import json
+import os
+import sqlite3
+import time
+from concurrent import futures
+
+import jsonschema
+from flask import Flask
+
+from . import get_machine_post_validator
+from . import history
+from .host_state import parse_gpus, summarize_gpus
+
+# what the history writer needs of a report, small enough to send back from
+# the worker processes; field names match HostState and GpuState
+Summary = collections.namedtuple("Summary", (
+    "timestamp", "hostname", "total_gpus", "free_gpus",
+    "avg_gpu_memory_percent", "avg_gpu_util", "cpu_percent", "gpus",
+))
+GpuSample = collections.namedtuple("GpuSample", (
+    "uuid", "index", "name", "total_mem_mb", "used_mem_mb", "gpu_util",
+    "memory_util", "users",
+))
+
+# tables the loader writes, whose secondary indexes --rebuild-indexes drops
+_LOADED_TABLES = ("gpu_snapshots", "gpu_samples", "gpu_user_samples")
+
+_MAX_ERRORS_SHOWN = 5
+
+
+class Batch:
+    """One worker's output: summaries oldest first, and what it turned down."""
+    def __init__(self):
+        self.summaries = []
+        self.read = 0
+        self.throttled = 0
+        self.rejected = 0
+        self.errors = []
+
+    def reject(self, source, error):
+        self.rejected += 1
+        if len(self.errors) < _MAX_ERRORS_SHOWN:
+            self.errors.append(f"{source}: {error}")
+
+
+def _open_text(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+
+def _base_name(path):
+    return os.path.basename(path[:-len(".gz")] if path.endswith(".gz") else path)
+
+
+def input_kind(path):
+    """``"json"``, ``"ndjson"`` or ``"sheets"`` by file extension, else None."""
+    name = _base_name(path)
+    if name.endswith(".json"):
+        return "json"
+    if name.endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    if name.endswith(".csv"):
+        return "sheets"
+    return None
+
+
+def iter_work(paths, batch_size, hostname=None):
+    """
+    Split ``paths`` into units of work for ``summarize_work``: whole
+    ``.json`` files, and runs of at most ``batch_size`` lines of the rest.
+    """
+    for path in paths:
+        kind = input_kind(path)
+        if kind is None:
+            raise ValueError(f"don't know how to read {path}")
+        if kind == "json":
+            yield (kind, path, None)
+            continue
+        source_host = None
+        if kind == "sheets":
+            # sheets downloads are named "<spreadsheet> - <worksheet>.csv",
+            # and the worksheet is named after the host by default
+            source_host = hostname or _base_name(path)[:-len(".csv")].rsplit(" - ", 1)[-1]
+
+        with _open_text(path) as f:
+            lines = []
+            for line in f:
+                lines.append(line)
+                if len(lines) >= batch_size:
+                    yield (kind, path, source_host, lines)
+                    lines = []
+            if lines:
+                yield (kind, path, source_host, lines)
+
+
+def summarize_work(work, validate=True):
+    """Parse, validate and summarise one unit of ``iter_work``; returns a ``Batch``."""
+    kind, path = work[0], work[1]
+    batch = Batch()
+    if kind == "sheets":
+        reports = _sheets_reports(batch, path, work[2], work[3])
+    elif kind == "ndjson":
+        reports = _ndjson_reports(batch, path, work[3])
+    else:
+        reports = _json_reports(batch, path)
+
+    validator = get_machine_post_validator() if validate else None
+    last_times = {}
+    for source, report, is_report in reports:
+        batch.read += 1
+        try:
+            hostname = report["hostname"]
+            timestamp = report.get("received_timestamp") or report["timestamp"]
+            # throttle before validating: a dump of every report a mole made
+            # keeps only one in every few hundred
+            if timestamp - last_times.get(hostname, 0) < history.SNAPSHOT_MIN_INTERVAL_SECS:
+                batch.throttled += 1
+                continue
+            if validator is not None and is_report:
+                validator.validate(report)
+            gpus, _gpu_error = parse_gpus(hostname, report["gpu"])
+            summary = Summary(
+                timestamp, hostname, *summarize_gpus(gpus),
+                report["cpu"].get("cpu_percent", 0),
+                tuple(
+                    GpuSample(
+                        gpu.uuid, gpu.index, gpu.name, gpu.total_mem_mb,
+                        gpu.used_mem_mb, gpu.gpu_util, gpu.memory_util, gpu.users,
+                    )
+                    for gpu in gpus
+                ) if is_report else (),
+            )
+        except (jsonschema.ValidationError, KeyError, TypeError, AttributeError) as ex:
+            batch.reject(source, getattr(ex, "message", repr(ex)))
+            continue
+        # like record_snapshot, reports without GPUs aren't recorded
+        if not summary.total_gpus:
+            continue
+        last_times[hostname] = timestamp
+        batch.summaries.append(summary)
+
+    batch.summaries.sort(key=lambda summary: summary.timestamp)
+    return batch
+
+
+def _json_reports(batch, path):
+    try:
+        with _open_text(path) as f:
+            data = json.load(f)
+    except (OSError, ValueError) as ex:
+        batch.read += 1
+        batch.reject(path, ex)
+        return
+    for i, report in enumerate(data if isinstance(data, list) else [data]):
+        yield f"{path}[{i}]", report, True
+
+
+def _ndjson_reports(batch, path, lines):
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            report = json.loads(line)
+        except ValueError as ex:
+            batch.read += 1
+            batch.reject(path, ex)
+            continue
+        yield path, report, True
+
+
+def _sheets_reports(batch, path, hostname, lines):
+    """
+    Reports rebuilt from GoogleSheetSender rows: the mole's local time (ISO),
+    memory used and total (GB), CPU %, 15-minute load average, then GPU and
+    memory-bandwidth utilisation for each GPU in turn.
+    """
+    for row in csv.reader(lines):
+        if not row:
+            continue
+        try:
+            timestamp = datetime.datetime.fromisoformat(row[0]).timestamp()
+            gpu_values = [float(value) for value in row[5:] if value != ""]
+            report = {
+                "hostname": hostname,
+                "timestamp": timestamp,
+                "cpu": {"cpu_percent": float(row[3])},
+                "gpu": {
+                    str(i): {
+                        "index": i,
+                        "gpu_util": gpu_values[2 * i],
+                        "memory_util": gpu_values[2 * i + 1],
+                    }
+                    for i in range(len(gpu_values) // 2)
+                },
+            }
+        except (ValueError, IndexError) as ex:
+            # e.g. a header row someone added
+            batch.read += 1
+            batch.reject(path, ex)
+            continue
+        yield path, report, False
+
+
+class Loader:
+    """Writes summaries into the partitions; the single writer of a backfill."""
+    def __init__(self, rebuild_indexes=False):
+        self.rebuild_indexes = rebuild_indexes
+        self.rows = 0
+        self.throttled = 0
+        self.duplicates = 0
+        # partition -> [oldest, newest] timestamp loaded into it
+        self.loaded = {}
+        self._last_times = {}
+
+    def load(self, summaries):
+        """
+        Insert one batch's summaries in one transaction, throttled against the
+        batches before it.
+        """
+        rows = collections.defaultdict(list)
+        for summary in summaries:
+            last_time = self._last_times.get(summary.hostname, 0)
+            if abs(summary.timestamp - last_time) < history.SNAPSHOT_MIN_INTERVAL_SECS:
+                self.throttled += 1
+                continue
+            self._last_times[summary.hostname] = summary.timestamp
+
+            name = history.partition_name(summary.timestamp)
+            if name not in self.loaded:
+                self._prepare(name)
+            span = self.loaded[name]
+            span[0] = min(span[0], summary.timestamp)
+            span[1] = max(span[1], summary.timestamp)
+            for table, table_rows in history.snapshot_rows(summary.timestamp, summary).items():
+                rows[table] += table_rows
+
+        history.write_rows(rows)
+        self.rows += sum(len(table_rows) for table_rows in rows.values())
+
+    def _prepare(self, name):
+        self.loaded[name] = [float("inf"), float("-inf")]
+        history.ensure_partition(name)
+        if not self.rebuild_indexes:
+            return
+        conn = sqlite3.connect(history.partition_path(name))
+        try:
+            indexes = [
+                row[0] for row in conn.execute(
+                    f"""SELECT name FROM sqlite_master
+                        WHERE type = 'index' AND sql IS NOT NULL
+                          AND tbl_name IN ({', '.join('?' * len(_LOADED_TABLES))})""",
+                    _LOADED_TABLES,
+                )
+            ]
+            for index in indexes:
+                conn.execute(f"DROP INDEX {index}")
+        finally:
+            conn.close()
+
+    def finish(self):
+        """
+        Rebuild dropped indexes, drop duplicate snapshots from a repeated load
+        and forget cached history buckets over the loaded ranges.
+        """
+        for name, (oldest, newest) in sorted(self.loaded.items()):
+            conn = sqlite3.connect(history.partition_path(name))
+            try:
+                if self.rebuild_indexes:
+                    started = time.perf_counter()
+                    # recreates exactly the indexes a partition is made with
+                    history.ensure_partition(name, refresh=True)
+                    print(f"  {name}: rebuilt indexes in {time.perf_counter() - started:.1f} s")
+                if oldest > newest:
+                    continue
+                with conn:
+                    self.duplicates += conn.execute(
+                        """DELETE FROM gpu_snapshots
+                           WHERE timestamp >= ? AND timestamp <= ?
+                             AND id NOT IN (
+                               SELECT MIN(id) FROM gpu_snapshots
+                               WHERE timestamp >= ? AND timestamp <= ?
+                               GROUP BY hostname, timestamp)""",
+                        (oldest, newest, oldest, newest),
+                    ).rowcount
+            finally:
+                conn.close()
+            history.invalidate_cached_buckets(oldest, newest + 1)
+
+
+def run(paths, batch_size=2000, workers=1, validate=True, rebuild_indexes=False,
+        hostname=None):
+    """Load ``paths`` into the history set up by ``history.init_db``; returns the totals."""
+    loader = Loader(rebuild_indexes=rebuild_indexes)
+    totals = collections.Counter()
+    errors = []
+
+    def take(batch):
+        totals.update(
+            read=batch.read, throttled=batch.throttled, rejected=batch.rejected,
+        )
+        errors.extend(batch.errors[:_MAX_ERRORS_SHOWN - len(errors)])
+        loader.load(batch.summaries)
+
+    work = iter_work(paths, batch_size, hostname)
+    if workers <= 1:
+        for item in work:
+            take(summarize_work(item, validate))
+    else:
+        # a few batches in flight per worker, taken in input order so the
+        # per-host throttle sees each host's reports in the order they came
+        pending = collections.deque()
+        with futures.ProcessPoolExecutor(workers) as pool:
+            for item in work:
+                pending.append(pool.submit(summarize_work, item, validate))
+                if len(pending) >= 2 * workers:
+                    take(pending.popleft().result())
+            while pending:
+                take(pending.popleft().result())
+
+    loader.finish()
+    totals.update(
+        rows=loader.rows, throttled=loader.throttled, duplicates=loader.duplicates,
+    )
+    for error in errors:
+        print(f"  rejected {error}")
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("paths", nargs="+", metavar="FILE")
+    parser.add_argument("--instance-path",
+                        help="the server's instance folder (default: the server's default)")
+    parser.add_argument("--hostname",
+                        help="host of .csv sheets downloads (default: the worksheet name)")
+    parser.add_argument("--batch-size", type=int, default=2000,
+                        help="lines of input per batch and transaction")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 1) - 1),
+                        help="processes parsing and validating reports")
+    parser.add_argument("--no-validate", action="store_true",
+                        help="skip schema validation of trusted dumps")
+    parser.add_argument("--rebuild-indexes", action="store_true",
+                        help="drop the loaded tables' indexes during the load and rebuild "
+                             "them afterwards; faster for very large loads, but stop the "
+                             "server first")
+    args = parser.parse_args()
+    for path in args.paths:
+        if input_kind(path) is None:
+            parser.error(f"{path}: expected .json, .ndjson, .jsonl or .csv, optionally .gz")
+
+    app = Flask("cluster_dash_server", instance_path=args.instance_path)
+    cache_path = os.path.join(app.instance_path, "history_cache.db")
+    # set up just enough to invalidate a persistent history cache
+    app.config.from_mapping(
+        HISTORY_CACHE_MAX_BUCKETS=1,
+        HISTORY_CACHE_PERSIST=os.path.exists(cache_path),
+    )
+    history.init_db(app)
+
+    started = time.perf_counter()
+    totals = run(
+        args.paths,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        validate=not args.no_validate,
+        rebuild_indexes=args.rebuild_indexes,
+        hostname=args.hostname,
+    )
+    elapsed = time.perf_counter() - started
+    print(
+        f"read {totals['read']:,} reports ({totals['throttled']:,} throttled, "
+        f"{totals['rejected']:,} rejected); wrote {totals['rows']:,} rows in "
+        f"{elapsed:.1f} s ({totals['rows'] / elapsed:,.0f} rows/s), removed "
+        f"{totals['duplicates']:,} snapshots that were already stored"
+    )
+    print("Restart any running server to drop the history it has cached in memory.")
+
+
+if __name__ == "__main__":
+    # run from the package module so worker processes unpickle its functions
+    # and results under the same names on every start method
+    from cluster_dash_server.backfill import main as package_main
+    package_main()
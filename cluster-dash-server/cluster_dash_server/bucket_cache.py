@@ -0,0 +1,128 @@
+"""Cache of finalised history buckets.
+
+Once a time bucket has closed, its per-host rows and waste-stat partials can
+only change when the retention compactor rewrites that stretch of history, so
+history queries keep them here keyed by ``(bucket_secs, bucket_ts)`` and only
+go to SQLite for buckets they have not seen yet and the one still open.
+
+Entries live in an in-memory LRU and, optionally, in a small SQLite file so
+a restarted server starts warm. Values must be JSON-serializable; tuples come
+back from disk as lists.
+"""
+
+import collections
+import json
+import sqlite3
+import threading
+
+_CREATE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS bucket_cache (
+    bucket_secs INTEGER NOT NULL,
+    bucket_ts INTEGER NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (bucket_secs, bucket_ts)
+) WITHOUT ROWID;
+"""
+
+# bumped whenever cached values change meaning, so a persisted cache from an
+# older version is dropped (2: GPU counts no longer truncated to integers)
+_FORMAT_VERSION = 2
+
+
+class BucketCache:
+    """Finalised bucket values, least recently used evicted past ``max_entries``."""
+    def __init__(self, max_entries, db_path=None):
+        self.max_entries = max_entries
+        self.db_path = db_path
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        if db_path is not None:
+            conn = self._connect()
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(_CREATE_TABLE_SQL)
+                if conn.execute("PRAGMA user_version").fetchone()[0] != _FORMAT_VERSION:
+                    with conn:
+                        conn.execute("DELETE FROM bucket_cache")
+                    conn.execute(f"PRAGMA user_version={_FORMAT_VERSION}")
+            finally:
+                conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_range(self, bucket_secs, start, end):
+        """``{bucket_ts: value}`` for the cached buckets in ``[start, end)``."""
+        found = {}
+        missing = False
+        with self._lock:
+            for ts in range(start, end, bucket_secs):
+                key = (bucket_secs, ts)
+                value = self._entries.get(key)
+                if value is None:
+                    missing = True
+                    continue
+                self._entries.move_to_end(key)
+                found[ts] = value
+
+        if missing and self.db_path is not None:
+            conn = self._connect()
+            try:
+                rows = conn.execute(
+                    """SELECT bucket_ts, value FROM bucket_cache
+                       WHERE bucket_secs = ? AND bucket_ts >= ? AND bucket_ts < ?""",
+                    (bucket_secs, start, end),
+                ).fetchall()
+            finally:
+                conn.close()
+            loaded = {ts: json.loads(value) for ts, value in rows if ts not in found}
+            self._remember(bucket_secs, loaded)
+            found.update(loaded)
+        return found
+
+    def put_many(self, bucket_secs, values):
+        """Cache ``{bucket_ts: value}``, on disk too when persistent."""
+        self._remember(bucket_secs, values)
+        if self.db_path is not None and values:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.executemany(
+                        """INSERT OR REPLACE INTO bucket_cache (bucket_secs, bucket_ts, value)
+                           VALUES (?, ?, ?)""",
+                        [(bucket_secs, ts, json.dumps(value)) for ts, value in values.items()],
+                    )
+            finally:
+                conn.close()
+
+    def _remember(self, bucket_secs, values):
+        with self._lock:
+            for ts, value in values.items():
+                self._entries[(bucket_secs, ts)] = value
+                self._entries.move_to_end((bucket_secs, ts))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, start, end):
+        """Forget every bucket overlapping ``[start, end)``."""
+        with self._lock:
+            stale = [
+                key for key in self._entries
+                if key[1] < end and key[1] + key[0] > start
+            ]
+            for key in stale:
+                del self._entries[key]
+        if self.db_path is not None:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute(
+                        """DELETE FROM bucket_cache
+                           WHERE bucket_ts < ? AND bucket_ts + bucket_secs > ?""",
+                        (end, start),
+                    )
+            finally:
+                conn.close()
@@ -0,0 +1,55 @@
+"""Shape-preserving downsampling of history series.
+
+Largest-Triangle-Three-Buckets (LTTB) keeps, from each run of points, the one
+forming the largest triangle with the point kept before it and the average of
+the next run, so spikes and dips survive where plain averaging would flatten
+them. It picks indices, so every parallel array of a columnar series can be
+cut down with the same selection.
+"""
+
+
+def lttb_indices(xs, ys, threshold):
+    """Indices of at most ``threshold`` points of ``(xs, ys)`` chosen by LTTB."""
+    n = len(xs)
+    if threshold >= n:
+        return list(range(n))
+    if threshold < 3:
+        # just the ends
+        return [0, n - 1][:max(threshold, 0)]
+
+    every = (n - 2) / (threshold - 2)
+    selected = [0]
+    a = 0
+    for i in range(threshold - 2):
+        # average of the next run, the third corner of the triangle
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        span = next_end - next_start
+        avg_x = sum(xs[next_start:next_end]) / span
+        avg_y = sum(ys[next_start:next_end]) / span
+
+        ax, ay = xs[a], ys[a]
+        best = best_area = -1
+        for j in range(int(i * every) + 1, int((i + 1) * every) + 1):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        selected.append(best)
+        a = best
+    selected.append(n - 1)
+    return selected
+
+
+def select_indices(xs, series, max_points):
+    """
+    Indices of at most ``max_points`` points keeping the shape of each of
+    ``series`` (value arrays parallel to ``xs``): each gets an equal share of
+    the budget and the selections are merged.
+    """
+    if len(xs) <= max_points:
+        return list(range(len(xs)))
+    share = max_points // len(series)
+    indices = set()
+    for ys in series:
+        indices.update(lttb_indices(xs, ys, share))
+    return sorted(indices)
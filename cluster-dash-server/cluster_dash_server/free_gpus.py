@@ -0,0 +1,116 @@
+"""Index of free GPUs, kept up to date at ingest.
+
+Each latest-state snapshot carries ``free_by_model``: GPU model name ->
+{hostname: (free GpuState, ...)}. Publishing a report only touches the
+models that host has (or had) free GPUs of, and a lookup only visits hosts
+with free GPUs of the requested model instead of walking every host.
+Snapshots also count ``free_version`` up whenever a GPU becomes free or stops
+being free, which is what /api/wait-for-gpus waiters wake on.
+"""
+
+from .host_state import ONLINE_MAX_MINS
+
+
+def reindex_host(free_by_model, copied, previous, state):
+    """
+    Replace a host's entries in ``free_by_model`` (``previous``'s) with
+    ``state``'s, in place.
+
+    The per-model dicts may be shared with older snapshots, so each is copied
+    before its first change; ``copied`` records which ones already have been.
+    Returns whether the set of free GPUs changed (not just their readings).
+    """
+    models = {gpu.name for gpu in state.free_gpu_states}
+    previous_free = ()
+    if previous is not None:
+        previous_free = previous.free_gpu_states
+        models.update(gpu.name for gpu in previous_free)
+
+    for model in models:
+        if model not in copied:
+            free_by_model[model] = dict(free_by_model.get(model, ()))
+            copied.add(model)
+        hosts = free_by_model.setdefault(model, {})
+        gpus = tuple(gpu for gpu in state.free_gpu_states if gpu.name == model)
+        if gpus:
+            hosts[state.hostname] = gpus
+        else:
+            hosts.pop(state.hostname, None)
+            if not hosts:
+                del free_by_model[model]
+
+    return (
+        {gpu.uuid for gpu in previous_free}
+        != {gpu.uuid for gpu in state.free_gpu_states}
+    )
+
+
+def find_free_gpus(snapshot, now, min_free_mem_mb=0, model=None, count=1, max_age_secs=None):
+    """
+    Free GPUs in ``snapshot`` with at least ``min_free_mem_mb`` free, whose
+    model contains ``model`` (case-insensitive), on hosts that reported within
+    ``max_age_secs`` and have at least ``count`` such GPUs.
+
+    Returns ``[(HostState, [GpuState, ...]), ...]``, hosts with the most
+    matching GPUs first, each host's GPUs by index.
+    """
+    model = model.lower() if model else None
+    matches = {}
+    for model_name, hosts in snapshot.free_by_model.items():
+        if model is not None and model not in model_name.lower():
+            continue
+        for hostname, gpus in hosts.items():
+            gpus = [gpu for gpu in gpus if gpu.free_mem_mb >= min_free_mem_mb]
+            if gpus:
+                matches.setdefault(hostname, []).extend(gpus)
+
+    found = []
+    for hostname, gpus in matches.items():
+        state = snapshot.hosts[hostname]
+        if len(gpus) < count:
+            continue
+        if max_age_secs is not None and now - state.received_timestamp > max_age_secs:
+            continue
+        found.append((state, sorted(gpus, key=lambda gpu: gpu.index)))
+    found.sort(key=lambda match: (-len(match[1]), match[0].hostname))
+    return found
+
+
+def filters_from_args(args):
+    """
+    ``find_free_gpus`` keyword arguments from a request's query args (a
+    werkzeug MultiDict); malformed values fall back to the defaults.
+    """
+    return {
+        "min_free_mem_mb": args.get("min_free_mem_mb", 0, type=float),
+        "model": args.get("model"),
+        "count": args.get("count", 1, type=int),
+        "max_age_secs": args.get("max_age_secs", ONLINE_MAX_MINS * 60, type=float),
+    }
+
+
+def payload(snapshot, now, matches):
+    """The /api/free-gpus response for ``find_free_gpus``'s ``matches``."""
+    return {
+        "version": snapshot.version,
+        "timestamp": now,
+        "total": sum(len(gpus) for _state, gpus in matches),
+        "hosts": [
+            {
+                "hostname": state.hostname,
+                "age_secs": round(now - state.received_timestamp),
+                "gpus": [
+                    {
+                        "index": gpu.index,
+                        "uuid": gpu.uuid,
+                        "name": gpu.name,
+                        "free_mem_mb": round(gpu.free_mem_mb),
+                        "total_mem_mb": round(gpu.total_mem_mb),
+                        "gpu_util": gpu.gpu_util,
+                    }
+                    for gpu in gpus
+                ],
+            }
+            for state, gpus in matches
+        ],
+    }
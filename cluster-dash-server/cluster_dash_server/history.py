@@ -1,15 +1,64 @@
-"""GPU snapshot history — SQLite persistence for tracking usage over time."""
+"""GPU snapshot history — SQLite persistence for tracking usage over time.
 
+Hosts, GPUs and users are interned in ``gpu_history.db``; the time series
+live in one SQLite file per UTC month under ``history/`` (``2026-10.db``, ...).
+Queries ``ATTACH`` only the partitions overlapping their window, so their
+cost follows the window rather than the whole history, and retention drops a
+month past every retention window by deleting its file. Rows of tiers kept
+forever are first moved into a partition for the whole year (``2025.db``).
+"""
+
+import calendar
+import collections
+import contextlib
 import os
+import re
 import sqlite3
+import threading
 import time
 
+from . import downsample
+from . import metrics
+from .bucket_cache import BucketCache
+
 _db_path = None
+_partition_dir = None
+# partitions known to exist with their tables created
+_ready_partitions = set()
+_partition_lock = threading.Lock()
 _last_snapshot_times = {}
+_last_snapshot_lock = threading.Lock()
+
+# finalised cluster-history buckets (see bucket_cache); set up by init_db
+_bucket_cache = None
+
+
+class _EntityIds:
+    """Ids interned in one entity DB, filled lazily from its hosts/gpus/users tables."""
+    def __init__(self):
+        self.hosts = {}
+        self.gpus = {}
+        self.users = {}
+
+
+# replaced by init_db, so ids never carry over to another instance's DB
+_ids = _EntityIds()
 
 SNAPSHOT_MIN_INTERVAL_SECS = 300
 
-_CREATE_TABLES_SQL = """
+# SQLite attaches at most this many databases to one connection
+_MAX_ATTACHED = 10
+
+# monthly partitions, and the yearly ones retention archives them into
+_PARTITION_FILE_RE = re.compile(r"^\d{4}(-\d{2})?\.db$")
+
+# time-series tables, created in every monthly partition
+_PARTITIONED_TABLES = (
+    "gpu_snapshots", "gpu_snapshots_hourly", "gpu_snapshots_daily",
+    "gpu_samples", "gpu_user_samples",
+)
+
+_PARTITION_TABLES_SQL = """
 CREATE TABLE IF NOT EXISTS gpu_snapshots (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     timestamp REAL NOT NULL,
@@ -22,10 +71,134 @@ CREATE TABLE IF NOT EXISTS gpu_snapshots (
 );
 
 CREATE INDEX IF NOT EXISTS idx_snapshots_timestamp ON gpu_snapshots(timestamp);
-CREATE INDEX IF NOT EXISTS idx_snapshots_hostname ON gpu_snapshots(hostname);
+-- one host's range (the /api/history/<hostname> drilldown) is answered from
+-- these covering indexes alone; they replace a hostname-only index
+CREATE INDEX IF NOT EXISTS idx_snapshots_host_time ON gpu_snapshots(
+    hostname, timestamp, total_gpus, free_gpus, avg_gpu_memory_percent,
+    avg_gpu_util, cpu_percent
+);
+DROP INDEX IF EXISTS idx_snapshots_hostname;
+
+-- downsampled tiers written by the retention compactor (see retention.py);
+-- sample_count is the number of raw snapshots folded into each row
+CREATE TABLE IF NOT EXISTS gpu_snapshots_hourly (
+    timestamp REAL NOT NULL,
+    hostname TEXT NOT NULL,
+    total_gpus REAL NOT NULL,
+    free_gpus REAL NOT NULL,
+    avg_gpu_memory_percent REAL NOT NULL,
+    avg_gpu_util REAL NOT NULL,
+    cpu_percent REAL NOT NULL,
+    sample_count INTEGER NOT NULL,
+    PRIMARY KEY (timestamp, hostname)
+);
+
+CREATE INDEX IF NOT EXISTS idx_snapshots_hourly_host_time ON gpu_snapshots_hourly(
+    hostname, timestamp, total_gpus, free_gpus, avg_gpu_memory_percent,
+    avg_gpu_util, cpu_percent, sample_count
+);
+
+CREATE TABLE IF NOT EXISTS gpu_snapshots_daily (
+    timestamp REAL NOT NULL,
+    hostname TEXT NOT NULL,
+    total_gpus REAL NOT NULL,
+    free_gpus REAL NOT NULL,
+    avg_gpu_memory_percent REAL NOT NULL,
+    avg_gpu_util REAL NOT NULL,
+    cpu_percent REAL NOT NULL,
+    sample_count INTEGER NOT NULL,
+    PRIMARY KEY (timestamp, hostname)
+);
+
+CREATE INDEX IF NOT EXISTS idx_snapshots_daily_host_time ON gpu_snapshots_daily(
+    hostname, timestamp, total_gpus, free_gpus, avg_gpu_memory_percent,
+    avg_gpu_util, cpu_percent, sample_count
+);
+
+-- per-GPU and per-user series, stored as integers (whole seconds, MB,
+-- percent) against the ids interned in gpu_history.db, in WITHOUT ROWID tables
+-- clustered by time, which keeps a sample to ~20 bytes
+CREATE TABLE IF NOT EXISTS gpu_samples (
+    timestamp INTEGER NOT NULL,
+    gpu_id INTEGER NOT NULL,
+    used_mem_mb INTEGER NOT NULL,
+    gpu_util INTEGER NOT NULL,
+    memory_util INTEGER NOT NULL,
+    -- the slot the GPU was in at the time (gpus.gpu_index is the one it was
+    -- in when first seen); NULL in samples from before this column existed
+    gpu_index INTEGER,
+    PRIMARY KEY (timestamp, gpu_id)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_gpu_samples_gpu ON gpu_samples(gpu_id, timestamp);
+
+CREATE TABLE IF NOT EXISTS gpu_user_samples (
+    timestamp INTEGER NOT NULL,
+    gpu_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    used_mem_mb INTEGER NOT NULL,
+    num_procs INTEGER NOT NULL,
+    PRIMARY KEY (timestamp, gpu_id, user_id)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_gpu_user_samples_user
+    ON gpu_user_samples(user_id, timestamp);
+
+-- per-user GPU time and GPU memory held, accumulated at ingest into one row
+-- per UTC day (timestamp = midnight), host and user (see usage.py)
+CREATE TABLE IF NOT EXISTS user_usage_daily (
+    timestamp INTEGER NOT NULL,
+    host_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    gpu_seconds REAL NOT NULL,
+    gpu_mem_gb_seconds REAL NOT NULL,
+    PRIMARY KEY (timestamp, host_id, user_id)
+) WITHOUT ROWID;
 """
 
-# bucket sizes tuned to keep chart point counts reasonable
+_CREATE_TABLES_SQL = """
+-- hosts, GPUs and users are interned to small integer ids, which the
+-- partitions' per-GPU and per-user samples refer to
+CREATE TABLE IF NOT EXISTS hosts (
+    id INTEGER PRIMARY KEY,
+    hostname TEXT NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS gpus (
+    id INTEGER PRIMARY KEY,
+    uuid TEXT NOT NULL UNIQUE,
+    host_id INTEGER NOT NULL REFERENCES hosts(id),
+    gpu_index INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    total_mem_mb INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY,
+    username TEXT NOT NULL UNIQUE
+);
+
+-- hosts going online/offline (see host_events.py); a couple of rows per
+-- outage, so they are kept here for good rather than in the partitions
+CREATE TABLE IF NOT EXISTS host_events (
+    id INTEGER PRIMARY KEY,
+    timestamp REAL NOT NULL,
+    host_id INTEGER NOT NULL REFERENCES hosts(id),
+    status TEXT NOT NULL,
+    last_seen REAL NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_host_events_time ON host_events(timestamp);
+CREATE INDEX IF NOT EXISTS idx_host_events_host ON host_events(host_id, timestamp);
+"""
+
+_SNAPSHOT_COLUMNS = (
+    "timestamp, hostname, total_gpus, free_gpus, "
+    "avg_gpu_memory_percent, avg_gpu_util, cpu_percent"
+)
+
+# bucket sizes tuned to keep chart point counts reasonable; each divides a day,
+# so no bucket ever spans two monthly partitions
 _BUCKET_THRESHOLDS = [
     (24, 300),        # <= 24h: 5-min buckets
     (168, 900),       # <= 7d: 15-min buckets
@@ -34,64 +207,453 @@ _BUCKET_THRESHOLDS = [
 ]
 
 
-def _get_connection():
+def connect():
+    """A connection to the entity DB (hosts, gpus, users, host_events)."""
     conn = sqlite3.connect(_db_path)
     conn.row_factory = sqlite3.Row
     return conn
 
 
+def get_db_path():
+    return _db_path
+
+
+def partition_name(timestamp):
+    """The monthly partition holding ``timestamp``, e.g. ``"2026-10"`` (UTC)."""
+    return time.strftime("%Y-%m", time.gmtime(timestamp))
+
+
+def partition_bounds(name):
+    """``(start, end)`` Unix timestamps of a partition's month, or year."""
+    if "-" not in name:
+        year = int(name)
+        return (
+            calendar.timegm((year, 1, 1, 0, 0, 0)),
+            calendar.timegm((year + 1, 1, 1, 0, 0, 0)),
+        )
+    year, month = (int(part) for part in name.split("-"))
+    start = calendar.timegm((year, month, 1, 0, 0, 0))
+    year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return start, calendar.timegm((year, month, 1, 0, 0, 0))
+
+
+def partition_path(name):
+    return os.path.join(_partition_dir, f"{name}.db")
+
+
+def list_partitions():
+    """Names of the partitions on disk, oldest first."""
+    return sorted(
+        filename[:-len(".db")]
+        for filename in os.listdir(_partition_dir)
+        if _PARTITION_FILE_RE.match(filename)
+    )
+
+
+def partitions_for_range(start, end=None):
+    """Partitions overlapping ``[start, end)``, oldest first."""
+    names = []
+    for name in list_partitions():
+        part_start, part_end = partition_bounds(name)
+        if part_end > start and (end is None or part_start < end):
+            names.append(name)
+    return names
+
+
+def db_file_paths():
+    """Every history database file: the entity DB, then the partitions."""
+    return [_db_path] + [partition_path(name) for name in list_partitions()]
+
+
+def ensure_partition(name, refresh=False):
+    """
+    Create partition ``name`` and its tables unless it exists, or add any
+    tables it is missing; returns its path. Partitions already seen are
+    checked again with ``refresh``, e.g. to recreate dropped indexes.
+    """
+    path = partition_path(name)
+    if name in _ready_partitions and not refresh:
+        return path
+    with _partition_lock:
+        if refresh or name not in _ready_partitions:
+            if os.path.exists(path):
+                # partitions from an older version may lack newer tables
+                conn = sqlite3.connect(path)
+                try:
+                    with conn:
+                        conn.executescript(_PARTITION_TABLES_SQL)
+                        _add_missing_columns(conn)
+                finally:
+                    conn.close()
+            else:
+                _create_partition(path)
+            _ready_partitions.add(name)
+    return path
+
+
+def _add_missing_columns(conn):
+    """Add columns newer versions put in tables an older partition already has."""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(gpu_samples)")}
+    if "gpu_index" not in columns:
+        conn.execute("ALTER TABLE gpu_samples ADD COLUMN gpu_index INTEGER")
+
+
+def _create_partition(path):
+    # built under a temporary name and linked into place, so readers never
+    # attach a half-created partition and racing processes can't clobber
+    # one another's
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("PRAGMA journal_mode=WAL")
+        with conn:
+            conn.executescript(_PARTITION_TABLES_SQL)
+    finally:
+        conn.close()
+    try:
+        os.link(tmp_path, path)
+    except FileExistsError:
+        pass
+    finally:
+        os.remove(tmp_path)
+
+
+def drop_partition(name):
+    """Delete a whole partition's files; returns the bytes freed."""
+    freed = 0
+    with _partition_lock:
+        _ready_partitions.discard(name)
+        for suffix in ("", "-wal", "-shm"):
+            path = partition_path(name) + suffix
+            if os.path.exists(path):
+                freed += os.path.getsize(path)
+                os.remove(path)
+    return freed
+
+
+@contextlib.contextmanager
+def _attached(names):
+    """
+    An entity-DB connection with the partitions ``names`` attached as
+    ``p0``, ``p1``, ...; yields ``(conn, schemas)``.
+    """
+    conn = connect()
+    try:
+        for i, name in enumerate(names):
+            conn.execute(f"ATTACH DATABASE ? AS p{i}", (partition_path(name),))
+        yield conn, [f"p{i}" for i in range(len(names))]
+    finally:
+        conn.close()
+
+
+def query_partitions(start, end, build):
+    """
+    Rows of ``build(schemas) -> (sql, params)`` run over the partitions
+    overlapping ``[start, end)``, attaching as many at a time as SQLite
+    allows; groups run oldest first and their rows are concatenated.
+    """
+    names = partitions_for_range(start, end)
+    rows = []
+    for i in range(0, len(names), _MAX_ATTACHED):
+        with _attached(names[i:i + _MAX_ATTACHED]) as (conn, schemas):
+            sql, params = build(schemas)
+            rows.extend(conn.execute(sql, params).fetchall())
+    return rows
+
+
 def init_db(app):
-    """Create the history database and tables if they don't exist."""
-    global _db_path
+    """Create the history databases and tables if they don't exist."""
+    global _db_path, _partition_dir, _bucket_cache, _ids
     os.makedirs(app.instance_path, exist_ok=True)
     _db_path = os.path.join(app.instance_path, "gpu_history.db")
+    _partition_dir = os.path.join(app.instance_path, "history")
+    os.makedirs(_partition_dir, exist_ok=True)
+    _ready_partitions.clear()
+    _ids = _EntityIds()
+    with _last_snapshot_lock:
+        _last_snapshot_times.clear()
+
+    conn = connect()
+    try:
+        # incremental auto-vacuum lets the compactor hand freed pages back to the
+        # OS. This only takes on a new database, so before anything writes to
+        # it: an older one needs a full VACUUM, which is left to the admin (see
+        # retention.vacuum) rather than holding up every start.
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        # WAL lets history reads and the retention compactor run alongside ingest
+        conn.execute("PRAGMA journal_mode=WAL")
+        with conn:
+            conn.executescript(_CREATE_TABLES_SQL)
+        _migrate_unpartitioned(conn)
+    finally:
+        conn.close()
 
-    with _get_connection() as conn:
-        conn.executescript(_CREATE_TABLES_SQL)
+    for name in list_partitions():
+        ensure_partition(name)
 
+    _bucket_cache = None
+    if app.config.get("HISTORY_CACHE_MAX_BUCKETS"):
+        _bucket_cache = BucketCache(
+            app.config["HISTORY_CACHE_MAX_BUCKETS"],
+            db_path=(
+                os.path.join(app.instance_path, "history_cache.db")
+                if app.config.get("HISTORY_CACHE_PERSIST") else None
+            ),
+        )
 
-def record_snapshot(hostname, results):
-    """Record a summary snapshot, throttled to one per host per interval."""
+
+def _migrate_unpartitioned(conn):
+    """Move time series out of a gpu_history.db from before partitioning."""
+    existing = {
+        row[0] for row in
+        conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    }
+    tables = [table for table in _PARTITIONED_TABLES if table in existing]
+    if not tables:
+        return
+
+    print(f"Moving history into monthly partitions in {_partition_dir}")
+    for table in tables:
+        oldest, newest = conn.execute(
+            f"SELECT MIN(timestamp), MAX(timestamp) FROM main.{table}"
+        ).fetchone()
+        columns = ", ".join(
+            row[1] for row in conn.execute(f"PRAGMA main.table_info({table})")
+        )
+        name = None if oldest is None else partition_name(oldest)
+        while name is not None:
+            start, end = partition_bounds(name)
+            conn.execute(
+                "ATTACH DATABASE ? AS p", (ensure_partition(name),)
+            )
+            with conn:
+                conn.execute(
+                    f"""INSERT OR IGNORE INTO p.{table} ({columns})
+                        SELECT {columns} FROM main.{table}
+                        WHERE timestamp >= ? AND timestamp < ?""",
+                    (start, end),
+                )
+            conn.execute("DETACH DATABASE p")
+            name = partition_name(end) if end <= newest else None
+        with conn:
+            conn.execute(f"DROP TABLE main.{table}")
+
+
+def union_sql(schemas, table, columns, where):
+    """``SELECT columns FROM table WHERE where`` over every schema, UNION ALL'd."""
+    return "\nUNION ALL\n".join(
+        f"SELECT {columns} FROM {schema}.{table} WHERE {where}"
+        for schema in schemas
+    )
+
+
+def _all_tiers_sql(where, schemas):
+    """Union of raw and downsampled snapshots, each weighted by sample_count.
+
+    ``where`` is applied to every arm so each table can use its own index; the
+    caller must repeat its parameters once per arm (``_TIER_ARMS`` per schema).
+    """
+    return "\nUNION ALL\n".join(
+        f"""SELECT {_SNAPSHOT_COLUMNS}, 1 AS sample_count
+              FROM {schema}.gpu_snapshots WHERE {where}
+            UNION ALL
+            SELECT {_SNAPSHOT_COLUMNS}, sample_count
+              FROM {schema}.gpu_snapshots_hourly WHERE {where}
+            UNION ALL
+            SELECT {_SNAPSHOT_COLUMNS}, sample_count
+              FROM {schema}.gpu_snapshots_daily WHERE {where}"""
+        for schema in schemas
+    )
+
+
+_TIER_ARMS = 3
+
+
+def record_snapshot(state):
+    """Record a summary snapshot of a HostState, throttled to one per host per interval."""
     now = time.time()
+    hostname = state.hostname
 
-    last_time = _last_snapshot_times.get(hostname, 0)
-    if now - last_time < SNAPSHOT_MIN_INTERVAL_SECS:
+    if not state.gpus:
         return
 
-    gpu_data = results.get("gpu", {})
-    if not gpu_data:
+    # check-and-claim the slot atomically so concurrent reports from one host
+    # can't both get through the throttle
+    with _last_snapshot_lock:
+        last_time = _last_snapshot_times.get(hostname, 0)
+        if now - last_time < SNAPSHOT_MIN_INTERVAL_SECS:
+            return
+        _last_snapshot_times[hostname] = now
+
+    with metrics.SQLITE_SECONDS.time(op="history_write"):
+        write_rows(snapshot_rows(now, state))
+
+
+def snapshot_rows(timestamp, state):
+    """
+    ``{table: rows}`` for ``write_rows`` recording ``state`` (a HostState, or
+    anything with its summaries and GPUs) at ``timestamp``: a gpu_snapshots
+    row, and a sample per GPU and per (GPU, user) pair. Backfills go through
+    this too, so loaded history matches what ingest would have stored.
+    """
+    gpu_rows, user_rows = _gpu_sample_rows(state.hostname, int(timestamp), state.gpus)
+    return {
+        "gpu_snapshots": [(
+            timestamp, state.hostname, state.total_gpus, state.free_gpus,
+            round(state.avg_gpu_memory_percent, 1),
+            round(state.avg_gpu_util, 1),
+            round(state.cpu_percent, 1),
+        )],
+        "gpu_samples": gpu_rows,
+        "gpu_user_samples": user_rows,
+    }
+
+
+# how write_rows inserts each partitioned table's rows, which hold these
+# columns in this order (timestamp first); {schema} is the partition's
+_INSERT_SQL = {
+    "gpu_snapshots": (
+        f"INSERT INTO {{schema}}.gpu_snapshots ({_SNAPSHOT_COLUMNS}) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)"
+    ),
+    "gpu_samples": """INSERT OR REPLACE INTO {schema}.gpu_samples
+        (timestamp, gpu_id, used_mem_mb, gpu_util, memory_util, gpu_index)
+        VALUES (?, ?, ?, ?, ?, ?)""",
+    "gpu_user_samples": """INSERT OR REPLACE INTO {schema}.gpu_user_samples
+        (timestamp, gpu_id, user_id, used_mem_mb, num_procs)
+        VALUES (?, ?, ?, ?, ?)""",
+    # totals are added to, so several reports can land in one day's row
+    "user_usage_daily": """INSERT INTO {schema}.user_usage_daily
+        (timestamp, host_id, user_id, gpu_seconds, gpu_mem_gb_seconds)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (timestamp, host_id, user_id) DO UPDATE SET
+          gpu_seconds = gpu_seconds + excluded.gpu_seconds,
+          gpu_mem_gb_seconds = gpu_mem_gb_seconds + excluded.gpu_mem_gb_seconds""",
+}
+
+
+def write_rows(rows):
+    """
+    Insert ``{table: rows}`` into the partitioned tables, each row into the
+    partition its timestamp falls in, creating partitions as needed. Rows are
+    tuples of the columns in ``_INSERT_SQL``, with ids from ``intern_host``
+    and friends. Everything is written in one transaction unless it spans
+    more partitions than SQLite attaches at once.
+    """
+    by_partition = collections.defaultdict(lambda: collections.defaultdict(list))
+    name, start, end = None, 0, 0
+    for table, table_rows in rows.items():
+        for row in table_rows:
+            # rows mostly come in runs from one month
+            if not start <= row[0] < end:
+                name = partition_name(row[0])
+                start, end = partition_bounds(name)
+            by_partition[name][table].append(row)
+
+    names = sorted(by_partition)
+    for name in names:
+        ensure_partition(name)
+    for i in range(0, len(names), _MAX_ATTACHED):
+        group = names[i:i + _MAX_ATTACHED]
+        with _attached(group) as (conn, schemas), conn:
+            for name, schema in zip(group, schemas):
+                for table, table_rows in by_partition[name].items():
+                    conn.executemany(_INSERT_SQL[table].format(schema=schema), table_rows)
+
+
+@contextlib.contextmanager
+def _connection(conn):
+    """``conn``, or a new entity-DB connection committed and closed after use."""
+    if conn is not None:
+        yield conn
         return
+    conn = connect()
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
 
-    total_gpus = len(gpu_data)
-    memory_pcts = []
-    util_pcts = []
 
-    for gpu_info in gpu_data.values():
-        total_mem = gpu_info.get("total_mem", 0)
-        used_mem = gpu_info.get("used_mem", 0)
-        mem_pct = (used_mem / total_mem) * 100 if total_mem > 0 else 0
-        memory_pcts.append(mem_pct)
-        util_pcts.append(gpu_info.get("gpu_util", 0))
+def _intern(conn, cache, table, column, value):
+    """Return the integer id for ``value`` in a (id, <column>) lookup table."""
+    entity_id = cache.get(value)
+    if entity_id is None:
+        with _connection(conn) as conn:
+            conn.execute(
+                f"INSERT OR IGNORE INTO {table} ({column}) VALUES (?)", (value,)
+            )
+            entity_id = conn.execute(
+                f"SELECT id FROM {table} WHERE {column} = ?", (value,)
+            ).fetchone()[0]
+        cache[value] = entity_id
+    return entity_id
 
-    free_gpus = sum(
-        1 for mem, util in zip(memory_pcts, util_pcts)
-        if mem < 30 and util < 30
-    )
-    avg_mem = sum(memory_pcts) / len(memory_pcts)
-    avg_util = sum(util_pcts) / len(util_pcts)
-    cpu_percent = results.get("cpu", {}).get("cpu_percent", 0)
-
-    with _get_connection() as conn:
-        conn.execute(
-            """INSERT INTO gpu_snapshots
-               (timestamp, hostname, total_gpus, free_gpus,
-                avg_gpu_memory_percent, avg_gpu_util, cpu_percent)
-               VALUES (?, ?, ?, ?, ?, ?, ?)""",
-            (now, hostname, total_gpus, free_gpus,
-             round(avg_mem, 1), round(avg_util, 1), round(cpu_percent, 1)),
-        )
 
-    _last_snapshot_times[hostname] = now
+def intern_host(hostname, conn=None):
+    """
+    The id of ``hostname`` in the hosts table, adding it if new; goes
+    through ``conn`` (an entity-DB connection from ``connect``) if given.
+    """
+    return _intern(conn, _ids.hosts, "hosts", "hostname", hostname)
+
+
+def intern_user(username, conn=None):
+    """The id of ``username`` in the users table, like ``intern_host``."""
+    return _intern(conn, _ids.users, "users", "username", username)
+
+
+def _intern_gpu(ids, host_id, gpu):
+    # the slot isn't part of the key: it is stored with every sample, so a
+    # GPU that moves slots keeps its id and series
+    key = (host_id, gpu.uuid)
+    gpu_id = ids.gpus.get(key)
+    if gpu_id is None:
+        with _connection(None) as conn:
+            # upsert so a GPU moved between hosts keeps its series
+            conn.execute(
+                """INSERT INTO gpus (uuid, host_id, gpu_index, name, total_mem_mb)
+                   VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT (uuid) DO UPDATE SET
+                     host_id = excluded.host_id,
+                     gpu_index = excluded.gpu_index,
+                     name = excluded.name,
+                     total_mem_mb = excluded.total_mem_mb""",
+                (gpu.uuid, host_id, gpu.index, gpu.name, round(gpu.total_mem_mb)),
+            )
+            gpu_id = conn.execute(
+                "SELECT id FROM gpus WHERE uuid = ?", (gpu.uuid,)
+            ).fetchone()[0]
+        ids.gpus[key] = gpu_id
+    return gpu_id
+
+
+def _gpu_sample_rows(hostname, timestamp, gpus):
+    """
+    ``(gpu_rows, user_rows)`` for gpu_samples and gpu_user_samples, interning
+    the host, GPUs and users.
+    """
+    ids = _ids
+    host_id = _intern(None, ids.hosts, "hosts", "hostname", hostname)
+
+    gpu_rows = []
+    user_rows = []
+    for gpu in gpus:
+        gpu_id = _intern_gpu(ids, host_id, gpu)
+        gpu_rows.append((
+            timestamp, gpu_id,
+            round(gpu.used_mem_mb), round(gpu.gpu_util), round(gpu.memory_util),
+            gpu.index,
+        ))
+
+        for username, processes in gpu.users.items():
+            user_id = _intern(None, ids.users, "users", "username", username)
+            used_mem = sum((proc.get("mem") or 0) for proc in processes.values())
+            user_rows.append(
+                (timestamp, gpu_id, user_id, round(used_mem), len(processes))
+            )
+    return gpu_rows, user_rows
 
 
 def _bucket_size_for_hours(hours):
@@ -101,95 +663,292 @@ def _bucket_size_for_hours(hours):
     return _BUCKET_THRESHOLDS[-1][1]
 
 
-def query_cluster_history(hours=24):
-    """Return time-bucketed series of cluster-wide GPU stats."""
-    cutoff = time.time() - (hours * 3600)
-    bucket_secs = _bucket_size_for_hours(hours)
+# bucket sizes a downsampled range or a host drilldown is fetched at; each
+# divides a day
+RANGE_BUCKET_SIZES = (
+    300, 600, 900, 1800, 3600, 7200, 10800, 14400, 21600, 43200, 86400,
+)
+# fetch up to this many buckets per requested point for LTTB to choose from
+_DOWNSAMPLE_OVERSAMPLE = 4
+
+
+def _history_window(hours, start, end, max_points):
+    """
+    ``(start, end, bucket_secs)`` for the last ``hours``, or for
+    ``[start, end)`` when ``start`` is given (``end`` None: up to now).
+
+    Without ``max_points`` the bucket size follows the fixed thresholds;
+    with it, the finest size giving at most ``_DOWNSAMPLE_OVERSAMPLE`` times
+    that many buckets.
+    """
+    now = time.time()
+    if start is None:
+        start = now - hours * 3600
+    span = (now if end is None else end) - start
+    if max_points is None:
+        return start, end, _bucket_size_for_hours(span / 3600)
+    return start, end, bucket_size_for_range(span, max_points * _DOWNSAMPLE_OVERSAMPLE)
+
+
+def bucket_size_for_range(span_secs, max_buckets):
+    """The finest of ``RANGE_BUCKET_SIZES`` splitting ``span_secs`` into at most ``max_buckets``."""
+    for bucket_secs in RANGE_BUCKET_SIZES:
+        if span_secs / bucket_secs <= max_buckets:
+            return bucket_secs
+    return RANGE_BUCKET_SIZES[-1]
+
+
+# buckets closing less than this long ago may still get rows from in-flight ingests
+_BUCKET_CLOSE_GRACE_SECS = 60
+
+
+def _bucket_sql(schemas, where):
+    """
+    Per-bucket SQL over ``where``: cluster-history rows per host, and the
+    waste-stat partial sums of each bucket's 5-minute cluster totals.
+    """
+    # raw total_gpus/free_gpus are INTEGERs with a sample_count of 1; the
+    # 1.0 keeps their averages from being truncated by integer division
+    host_rows = f"""SELECT
+             CAST(timestamp / ? AS INTEGER) * ? AS bucket_ts,
+             hostname,
+             SUM(total_gpus * sample_count * 1.0) / SUM(sample_count) AS total_gpus,
+             SUM(free_gpus * sample_count * 1.0) / SUM(sample_count) AS free_gpus,
+             SUM(avg_gpu_memory_percent * sample_count * 1.0) / SUM(sample_count)
+               AS avg_gpu_memory_percent,
+             SUM(avg_gpu_util * sample_count * 1.0) / SUM(sample_count) AS avg_gpu_util
+           FROM ({_all_tiers_sql(where, schemas)})
+           GROUP BY bucket_ts, hostname"""
+    # downsampled rows are weighted by how many 5-minute snapshots they stand in for
+    waste_partials = f"""SELECT
+             CAST(bucket * 300 / ? AS INTEGER) * ? AS bucket_ts,
+             SUM(total_gpus * weight) AS total_gpus,
+             SUM(free_gpus * weight) AS free_gpus,
+             MAX(free_gpus) AS peak_free_gpus,
+             MIN(free_gpus) AS min_free_gpus,
+             SUM(avg_gpu_util * weight) AS cluster_util,
+             SUM(avg_gpu_memory_percent * weight) AS cluster_mem,
+             SUM(weight) AS weight
+           FROM (
+             SELECT
+               CAST(timestamp / 300 AS INTEGER) AS bucket,
+               SUM(total_gpus) AS total_gpus,
+               SUM(free_gpus) AS free_gpus,
+               AVG(avg_gpu_util) AS avg_gpu_util,
+               AVG(avg_gpu_memory_percent) AS avg_gpu_memory_percent,
+               MAX(sample_count) AS weight
+             FROM ({_all_tiers_sql(where, schemas)})
+             GROUP BY bucket
+           )
+           GROUP BY bucket_ts"""
+    return host_rows, waste_partials
+
+
+def _query_buckets(start, end, bucket_secs):
+    """
+    ``{bucket_ts: [host_rows, waste_partial]}`` for ``[start, end)`` (``end``
+    None for open-ended) straight from SQLite.
+
+    ``host_rows`` are ``(bucket_ts, hostname, total_gpus, free_gpus,
+    avg_gpu_memory_percent, avg_gpu_util)`` and ``waste_partial`` is
+    ``(total_gpus, free_gpus, peak_free_gpus, min_free_gpus, cluster_util,
+    cluster_mem, weight)``, each sum weighted by snapshot count.
+    """
+    where, bounds = "timestamp >= ?", (start,)
+    if end is not None:
+        where, bounds = "timestamp >= ? AND timestamp < ?", (start, end)
 
-    with _get_connection() as conn:
-        rows = conn.execute(
-            """SELECT
-                 CAST(timestamp / ? AS INTEGER) * ? AS bucket_ts,
-                 hostname,
-                 AVG(total_gpus) AS total_gpus,
-                 AVG(free_gpus) AS free_gpus,
-                 AVG(avg_gpu_memory_percent) AS avg_gpu_memory_percent,
-                 AVG(avg_gpu_util) AS avg_gpu_util
-               FROM gpu_snapshots
-               WHERE timestamp >= ?
-               GROUP BY bucket_ts, hostname
-               ORDER BY bucket_ts""",
-            (bucket_secs, bucket_secs, cutoff),
-        ).fetchall()
-
-    # aggregate per-server rows into cluster-wide time points
     buckets = {}
-    for row in rows:
-        ts = row["bucket_ts"]
-        if ts not in buckets:
-            buckets[ts] = {
-                "timestamp": ts,
-                "total_gpus": 0,
-                "free_gpus": 0,
-                "avg_gpu_util": [],
-                "avg_gpu_memory_percent": [],
-                "servers": {},
-            }
-        b = buckets[ts]
-        b["total_gpus"] += round(row["total_gpus"])
-        b["free_gpus"] += round(row["free_gpus"])
-        b["avg_gpu_util"].append(row["avg_gpu_util"])
-        b["avg_gpu_memory_percent"].append(row["avg_gpu_memory_percent"])
-        b["servers"][row["hostname"]] = {
-            "free_gpus": round(row["free_gpus"]),
-            "total_gpus": round(row["total_gpus"]),
-            "avg_gpu_util": round(row["avg_gpu_util"], 1),
-        }
+    for which in (0, 1):
+        def build(schemas):
+            sql = _bucket_sql(schemas, where)[which]
+            return sql, (bucket_secs, bucket_secs) + bounds * (_TIER_ARMS * len(schemas))
+
+        for row in query_partitions(start, end, build):
+            bucket = buckets.setdefault(row[0], [[], None])
+            if which == 0:
+                bucket[0].append(tuple(row))
+            elif row["weight"]:
+                bucket[1] = tuple(row)[1:]
+    return buckets
+
+
+def _history_buckets(start, end, bucket_secs, op):
+    """
+    ``{bucket_ts: [host_rows, waste_partial]}`` over ``[start, end)``
+    (``end`` None: up to now).
+
+    Whole buckets that closed more than ``_BUCKET_CLOSE_GRACE_SECS`` ago come
+    from the bucket cache, filling it with one query per run of misses; the
+    window's partial first bucket and the still-open ones are always queried.
+    """
+    first_whole = int(-(-start // bucket_secs) * bucket_secs)
+    closed_end = int((time.time() - _BUCKET_CLOSE_GRACE_SECS) // bucket_secs * bucket_secs)
+    if end is not None:
+        closed_end = min(closed_end, int(end // bucket_secs * bucket_secs))
+
+    with metrics.SQLITE_SECONDS.time(op=op):
+        if _bucket_cache is None or closed_end <= first_whole:
+            return _query_buckets(start, end, bucket_secs)
+
+        buckets = _query_buckets(start, first_whole, bucket_secs)
+        cached = _bucket_cache.get_range(bucket_secs, first_whole, closed_end)
+        metrics.HISTORY_BUCKET_CACHE.inc(len(cached), result="hit")
+        run_start = None
+        for ts in range(first_whole, closed_end + bucket_secs, bucket_secs):
+            if ts < closed_end and ts not in cached:
+                if run_start is None:
+                    run_start = ts
+                continue
+            if run_start is not None:
+                fresh = _query_buckets(run_start, ts, bucket_secs)
+                for missing in range(run_start, ts, bucket_secs):
+                    fresh.setdefault(missing, [[], None])
+                _bucket_cache.put_many(bucket_secs, fresh)
+                metrics.HISTORY_BUCKET_CACHE.inc(len(fresh), result="miss")
+                cached.update(fresh)
+                run_start = None
+        buckets.update(cached)
+        if end is None or end > closed_end:
+            buckets.update(_query_buckets(closed_end, end, bucket_secs))
+    return buckets
+
+
+def invalidate_cached_buckets(start, end):
+    """Drop cached buckets overlapping ``[start, end)``, e.g. after retention rewrote it."""
+    if _bucket_cache is not None:
+        _bucket_cache.invalidate(start, end)
 
+
+def _cluster_history_rows(start, end, bucket_secs):
+    """
+    Per-bucket, per-host ``(bucket_ts, hostname, total_gpus, free_gpus,
+    avg_gpu_memory_percent, avg_gpu_util)`` rows over ``[start, end)``,
+    oldest bucket first.
+    """
+    buckets = _history_buckets(start, end, bucket_secs, "history_cluster_query")
+    return [row for ts in sorted(buckets) for row in buckets[ts][0]]
+
+
+def query_cluster_history(hours=24, start=None, end=None, max_points=None):
+    """
+    Return time-bucketed series of cluster-wide GPU stats over the last
+    ``hours`` (or ``[start, end)``), LTTB-downsampled to at most
+    ``max_points`` points when given.
+    """
+    columns = query_cluster_history_columns(hours, start, end, max_points)
+    hosts = columns["hosts"]
     series = []
-    for ts in sorted(buckets):
-        b = buckets[ts]
-        b["avg_gpu_util"] = round(
-            sum(b["avg_gpu_util"]) / len(b["avg_gpu_util"]), 1
-        )
-        b["avg_gpu_memory_percent"] = round(
-            sum(b["avg_gpu_memory_percent"]) / len(b["avg_gpu_memory_percent"]), 1
+    for i, ts in enumerate(columns["timestamps"]):
+        servers = {}
+        for h, hostname in enumerate(hosts):
+            free_gpus = columns["host_free_gpus"][h][i]
+            if free_gpus is not None:
+                servers[hostname] = {
+                    "free_gpus": free_gpus,
+                    "total_gpus": columns["host_total_gpus"][h][i],
+                    "avg_gpu_util": columns["host_avg_gpu_util"][h][i],
+                }
+        series.append({
+            "timestamp": ts,
+            "total_gpus": columns["total_gpus"][i],
+            "free_gpus": columns["free_gpus"][i],
+            "avg_gpu_util": columns["avg_gpu_util"][i],
+            "avg_gpu_memory_percent": columns["avg_gpu_memory_percent"][i],
+            "servers": servers,
+        })
+    return series
+
+
+def query_cluster_history_columns(hours=24, start=None, end=None, max_points=None):
+    """
+    ``query_cluster_history``'s series as parallel arrays: ``timestamps``,
+    one cluster-wide array per metric, and per-host arrays indexed like
+    ``hosts`` (``None`` where a host has no data for a bucket).
+
+    Filled straight from the rows, without a dict per bucket, so long ranges
+    stay cheap to build, serialize and parse. With ``max_points`` every
+    array is cut down to the same LTTB-chosen buckets.
+    """
+    start, end, bucket_secs = _history_window(hours, start, end, max_points)
+    rows = _cluster_history_rows(start, end, bucket_secs)
+
+    hostnames = sorted({row[1] for row in rows})
+    host_index = {hostname: i for i, hostname in enumerate(hostnames)}
+    timestamps = []
+    for row in rows:
+        if not timestamps or timestamps[-1] != row[0]:
+            timestamps.append(row[0])
+
+    n = len(timestamps)
+    total_gpus = [0] * n
+    free_gpus = [0] * n
+    util_sums = [0.0] * n
+    memory_sums = [0.0] * n
+    host_counts = [0] * n
+    host_total_gpus = [[None] * n for _ in hostnames]
+    host_free_gpus = [[None] * n for _ in hostnames]
+    host_avg_gpu_util = [[None] * n for _ in hostnames]
+
+    i = -1
+    bucket = None
+    for bucket_ts, hostname, total, free, memory_percent, util in rows:
+        if bucket_ts != bucket:
+            bucket = bucket_ts
+            i += 1
+        h = host_index[hostname]
+        total = round(total)
+        free = round(free)
+        total_gpus[i] += total
+        free_gpus[i] += free
+        util_sums[i] += util
+        memory_sums[i] += memory_percent
+        host_counts[i] += 1
+        host_total_gpus[h][i] = total
+        host_free_gpus[h][i] = free
+        host_avg_gpu_util[h][i] = round(util, 1)
+
+    avg_gpu_util = [round(u / c, 1) for u, c in zip(util_sums, host_counts)]
+    avg_gpu_memory_percent = [round(m / c, 1) for m, c in zip(memory_sums, host_counts)]
+
+    if max_points is not None and n > max_points:
+        indices = downsample.select_indices(
+            timestamps, [free_gpus, avg_gpu_util], max_points
         )
-        series.append(b)
 
-    return series
+        def pick(values):
+            return [values[i] for i in indices]
 
+        timestamps, total_gpus, free_gpus = pick(timestamps), pick(total_gpus), pick(free_gpus)
+        avg_gpu_util, avg_gpu_memory_percent = pick(avg_gpu_util), pick(avg_gpu_memory_percent)
+        host_total_gpus = [pick(values) for values in host_total_gpus]
+        host_free_gpus = [pick(values) for values in host_free_gpus]
+        host_avg_gpu_util = [pick(values) for values in host_avg_gpu_util]
+
+    return {
+        "bucket_secs": bucket_secs,
+        "timestamps": timestamps,
+        "total_gpus": total_gpus,
+        "free_gpus": free_gpus,
+        "avg_gpu_util": avg_gpu_util,
+        "avg_gpu_memory_percent": avg_gpu_memory_percent,
+        "hosts": hostnames,
+        "host_total_gpus": host_total_gpus,
+        "host_free_gpus": host_free_gpus,
+        "host_avg_gpu_util": host_avg_gpu_util,
+    }
 
-def query_waste_stats(hours=24):
-    """Return aggregate waste statistics for the given time window."""
-    cutoff = time.time() - (hours * 3600)
-
-    with _get_connection() as conn:
-        # per-bucket cluster totals, then aggregate
-        row = conn.execute(
-            """SELECT
-                 AVG(total_gpus) AS avg_total_gpus,
-                 AVG(free_gpus) AS avg_free_gpus,
-                 MAX(free_gpus) AS peak_free_gpus,
-                 MIN(free_gpus) AS min_free_gpus,
-                 AVG(avg_gpu_util) AS avg_cluster_util,
-                 AVG(avg_gpu_memory_percent) AS avg_cluster_mem,
-                 COUNT(*) AS total_snapshots
-               FROM (
-                 SELECT
-                   CAST(timestamp / 300 AS INTEGER) AS bucket,
-                   SUM(total_gpus) AS total_gpus,
-                   SUM(free_gpus) AS free_gpus,
-                   AVG(avg_gpu_util) AS avg_gpu_util,
-                   AVG(avg_gpu_memory_percent) AS avg_gpu_memory_percent
-                 FROM gpu_snapshots
-                 WHERE timestamp >= ?
-                 GROUP BY bucket
-               )""",
-            (cutoff,),
-        ).fetchone()
 
-    if row is None or row["total_snapshots"] == 0:
+def query_waste_stats(hours=24, start=None, end=None):
+    """
+    Return aggregate waste statistics over the last ``hours`` (or
+    ``[start, end)``), combined from per-bucket partial sums (mostly cached).
+    """
+    start, end, bucket_secs = _history_window(hours, start, end, None)
+    buckets = _history_buckets(start, end, bucket_secs, "history_waste_query")
+    rows = [partial for _host_rows, partial in buckets.values() if partial]
+
+    if not rows:
         return {
             "avg_total_gpus": 0,
             "avg_free_gpus": 0,
@@ -201,17 +960,265 @@ def query_waste_stats(hours=24):
             "total_snapshots": 0,
         }
 
-    avg_total = row["avg_total_gpus"] or 0
-    avg_free = row["avg_free_gpus"] or 0
+    totals, frees, peaks, mins, utils, mems, weights = zip(*rows)
+    weight = sum(weights)
+    avg_total = sum(totals) / weight
+    avg_free = sum(frees) / weight
     waste_pct = (avg_free / avg_total * 100) if avg_total > 0 else 0
 
     return {
         "avg_total_gpus": round(avg_total),
         "avg_free_gpus": round(avg_free, 1),
-        "peak_free_gpus": row["peak_free_gpus"] or 0,
-        "min_free_gpus": row["min_free_gpus"] or 0,
-        "avg_cluster_util": round(row["avg_cluster_util"] or 0, 1),
-        "avg_cluster_mem": round(row["avg_cluster_mem"] or 0, 1),
+        "peak_free_gpus": max(peaks),
+        "min_free_gpus": min(mins),
+        "avg_cluster_util": round(sum(utils) / weight, 1),
+        "avg_cluster_mem": round(sum(mems) / weight, 1),
         "waste_percent": round(waste_pct, 1),
-        "total_snapshots": row["total_snapshots"],
+        "total_snapshots": weight,
+    }
+
+
+HOST_HISTORY_COLUMNS = (
+    "total_gpus", "free_gpus", "avg_gpu_memory_percent", "avg_gpu_util", "cpu_percent",
+)
+
+
+def host_history_sql(schemas):
+    """
+    Per-bucket averages of one host's snapshots (every tier) over the
+    attached ``schemas``. Parameters: ``bucket_secs`` twice, then
+    ``(hostname, start, end)`` once per arm (``_TIER_ARMS`` per schema).
+    """
+    averages = ",\n".join(
+        f"SUM({column} * sample_count) * 1.0 / SUM(sample_count) AS {column}"
+        for column in HOST_HISTORY_COLUMNS
+    )
+    tiers = _all_tiers_sql("hostname = ? AND timestamp >= ? AND timestamp < ?", schemas)
+    return f"""SELECT CAST(timestamp / ? AS INTEGER) * ? AS bucket_ts,
+                      {averages},
+                      SUM(sample_count) AS samples
+               FROM ({tiers})
+               GROUP BY bucket_ts
+               ORDER BY bucket_ts"""
+
+
+def query_host_history(hostname, start, end, bucket_secs):
+    """
+    One host's snapshots over ``[start, end)`` averaged into ``bucket_secs``
+    buckets (one of ``RANGE_BUCKET_SIZES``, so no bucket spans partitions),
+    as parallel arrays: ``timestamps``, one per ``HOST_HISTORY_COLUMNS``, and
+    ``samples`` (the 5-minute snapshots behind each bucket).
+    """
+    def build(schemas):
+        params = (bucket_secs, bucket_secs) + (hostname, start, end) * (_TIER_ARMS * len(schemas))
+        return host_history_sql(schemas), params
+
+    with metrics.SQLITE_SECONDS.time(op="history_host_query"):
+        rows = query_partitions(start, end, build)
+
+    out = {
+        "hostname": hostname,
+        "start": start,
+        "end": end,
+        "bucket_secs": bucket_secs,
+        "timestamps": [row[0] for row in rows],
     }
+    for i, column in enumerate(HOST_HISTORY_COLUMNS, 1):
+        out[column] = [round(row[i], 2) for row in rows]
+    out["samples"] = [row[-1] for row in rows]
+    return out
+
+
+def query_gpu_history(hours=24, hostname=None):
+    """Return time-bucketed per-GPU series, optionally for a single host."""
+    cutoff = int(time.time() - (hours * 3600))
+    bucket_secs = _bucket_size_for_hours(hours)
+
+    def build(schemas):
+        host_filter = ""
+        params = [bucket_secs, bucket_secs] + [cutoff] * len(schemas)
+        if hostname is not None:
+            host_filter = "WHERE h.hostname = ?"
+            params.append(hostname)
+        samples = union_sql(
+            schemas, "gpu_samples",
+            "timestamp, gpu_id, used_mem_mb, gpu_util, gpu_index",
+            "timestamp >= ?",
+        )
+        return (
+            f"""SELECT
+                 (s.timestamp / ?) * ? AS bucket_ts,
+                 g.uuid, g.name, g.total_mem_mb, h.hostname,
+                 -- SQLite takes the bare gpu_index from the row with the
+                 -- MAX(timestamp), i.e. the slot the GPU was last in
+                 MAX(s.timestamp), COALESCE(s.gpu_index, g.gpu_index) AS gpu_index,
+                 AVG(s.used_mem_mb) AS used_mem_mb,
+                 AVG(s.gpu_util) AS gpu_util
+               FROM ({samples}) s
+               JOIN gpus g ON g.id = s.gpu_id
+               JOIN hosts h ON h.id = g.host_id
+               {host_filter}
+               GROUP BY g.id, bucket_ts
+               ORDER BY h.hostname, g.gpu_index, bucket_ts""",
+            params,
+        )
+
+    with metrics.SQLITE_SECONDS.time(op="history_gpu_query"):
+        rows = query_partitions(cutoff, None, build)
+
+    gpus = {}
+    for row in rows:
+        gpu = gpus.get(row["uuid"])
+        if gpu is None:
+            gpu = gpus[row["uuid"]] = {
+                "hostname": row["hostname"],
+                "index": row["gpu_index"],
+                "name": row["name"],
+                "total_mem_mb": row["total_mem_mb"],
+                "timestamps": [],
+                "used_mem_mb": [],
+                "gpu_util": [],
+            }
+        # a GPU that moved slots is listed under its latest one
+        gpu["index"] = row["gpu_index"]
+        gpu["timestamps"].append(row["bucket_ts"])
+        gpu["used_mem_mb"].append(round(row["used_mem_mb"]))
+        gpu["gpu_util"].append(round(row["gpu_util"], 1))
+
+    return gpus
+
+
+def query_user_usage(hours=24, hostname=None):
+    """Return per-user GPU sample counts and average memory held over the window."""
+    cutoff = int(time.time() - (hours * 3600))
+
+    def build(schemas):
+        host_filter = ""
+        params = [cutoff] * len(schemas)
+        if hostname is not None:
+            host_filter = "WHERE h.hostname = ?"
+            params.append(hostname)
+        samples = union_sql(
+            schemas, "gpu_user_samples", "timestamp, gpu_id, user_id, used_mem_mb",
+            "timestamp >= ?",
+        )
+        return (
+            f"""SELECT
+                 u.username,
+                 COUNT(*) AS gpu_samples,
+                 SUM(us.used_mem_mb) AS used_mem_mb,
+                 MAX(us.timestamp) AS last_seen
+               FROM ({samples}) us
+               JOIN users u ON u.id = us.user_id
+               JOIN gpus g ON g.id = us.gpu_id
+               JOIN hosts h ON h.id = g.host_id
+               {host_filter}
+               GROUP BY us.user_id""",
+            params,
+        )
+
+    with metrics.SQLITE_SECONDS.time(op="history_user_query"):
+        rows = query_partitions(cutoff, None, build)
+
+    # combine partition groups before averaging
+    totals = {}
+    for row in rows:
+        total = totals.setdefault(row["username"], [0, 0, 0])
+        total[0] += row["gpu_samples"]
+        total[1] += row["used_mem_mb"]
+        total[2] = max(total[2], row["last_seen"])
+
+    return {
+        username: {
+            "gpu_samples": gpu_samples,
+            "avg_used_mem_mb": round(used_mem_mb / gpu_samples),
+            "last_seen": last_seen,
+        }
+        for username, (gpu_samples, used_mem_mb, last_seen) in sorted(
+            totals.items(), key=lambda item: -item[1][0]
+        )
+    }
+
+
+# columns of each export kind, in output order
+EXPORT_COLUMNS = {
+    "hosts": (
+        "timestamp", "hostname", "total_gpus", "free_gpus",
+        "avg_gpu_memory_percent", "avg_gpu_util", "cpu_percent",
+        "sample_count", "resolution",
+    ),
+    "gpus": (
+        "timestamp", "hostname", "uuid", "gpu_index", "name", "total_mem_mb",
+        "used_mem_mb", "gpu_util", "memory_util",
+    ),
+}
+
+# host tiers oldest first: the compactor folds the oldest raw rows into hourly
+# ones and the oldest hourly rows into daily ones
+_EXPORT_HOST_TIERS = (
+    ("gpu_snapshots_daily", "sample_count", "1d"),
+    ("gpu_snapshots_hourly", "sample_count", "1h"),
+    ("gpu_snapshots", "1", "raw"),
+)
+
+
+def iter_export_rows(kind, start, end, hostnames=None, batch_size=1000):
+    """
+    Yield batches of ``EXPORT_COLUMNS[kind]`` tuples with ``start <=
+    timestamp < end``, oldest first, optionally for some hosts only.
+
+    Rows come straight off SQLite cursors in index order, ``batch_size`` at a
+    time and one partition at a time, so memory stays flat however long the
+    range is. Within a partition ``hosts`` rows are ordered per retention
+    tier, the tiers themselves oldest first.
+    """
+    if kind not in EXPORT_COLUMNS:
+        raise ValueError(f"unknown export kind: {kind}")
+
+    host_filter = ""
+    host_params = ()
+    if hostnames:
+        # the unary + stops SQLite from driving the scan off the covering
+        # (hostname, timestamp, ...) index: its rows come host by host, so
+        # they would need a sort (and all the rows) before the first one
+        host_filter = f"AND +hostname IN ({', '.join('?' * len(hostnames))})"
+        host_params = tuple(hostnames)
+
+    def queries(schema):
+        if kind == "hosts":
+            return [
+                (
+                    f"""SELECT {_SNAPSHOT_COLUMNS}, {weight}, '{resolution}'
+                        FROM {schema}.{table}
+                        WHERE timestamp >= ? AND timestamp < ? {host_filter}
+                        ORDER BY timestamp""",
+                    (start, end) + host_params,
+                )
+                for table, weight, resolution in _EXPORT_HOST_TIERS
+            ]
+        # CROSS JOIN keeps gpu_samples as the outer loop, so rows stream out in
+        # primary-key (timestamp) order with no sort step
+        return [(
+            f"""SELECT s.timestamp, h.hostname, g.uuid,
+                       COALESCE(s.gpu_index, g.gpu_index), g.name,
+                       g.total_mem_mb, s.used_mem_mb, s.gpu_util, s.memory_util
+                FROM {schema}.gpu_samples s
+                CROSS JOIN gpus g
+                CROSS JOIN hosts h
+                WHERE g.id = s.gpu_id AND h.id = g.host_id
+                  AND s.timestamp >= ? AND s.timestamp < ?
+                  {host_filter.replace("+hostname", "h.hostname")}
+                ORDER BY s.timestamp, s.gpu_id""",
+            (start, end) + host_params,
+        )]
+
+    for name in partitions_for_range(start, end):
+        with _attached([name]) as (conn, (schema,)):
+            conn.row_factory = None
+            for sql, params in queries(schema):
+                cursor = conn.execute(sql, params)
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield rows
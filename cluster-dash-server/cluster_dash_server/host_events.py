@@ -0,0 +1,337 @@
+"""Online/offline status per host, and the record of its changes.
+
+Rather than every read working out from a report's age whether its host is
+still online, ``HostStatusTracker`` keeps a deadline per host by which its
+next report is due, in a heap ordered by deadline. A background thread
+sleeps until the earliest deadline passes and marks that host offline; its
+next report marks it online again. Each change is handed to ``on_change``
+exactly once, which records it in the ``host_events`` table
+(``record_event``), and reads just look the status up.
+
+A deadline follows what the host was asked to do: ``missed_reports`` times
+the report interval sent back in the ingest reply (see report_hints), or
+the interval it has actually been reporting at if that is longer (moles
+that don't follow hints), but never under ``min_secs``. Without a hint or
+an observed interval (a host's first report, or reports picked up from
+another server process) the fixed threshold ``max_secs`` applies, which
+also caps every deadline, so hosts never go offline later than they used
+to.
+
+Several server processes each track status from the reports they see;
+``record_event`` keeps a change once however many of them record it.
+"""
+
+import collections
+import heapq
+import threading
+import time
+
+from . import history
+from . import metrics
+
+ONLINE = "online"
+OFFLINE = "offline"
+
+StatusChange = collections.namedtuple(
+    "StatusChange",
+    [
+        "hostname",
+        "status",     # ONLINE or OFFLINE
+        "timestamp",  # the report bringing it online, or the deadline it missed
+        "last_seen",  # received_timestamp of the host's latest report
+    ],
+)
+
+# weight of the newest interval in a host's average report interval
+_CADENCE_WEIGHT = 0.3
+
+
+class _TrackedHost:
+    __slots__ = ("status", "last_seen", "cadence", "deadline")
+
+    def __init__(self, status=None, last_seen=None):
+        self.status = status
+        self.last_seen = last_seen
+        # average seconds between reports, once two have been seen in a row
+        self.cadence = None
+        # None until a report has been tracked (not just the recorded status)
+        self.deadline = None
+
+
+class HostStatusTracker:
+    """Each host's status, flipped offline by missed deadlines and online by reports."""
+    def __init__(self, min_secs, max_secs, missed_reports, on_change=None):
+        self.min_secs = min_secs
+        self.max_secs = max_secs
+        self.missed_reports = missed_reports
+        self.on_change = on_change
+        self._hosts = {}
+        # (deadline, hostname), including deadlines later reports superseded
+        self._deadlines = []
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def seed(self, statuses):
+        """Start from ``{hostname: (status, last_seen)}`` as last recorded."""
+        with self._cond:
+            for hostname, (status, last_seen) in statuses.items():
+                self._hosts.setdefault(hostname, _TrackedHost(status, last_seen))
+
+    def start(self, refresh=None):
+        """
+        Start the thread expiring deadlines; ``refresh()`` is called before
+        marking hosts offline, to pick up other processes' reports first.
+        """
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._expire_loop, args=(refresh,), name="host-status", daemon=True,
+        )
+        self._thread.start()
+
+    def _timeout(self, host, hinted_secs):
+        if hinted_secs is None or host.cadence is None:
+            return self.max_secs
+        expected = max(hinted_secs, host.cadence)
+        return min(max(expected * self.missed_reports, self.min_secs), self.max_secs)
+
+    def update(self, state, hinted_secs=None):
+        """
+        Note the report ``state``; ``hinted_secs`` is the longest its reply
+        asked the host to wait before reporting again.
+        """
+        timestamp = state.received_timestamp
+        changes = []
+        with self._cond:
+            host = self._hosts.get(state.hostname)
+            if host is None:
+                host = self._hosts[state.hostname] = _TrackedHost()
+            elif host.last_seen is not None and timestamp <= host.last_seen:
+                # an old report; only a host last recorded online still
+                # needs a deadline for it
+                if host.deadline is not None or host.status != ONLINE:
+                    return
+
+            if host.deadline is not None and host.status == ONLINE:
+                # (a gap spanning an outage says nothing about the cadence)
+                interval = timestamp - host.last_seen
+                if host.cadence is None:
+                    host.cadence = interval
+                else:
+                    host.cadence += _CADENCE_WEIGHT * (interval - host.cadence)
+            elif host.status != ONLINE:
+                changes.append(StatusChange(state.hostname, ONLINE, timestamp, timestamp))
+            host.status = ONLINE
+            host.last_seen = timestamp
+            host.deadline = timestamp + self._timeout(host, hinted_secs)
+            self._push_deadline(state.hostname, host.deadline)
+            # already overdue, e.g. a stale report loaded on startup
+            changes.extend(self._expire(time.time()))
+            self._cond.notify()
+        self._emit(changes)
+
+    def _push_deadline(self, hostname, deadline):
+        heapq.heappush(self._deadlines, (deadline, hostname))
+        # superseded deadlines pile up between expiries with frequent reports
+        if len(self._deadlines) > 4 * len(self._hosts) + 64:
+            self._deadlines = [
+                (host.deadline, name) for name, host in self._hosts.items()
+                if host.deadline is not None and host.status == ONLINE
+            ]
+            heapq.heapify(self._deadlines)
+
+    def sync(self, snapshot):
+        """Catch up on hosts whose latest report in ``snapshot`` is new to us."""
+        for hostname, state in snapshot.hosts.items():
+            host = self._hosts.get(hostname)
+            if (
+                host is None or host.deadline is None
+                or host.last_seen != state.received_timestamp
+            ):
+                self.update(state)
+
+    def _expire(self, now):
+        """Mark hosts past their deadline offline; caller holds the lock."""
+        changes = []
+        while self._deadlines and self._deadlines[0][0] <= now:
+            deadline, hostname = heapq.heappop(self._deadlines)
+            host = self._hosts[hostname]
+            if host.deadline != deadline or host.status != ONLINE:
+                continue
+            host.status = OFFLINE
+            changes.append(StatusChange(hostname, OFFLINE, deadline, host.last_seen))
+        return changes
+
+    def _expire_loop(self, refresh):
+        while True:
+            with self._cond:
+                now = time.time()
+                if not self._deadlines or self._deadlines[0][0] > now:
+                    self._cond.wait(
+                        self._deadlines[0][0] - now if self._deadlines else None
+                    )
+                    continue
+            if refresh is not None:
+                refresh()
+            with self._cond:
+                changes = self._expire(time.time())
+            self._emit(changes)
+
+    def _emit(self, changes):
+        for change in changes:
+            metrics.HOST_STATUS_CHANGES.inc(status=change.status)
+            if self.on_change is not None:
+                self.on_change(change)
+
+    def status(self, state, now):
+        """
+        The status of ``state``'s host: as tracked, or by the fixed
+        threshold for a report the tracker hasn't seen yet.
+        """
+        host = self._hosts.get(state.hostname)
+        if (
+            host is None or host.deadline is None
+            or host.last_seen != state.received_timestamp
+        ):
+            return state.status(now)
+        return host.status
+
+    def counts(self):
+        """``{status: hosts}`` over the tracked hosts."""
+        with self._cond:
+            return collections.Counter(
+                host.status for host in self._hosts.values() if host.deadline is not None
+            )
+
+
+def record_event(change):
+    """
+    Add ``change`` to host_events unless the host's event just before or
+    after it already has that status (another server process recorded it,
+    or this one did before a restart); returns whether it was added.
+    """
+    conn = history.connect()
+    try:
+        with metrics.SQLITE_SECONDS.time(op="events_write"):
+            # take the write lock up front, so two processes can't both add it
+            conn.execute("BEGIN IMMEDIATE")
+            with conn:
+                host_id = history.intern_host(change.hostname, conn)
+                before = conn.execute(
+                    """SELECT status FROM host_events
+                       WHERE host_id = ? AND timestamp <= ?
+                       ORDER BY timestamp DESC, id DESC LIMIT 1""",
+                    (host_id, change.timestamp),
+                ).fetchone()
+                after = conn.execute(
+                    """SELECT status FROM host_events
+                       WHERE host_id = ? AND timestamp > ?
+                       ORDER BY timestamp, id LIMIT 1""",
+                    (host_id, change.timestamp),
+                ).fetchone()
+                if any(row is not None and row["status"] == change.status
+                       for row in (before, after)):
+                    return False
+                conn.execute(
+                    """INSERT INTO host_events (timestamp, host_id, status, last_seen)
+                       VALUES (?, ?, ?, ?)""",
+                    (change.timestamp, host_id, change.status, change.last_seen),
+                )
+                return True
+    finally:
+        conn.close()
+
+
+def latest_statuses():
+    """``{hostname: (status, last_seen)}`` of every host's latest event."""
+    conn = history.connect()
+    try:
+        rows = conn.execute(
+            """SELECT h.hostname, e.status, e.last_seen
+               FROM hosts h
+               JOIN host_events e ON e.id = (
+                   SELECT id FROM host_events WHERE host_id = h.id
+                   ORDER BY timestamp DESC, id DESC LIMIT 1
+               )"""
+        ).fetchall()
+    finally:
+        conn.close()
+    return {row["hostname"]: (row["status"], row["last_seen"]) for row in rows}
+
+
+def query_events(start, end, hostname=None):
+    """
+    Status changes between Unix timestamps ``start`` and ``end``, oldest
+    first, and per host the time spent online and offline over that window
+    (from its status at ``start``, or its first event), optionally for one
+    host.
+    """
+    host_filter, params = "", []
+    if hostname is not None:
+        host_filter, params = "AND h.hostname = ?", [hostname]
+
+    conn = history.connect()
+    try:
+        with metrics.SQLITE_SECONDS.time(op="events_query"):
+            initial = conn.execute(
+                f"""SELECT h.hostname, (
+                        SELECT status FROM host_events
+                        WHERE host_id = h.id AND timestamp < ?
+                        ORDER BY timestamp DESC, id DESC LIMIT 1
+                    ) AS status
+                    FROM hosts h WHERE 1 {host_filter}""",
+                [start] + params,
+            ).fetchall()
+            events = conn.execute(
+                f"""SELECT e.timestamp, h.hostname, e.status, e.last_seen
+                    FROM host_events e JOIN hosts h ON h.id = e.host_id
+                    WHERE e.timestamp >= ? AND e.timestamp < ? {host_filter}
+                    ORDER BY e.timestamp, e.id""",
+                [start, end] + params,
+            ).fetchall()
+    finally:
+        conn.close()
+
+    def tally(status, since):
+        return {"status": status, "since": since, "secs": collections.Counter(), "outages": 0}
+
+    # per host with a known status: where it stands, since when, and totals
+    hosts = {
+        row["hostname"]: tally(row["status"], start)
+        for row in initial if row["status"] is not None
+    }
+    for event in events:
+        host = hosts.setdefault(event["hostname"], tally(None, event["timestamp"]))
+        if host["status"] is not None:
+            host["secs"][host["status"]] += event["timestamp"] - host["since"]
+        host["status"], host["since"] = event["status"], event["timestamp"]
+        if event["status"] == OFFLINE:
+            host["outages"] += 1
+
+    until = min(end, time.time())
+    summary = {}
+    for name, host in sorted(hosts.items()):
+        secs = host["secs"]
+        secs[host["status"]] += max(until - host["since"], 0)
+        total = secs[ONLINE] + secs[OFFLINE]
+        summary[name] = {
+            "status": host["status"],
+            "online_secs": round(secs[ONLINE]),
+            "offline_secs": round(secs[OFFLINE]),
+            "uptime_percent": round(100 * secs[ONLINE] / total, 2) if total else None,
+            "outages": host["outages"],
+        }
+    return {
+        "start": start,
+        "end": end,
+        "events": [
+            {
+                "timestamp": event["timestamp"],
+                "hostname": event["hostname"],
+                "status": event["status"],
+                "last_seen": event["last_seen"],
+            }
+            for event in events
+        ],
+        "hosts": summary,
+    }
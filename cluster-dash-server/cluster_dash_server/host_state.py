@@ -0,0 +1,207 @@
+"""Parsed, read-only view of a host's latest report.
+
+Each mole report is parsed once at ingest into a ``HostState`` holding the
+per-GPU fields and the host summaries (free GPUs, average memory and
+utilisation) that every read endpoint and the history writer need, so none of
+them walk the raw report again. The free-GPU rule and the fixed online
+threshold live here and nowhere else; host_events tracks hosts' status
+against it, or sooner when they were asked to report more often.
+"""
+
+import json
+
+# a GPU counts as free when both its memory use and utilisation are below these
+FREE_GPU_MAX_MEMORY_PERCENT = 30
+FREE_GPU_MAX_UTIL_PERCENT = 30
+
+# a host is offline at the latest once it has not reported for longer than this
+ONLINE_MAX_MINS = 10
+
+
+def is_gpu_free(memory_percent, gpu_util):
+    return (
+        memory_percent < FREE_GPU_MAX_MEMORY_PERCENT
+        and gpu_util < FREE_GPU_MAX_UTIL_PERCENT
+    )
+
+
+class _ReadOnly:
+    __slots__ = ()
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+    def _init(self, **fields):
+        for name, value in fields.items():
+            object.__setattr__(self, name, value)
+
+
+class GpuState(_ReadOnly):
+    """One GPU from a report."""
+    __slots__ = (
+        "key", "uuid", "index", "name", "total_mem_mb", "used_mem_mb",
+        "free_mem_mb", "memory_percent", "gpu_util", "memory_util", "users",
+        "is_free",
+    )
+
+    def __init__(self, hostname, key, gpu_info):
+        total_mem = gpu_info.get("total_mem", 0)
+        used_mem = gpu_info.get("used_mem", 0)
+        memory_percent = (used_mem / total_mem) * 100 if total_mem > 0 else 0
+        gpu_util = gpu_info.get("gpu_util", 0)
+        self._init(
+            key=key,
+            uuid=gpu_info.get("uuid") or f"{hostname}/{key}",
+            index=gpu_info.get("index", 0),
+            name=gpu_info.get("name", "Unknown GPU"),
+            total_mem_mb=total_mem,
+            used_mem_mb=used_mem,
+            free_mem_mb=max(total_mem - used_mem, 0),
+            memory_percent=memory_percent,
+            gpu_util=gpu_util,
+            memory_util=gpu_info.get("memory_util", 0),
+            users=gpu_info.get("users", {}),
+            is_free=is_gpu_free(memory_percent, gpu_util),
+        )
+
+
+def parse_gpus(hostname, gpu_report):
+    """
+    A report's ``gpu`` dict as ``(gpus, gpu_error)``: the GPUs as
+    ``GpuState``s sorted by index, and the driver error entry's message if
+    there was one.
+    """
+    gpus = []
+    gpu_error = None
+    for key, gpu_info in gpu_report.items():
+        # Check if this entry is an error report
+        if gpu_info.get("error") or gpu_info.get("name") == "error":
+            gpu_error = gpu_info.get("error", "Unknown GPU error")
+            continue
+        gpus.append(GpuState(hostname, key, gpu_info))
+    gpus.sort(key=lambda gpu: gpu.index)
+    return tuple(gpus), gpu_error
+
+
+def summarize_gpus(gpus):
+    """``(total_gpus, free_gpus, avg_gpu_memory_percent, avg_gpu_util)`` of a host's GPUs."""
+    num_gpus = len(gpus)
+    if not num_gpus:
+        return 0, 0, 0, 0
+    return (
+        num_gpus,
+        sum(1 for gpu in gpus if gpu.is_free),
+        sum(gpu.memory_percent for gpu in gpus) / num_gpus,
+        sum(gpu.gpu_util for gpu in gpus) / num_gpus,
+    )
+
+
+class HostState(_ReadOnly):
+    """
+    A host's latest report with its GPUs parsed (sorted by index, driver
+    error entries split out) and host summaries precomputed.
+    """
+    __slots__ = (
+        "hostname", "received_timestamp", "report", "cpu_percent", "num_cpus",
+        "gpus", "gpu_error", "total_gpus", "free_gpus", "free_gpu_states",
+        "avg_gpu_memory_percent", "avg_gpu_util", "_dashboard_fields",
+        "_legacy_gpu_parts",
+    )
+
+    def __init__(self, report):
+        hostname = report["hostname"]
+        cpu_data = report.get("cpu", {})
+        gpus, gpu_error = parse_gpus(hostname, report.get("gpu", {}))
+        total_gpus, free_gpus, avg_gpu_memory_percent, avg_gpu_util = summarize_gpus(gpus)
+
+        self._init(
+            hostname=hostname,
+            received_timestamp=report["received_timestamp"],
+            report=report,
+            cpu_percent=cpu_data.get("cpu_percent", 0),
+            num_cpus=cpu_data.get("num_cpus", 0),
+            gpus=gpus,
+            gpu_error=gpu_error,
+            total_gpus=total_gpus,
+            free_gpus=free_gpus,
+            free_gpu_states=tuple(gpu for gpu in gpus if gpu.is_free),
+            avg_gpu_memory_percent=avg_gpu_memory_percent,
+            avg_gpu_util=avg_gpu_util,
+            _dashboard_fields=None,
+            _legacy_gpu_parts=None,
+        )
+        object.__setattr__(self, "_dashboard_fields", self._build_dashboard_fields())
+        object.__setattr__(self, "_legacy_gpu_parts", self._build_legacy_gpu_parts())
+
+    def last_seen_mins(self, now):
+        return round((now - self.received_timestamp) / 60)
+
+    def status(self, now):
+        """Online or offline by the fixed threshold alone."""
+        return "online" if self.last_seen_mins(now) <= ONLINE_MAX_MINS else "offline"
+
+    def _build_dashboard_fields(self):
+        fields = {
+            "cpu": {
+                "cpu_percent": round(self.cpu_percent),
+                "num_cpus": self.num_cpus,
+            },
+            "gpus": [
+                {
+                    "index": gpu.index,
+                    "name": gpu.name,
+                    "total_mem_mb": round(gpu.total_mem_mb),
+                    "used_mem_mb": round(gpu.used_mem_mb),
+                    "memory_percent": round(gpu.memory_percent),
+                    "gpu_util": gpu.gpu_util,
+                    "users": gpu.users,
+                }
+                for gpu in self.gpus
+            ],
+            "summary": {
+                "total_gpus": self.total_gpus,
+                "free_gpus": self.free_gpus,
+                "avg_gpu_memory_percent": round(self.avg_gpu_memory_percent),
+                "avg_gpu_util": round(self.avg_gpu_util),
+            },
+        }
+        if self.gpu_error:
+            fields["gpu_error"] = self.gpu_error
+        return fields
+
+    def dashboard_entry(self, now, status):
+        """This host's /api/dashboard-data entry as of ``now``, with its ``status``."""
+        return {
+            "status": status,
+            "last_seen_mins": self.last_seen_mins(now),
+            **self._dashboard_fields,
+        }
+
+    def _build_legacy_gpu_parts(self):
+        """
+        Serialize the raw ``gpu`` dict for /data-out/gpu-data-simple, split
+        where the per-request age fields get spliced in.
+
+        Each GPU object is stored as its JSON with the closing brace dropped,
+        so a request only has to append the ages and close it again.
+        """
+        parts = []
+        for key, gpu_info in sorted(self.report.get("gpu", {}).items()):
+            body = json.dumps(gpu_info, sort_keys=True)[:-1]
+            separator = ", " if gpu_info else ""
+            parts.append(f"{json.dumps(key)}: {body}{separator}".encode())
+        return tuple(parts)
+
+    @property
+    def gpu_json_bytes(self):
+        """Size of this host's pre-serialized GPU data."""
+        return sum(len(part) for part in self._legacy_gpu_parts)
+
+    def legacy_gpu_json(self, now):
+        """This host's /data-out/gpu-data-simple entry as JSON bytes."""
+        age = now - self.received_timestamp
+        ages = (
+            f'"received_timestamp": {age!r}, '
+            f'"time_received_mins": {round(age / 60)}}}'
+        ).encode()
+        return b"{" + b", ".join(part + ages for part in self._legacy_gpu_parts) + b"}"
@@ -0,0 +1,178 @@
+"""Processes holding GPU memory on GPUs that are doing no work.
+
+"Free" GPUs (see host_state) are the waste the history page counts, but a
+GPU whose memory is held by a forgotten notebook or a hung dataloader counts
+as busy while computing nothing. ``IdleAllocationTracker`` follows every
+(host, GPU UUID, pid) through the reports as a small state machine:
+
+- not tracked: the process is gone, holds little memory, or its GPU is busy;
+- idle since ``t``: the first report that saw it on an idle GPU was at ``t``;
+- flagged: still idle, ``threshold_secs`` or more after ``t``.
+
+Any report showing the GPU busy again, or the process gone, drops it back to
+untracked. Ingest only revisits GPUs whose utilisation state or processes
+changed since the host's previous report; the rest keep their entries as is.
+
+Memory is bounded: dead pids go with the report that no longer lists them,
+hosts that stop reporting are evicted once stale, and past
+``max_allocations`` the hosts heard from least recently are evicted first.
+The tracker lives in memory only; after a restart idle times count from the
+reports reloaded from the latest-state store.
+"""
+
+import collections
+import threading
+
+IdleAllocation = collections.namedtuple(
+    "IdleAllocation",
+    [
+        "gpu_uuid",
+        "gpu_index",
+        "gpu_name",
+        "pid",
+        "username",
+        "process_name",
+        "mem_mb",
+        "idle_since",  # received_timestamp of the first report that saw it idle
+    ],
+)
+
+
+def _holders(gpu):
+    """``{(username, pid): mem}`` on ``gpu``, the only process fields tracked.
+
+    Reports also carry each process's running ``time``, which changes every
+    report, so comparing ``gpu.users`` whole would revisit every GPU.
+    """
+    return {
+        (username, pid): proc.get("mem")
+        for username, processes in gpu.users.items()
+        for pid, proc in processes.items()
+    }
+
+
+class _TrackedHost:
+    __slots__ = ("state", "allocations")
+
+    def __init__(self, state):
+        self.state = state
+        # {gpu uuid: {pid: IdleAllocation}}, only for GPUs with idle allocations
+        self.allocations = {}
+
+
+class IdleAllocationTracker:
+    """Idle (host, GPU, pid) allocations, updated from each host report."""
+    def __init__(self, threshold_secs, max_gpu_util, min_mem_mb, stale_secs,
+                 max_allocations):
+        self.threshold_secs = threshold_secs
+        self.max_gpu_util = max_gpu_util
+        self.min_mem_mb = min_mem_mb
+        self.stale_secs = stale_secs
+        self.max_allocations = max_allocations
+        # hostname -> _TrackedHost, least recently reported first
+        self._hosts = collections.OrderedDict()
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count
+
+    def _is_idle(self, gpu):
+        return gpu.gpu_util <= self.max_gpu_util
+
+    def update(self, state):
+        """Advance ``state.hostname``'s allocations to the report ``state``."""
+        with self._lock:
+            host = self._hosts.get(state.hostname)
+            if host is None:
+                host = self._hosts[state.hostname] = _TrackedHost(None)
+            elif host.state is not None and (
+                host.state.received_timestamp > state.received_timestamp
+            ):
+                return
+            else:
+                self._hosts.move_to_end(state.hostname)
+
+            previous = {}
+            if host.state is not None:
+                previous = {gpu.uuid: gpu for gpu in host.state.gpus}
+            for gpu in state.gpus:
+                before = previous.pop(gpu.uuid, None)
+                if (
+                    before is not None
+                    and _holders(before) == _holders(gpu)
+                    and self._is_idle(before) == self._is_idle(gpu)
+                ):
+                    continue
+                self._update_gpu(host, gpu, state.received_timestamp)
+            # GPUs missing from this report (driver errors, removed cards)
+            for uuid in previous:
+                self._count -= len(host.allocations.pop(uuid, ()))
+            host.state = state
+
+            self._evict(state.received_timestamp)
+
+    def _update_gpu(self, host, gpu, timestamp):
+        before = host.allocations.pop(gpu.uuid, {})
+        self._count -= len(before)
+        if not self._is_idle(gpu):
+            return
+
+        allocations = {}
+        for username, processes in gpu.users.items():
+            for pid, proc in processes.items():
+                mem_mb = proc.get("mem") or 0
+                if mem_mb < self.min_mem_mb:
+                    continue
+                known = before.get(pid)
+                idle_since = timestamp
+                if known is not None and known.username == username:
+                    idle_since = known.idle_since
+                allocations[pid] = IdleAllocation(
+                    gpu.uuid, gpu.index, gpu.name, pid, username,
+                    proc.get("name", ""), mem_mb, idle_since,
+                )
+        if allocations:
+            host.allocations[gpu.uuid] = allocations
+            self._count += len(allocations)
+
+    def _evict(self, now):
+        """Drop stale hosts, then the least recently reported over the cap."""
+        while self._hosts:
+            hostname, host = next(iter(self._hosts.items()))
+            stale = now - host.state.received_timestamp > self.stale_secs
+            if not stale and self._count <= self.max_allocations:
+                break
+            del self._hosts[hostname]
+            self._count -= sum(len(pids) for pids in host.allocations.values())
+
+    def sync(self, snapshot):
+        """Catch up on hosts whose latest report in ``snapshot`` is new to us."""
+        for hostname, state in snapshot.hosts.items():
+            host = self._hosts.get(hostname)
+            if host is None or host.state is not state:
+                self.update(state)
+
+    def flagged(self, now, min_idle_secs=None, hostname=None):
+        """
+        ``[(hostname, last_seen, IdleAllocation), ...]`` idle for at least
+        ``min_idle_secs`` (default: the threshold) as of each host's latest
+        report, on hosts reported within ``stale_secs`` of ``now``; longest
+        idle first.
+        """
+        if min_idle_secs is None:
+            min_idle_secs = self.threshold_secs
+        found = []
+        with self._lock:
+            for name, host in self._hosts.items():
+                if hostname is not None and name != hostname:
+                    continue
+                last_seen = host.state.received_timestamp
+                if now - last_seen > self.stale_secs:
+                    continue
+                for pids in host.allocations.values():
+                    for allocation in pids.values():
+                        if last_seen - allocation.idle_since >= min_idle_secs:
+                            found.append((name, last_seen, allocation))
+        found.sort(key=lambda item: item[2].idle_since - item[1])
+        return found
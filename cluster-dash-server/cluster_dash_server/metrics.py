@@ -0,0 +1,230 @@
+"""Process-wide counters, gauges and histograms served at /metrics.
+
+A small stand-in for ``prometheus_client``, covering only what the server
+needs: every update is a dict lookup and an add under a per-metric lock, so
+the metrics can stay on in production. ``render()`` writes them all in the
+Prometheus text exposition format.
+
+Metrics are module-level, like the history database path, so ``history`` and
+``state_store`` can time their SQLite work without having the app passed in.
+"""
+
+import bisect
+import threading
+import time
+
+# seconds; spans sub-millisecond SQLite calls up to slow history queries
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{value}"' for name, value in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        # unlabelled metrics report 0 before their first update
+        self._values = {} if self.labelnames else {(): 0}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}")
+        return tuple(labels[name] for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key, value):
+        labels = _format_labels(self.labelnames, key)
+        return [f"{self.name}{labels} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self._values = {}
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # per-bucket (not cumulative) counts, then sum
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def time(self, **labels):
+        """Context manager observing the time spent in its block."""
+        return _Timer(self, labels)
+
+    def render(self):
+        with self._lock:
+            items = [(key, (list(counts), total)) for key, (counts, total) in self._values.items()]
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        for key, (counts, total) in sorted(items):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [("le", _format_value(float(bound)))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+def render():
+    """Every registered metric in the Prometheus text format."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+REQUEST_SECONDS = Histogram(
+    "cluster_dash_request_seconds",
+    "Time to handle a request (until the response starts), by route.",
+    ["method", "route", "status"],
+)
+INGEST_STAGE_SECONDS = Histogram(
+    "cluster_dash_ingest_stage_seconds",
+    "Time spent in each stage of handling a mole report.",
+    ["stage"],
+)
+SQLITE_SECONDS = Histogram(
+    "cluster_dash_sqlite_seconds",
+    "Time spent in SQLite writes and queries, by operation.",
+    ["op"],
+)
+INGEST_REPORTS = Counter(
+    "cluster_dash_ingest_reports_total",
+    "Reports accepted, by host.",
+    ["hostname"],
+)
+INGEST_REJECTED = Counter(
+    "cluster_dash_ingest_rejected_total",
+    "Reports rejected, by reason.",
+    ["reason"],
+)
+HISTORY_BUCKET_CACHE = Counter(
+    "cluster_dash_history_bucket_cache_total",
+    "Closed history buckets served from the bucket cache (hit) or queried to fill it (miss).",
+    ["result"],
+)
+HISTORY_ERRORS = Counter(
+    "cluster_dash_history_errors_total",
+    "Reports whose history snapshot or usage accounting failed to record.",
+)
+DB_SIZE_BYTES = Gauge(
+    "cluster_dash_db_size_bytes",
+    "Size of each SQLite database (history: every partition), including write-ahead logs.",
+    ["db"],
+)
+STATE_HOSTS = Gauge(
+    "cluster_dash_state_hosts",
+    "Hosts held in the latest-state store.",
+)
+STATE_GPUS = Gauge(
+    "cluster_dash_state_gpus",
+    "GPUs held in the latest-state store.",
+)
+STATE_REPORT_BYTES = Gauge(
+    "cluster_dash_state_report_bytes",
+    "Serialized size of the GPU data held in the latest-state store.",
+)
+STATE_VERSION = Gauge(
+    "cluster_dash_state_version",
+    "Version of the latest-state snapshot.",
+)
+RESPONSE_CACHE_ENTRIES = Gauge(
+    "cluster_dash_response_cache_entries",
+    "Serialized responses currently cached.",
+)
+IDLE_ALLOCATIONS_TRACKED = Gauge(
+    "cluster_dash_idle_allocations_tracked",
+    "Processes currently tracked as holding memory on an idle GPU.",
+)
+REPORT_INTERVAL_HINT_SECS = Gauge(
+    "cluster_dash_report_interval_hint_seconds",
+    "Report interval currently suggested to moles.",
+)
+INGEST_PRESSURE = Gauge(
+    "cluster_dash_ingest_pressure",
+    "Ingest load as a fraction of INGEST_MAX_REPORTS_PER_SEC or INGEST_MAX_IN_FLIGHT, whichever is higher.",
+)
+HOST_STATUS_CHANGES = Counter(
+    "cluster_dash_host_status_changes_total",
+    "Hosts going online or offline, by new status.",
+    ["status"],
+)
+HOSTS_BY_STATUS = Gauge(
+    "cluster_dash_hosts",
+    "Hosts tracked as online or offline.",
+    ["status"],
+)
@@ -0,0 +1,213 @@
+"""On-demand, time-bounded profiling of a running server.
+
+Started from /api/admin/profile, one capture at a time, written to a folder
+of the instance path:
+
+- ``sample``: a background thread snapshots every thread's stack
+  (``sys._current_frames``) every ``interval_secs`` and writes the counts as
+  collapsed stacks (``thread;outer;...;inner count`` lines, the input of
+  flamegraph.pl or speedscope);
+- ``cprofile``: ``app.wsgi_app`` is swapped for a wrapper running each
+  request handler under ``cProfile``, and the merged stats are written as a
+  pstats file (``python -m pstats``, snakeviz).
+
+Nothing is installed until a capture starts and everything is taken down
+when it ends, so requests cost nothing extra the rest of the time.
+"""
+
+import collections
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import time
+
+MODES = ("sample", "cprofile")
+
+_SUFFIXES = {"sample": ".collapsed", "cprofile": ".pstats"}
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def collapse_stack(frame, thread_name):
+    """One collapsed-stack line (without the count) for a thread's current frame."""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.append(thread_name)
+    labels.reverse()
+    # the separators of the collapsed format can't appear in a frame
+    return ";".join(label.replace(";", ":").replace(" ", "_") for label in labels)
+
+
+def sample_stacks(duration_secs, interval_secs, stop=None):
+    """Counts of every other thread's collapsed stack, sampled for ``duration_secs``."""
+    counts = collections.Counter()
+    me = threading.get_ident()
+    # a thread running Python code only hands over the GIL every switch
+    # interval (5 ms), so a sampler left at that would mostly catch threads
+    # waiting on I/O or locks; shorten it for the capture
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(min(switch_interval, interval_secs / 10))
+    try:
+        return _sample_stacks(counts, me, duration_secs, interval_secs, stop)
+    finally:
+        sys.setswitchinterval(switch_interval)
+
+
+def _sample_stacks(counts, me, duration_secs, interval_secs, stop):
+    deadline = time.monotonic() + duration_secs
+    while time.monotonic() < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        frames = sys._current_frames()
+        for ident, frame in frames.items():
+            if ident != me:
+                counts[collapse_stack(frame, names.get(ident, str(ident)))] += 1
+        # don't keep the sampled frames (and their locals) alive
+        del frames, frame
+        if stop is None:
+            time.sleep(interval_secs)
+        elif stop.wait(interval_secs):
+            break
+    return counts
+
+
+def write_collapsed(counts, path):
+    with open(path, "w") as f:
+        for stack, count in counts.most_common():
+            f.write(f"{stack} {count}\n")
+
+
+class _ProfiledWsgiApp:
+    """Runs the wrapped WSGI app under a per-request cProfile, merging the stats."""
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+        self.stats = None
+        self._lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12+ allows one active profiler per process, so a
+            # request overlapping another goes unprofiled
+            return self.wsgi_app(environ, start_response)
+        try:
+            return self.wsgi_app(environ, start_response)
+        finally:
+            profile.disable()
+            with self._lock:
+                if self.stats is None:
+                    self.stats = pstats.Stats(profile)
+                else:
+                    self.stats.add(profile)
+
+
+class Profiler:
+    """One capture at a time of a Flask app, written into ``out_dir``."""
+    def __init__(self, app, out_dir, max_secs, interval_secs=0.01):
+        self.app = app
+        self.out_dir = out_dir
+        self.max_secs = max_secs
+        self.interval_secs = interval_secs
+        self.current = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self, mode, secs):
+        """
+        Start a ``mode`` capture of at most ``max_secs``; returns the file it
+        will write. Raises ValueError for a bad mode and RuntimeError if a
+        capture is already running.
+        """
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {', '.join(MODES)}")
+        secs = min(max(secs, 0.1), self.max_secs)
+        with self._lock:
+            if self.current is not None:
+                raise RuntimeError("a profile is already being captured")
+            os.makedirs(self.out_dir, exist_ok=True)
+            name = self._new_name(mode)
+            self.current = {
+                "mode": mode,
+                "file": name,
+                "started": time.time(),
+                "secs": secs,
+            }
+            self._stop.clear()
+
+        target = self._sample if mode == "sample" else self._cprofile
+        threading.Thread(
+            target=self._capture, args=(target, secs, os.path.join(self.out_dir, name)),
+            name="profiler", daemon=True,
+        ).start()
+        return name
+
+    def _new_name(self, mode):
+        # names have 1 s resolution, so number captures started within the
+        # same second rather than overwrite the earlier one
+        stem = time.strftime("profile-%Y%m%d-%H%M%S", time.gmtime())
+        name = stem + _SUFFIXES[mode]
+        n = 1
+        while os.path.exists(os.path.join(self.out_dir, name)):
+            n += 1
+            name = f"{stem}-{n}{_SUFFIXES[mode]}"
+        return name
+
+    def stop(self):
+        """End the running capture early (it is still written)."""
+        self._stop.set()
+
+    def _capture(self, target, secs, path):
+        try:
+            target(secs, path)
+        except Exception as ex:
+            print(f"Profiling error: {ex}")
+        finally:
+            with self._lock:
+                self.current = None
+
+    def _sample(self, secs, path):
+        write_collapsed(sample_stacks(secs, self.interval_secs, self._stop), path)
+
+    def _cprofile(self, secs, path):
+        original = self.app.wsgi_app
+        wrapper = _ProfiledWsgiApp(original)
+        self.app.wsgi_app = wrapper
+        try:
+            self._stop.wait(secs)
+        finally:
+            self.app.wsgi_app = original
+        # requests that were handled meanwhile can still be finishing
+        with wrapper._lock:
+            stats = wrapper.stats
+        if stats is None:
+            print("Profiling: no requests were handled while profiling")
+            return
+        stats.dump_stats(path)
+
+    def files(self):
+        """The captures written so far, newest first."""
+        if not os.path.isdir(self.out_dir):
+            return []
+        names = [
+            name for name in os.listdir(self.out_dir)
+            if name.startswith("profile-") and name.endswith(tuple(_SUFFIXES.values()))
+        ]
+        # by time written, as numbered names don't sort after their stem
+        return sorted(
+            names,
+            key=lambda name: os.path.getmtime(os.path.join(self.out_dir, name)),
+            reverse=True,
+        )
+
+    def status(self):
+        with self._lock:
+            current = dict(self.current) if self.current is not None else None
+        return {"running": current, "files": self.files()}
@@ -0,0 +1,110 @@
+"""Report-rate hints for moles, sent back in every ingest response.
+
+Moles report every ``idle_secs`` while nobody is looking and every
+``live_secs`` while a dashboard is open (streaming, or waiting in
+/api/wait-for-gpus). A polling dashboard asks for ``live_secs`` too, but
+after its last poll the interval eases back to ``idle_secs`` over
+``viewer_secs``, so a tab looked at once doesn't hold the fleet at the fast
+rate. Whoever is watching, the interval never goes below what keeps the
+whole fleet under ``max_reports_per_sec``.
+
+Under load the interval is stretched in proportion to the pressure on
+ingest: the recent report rate against ``max_reports_per_sec``, or the
+other ingests in flight, which queue on the SQLite writer, against
+``max_in_flight``. Past full pressure each reply also asks for a random
+one-off delay, so a fleet that reports in lockstep (e.g. after a server
+restart) spreads out again.
+
+Intervals never go past ``max_secs``, interval and delay together
+included, which should stay inside the online threshold so hosts don't
+flap offline while the fleet is slowed down.
+"""
+
+import contextlib
+import math
+import random
+import threading
+import time
+
+
+class ReportPacer:
+    """Tracks ingest load and dashboard viewers, and turns them into hints."""
+    def __init__(self, idle_secs, live_secs, max_secs, max_reports_per_sec,
+                 max_in_flight, viewer_secs, rate_window_secs=60):
+        self.idle_secs = idle_secs
+        self.live_secs = live_secs
+        self.max_secs = max_secs
+        self.max_reports_per_sec = max_reports_per_sec
+        self.max_in_flight = max_in_flight
+        self.viewer_secs = viewer_secs
+        self.rate_window_secs = rate_window_secs
+        self.in_flight = 0
+        self._rate = 0.0
+        self._rate_time = 0.0
+        self._viewer_time = 0.0
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def ingest(self):
+        """Count a report into the rate and hold an in-flight slot while it is handled."""
+        now = time.time()
+        with self._lock:
+            self._rate = self._decayed_rate(now) + 1 / self.rate_window_secs
+            self._rate_time = now
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def _decayed_rate(self, now):
+        # exponentially weighted reports/s over about rate_window_secs
+        return self._rate * math.exp(-(now - self._rate_time) / self.rate_window_secs)
+
+    def rate(self, now):
+        with self._lock:
+            return self._decayed_rate(now)
+
+    def viewer_seen(self, now):
+        """Note a polling dashboard; moles report faster for a while after."""
+        self._viewer_time = now
+
+    def _watched(self, now, live_viewers):
+        """1 while someone is watching, falling to 0 ``viewer_secs`` after the last poll."""
+        if live_viewers > 0:
+            return 1.0
+        return max(1 - (now - self._viewer_time) / self.viewer_secs, 0.0)
+
+    def pressure(self, now, own_ingests=0):
+        """
+        Ingest load as a fraction of what's allowed; above 1 is overloaded.
+        ``own_ingests`` in flight are the caller's and not counted.
+        """
+        with self._lock:
+            rate = self._decayed_rate(now)
+            in_flight = self.in_flight - own_ingests
+        return max(rate / self.max_reports_per_sec, in_flight / self.max_in_flight)
+
+    def interval(self, now, live_viewers=0, num_hosts=0, own_ingests=0):
+        """
+        ``(next_report_secs, pressure)`` with ``live_viewers`` open streams or
+        waits and ``num_hosts`` hosts reporting.
+        """
+        watched = self._watched(now, live_viewers)
+        base = self.idle_secs - (self.idle_secs - self.live_secs) * watched
+        # the whole fleet reporting at this interval stays under the rate limit
+        base = max(base, num_hosts / self.max_reports_per_sec)
+        pressure = self.pressure(now, own_ingests)
+        return min(base * max(pressure, 1), self.max_secs), pressure
+
+    def hints(self, now, live_viewers=0, num_hosts=0):
+        """The hint fields of an ingest response, from inside its ``ingest()``."""
+        interval, pressure = self.interval(now, live_viewers, num_hosts, own_ingests=1)
+        backoff = 0
+        if pressure > 1:
+            backoff = random.uniform(0, min(interval, self.max_secs - interval))
+        return {
+            "next_report_secs": round(interval),
+            "backoff_secs": round(backoff, 1),
+        }
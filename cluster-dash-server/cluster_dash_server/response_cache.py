@@ -0,0 +1,56 @@
+"""Generation-versioned cache of serialized API responses.
+
+Every ingest bumps the generation and drops the cached bodies, so a read
+endpoint is rebuilt at most once per ingest (or per freshness window, since
+responses also carry "last seen" ages) no matter how many dashboards poll it.
+The generation and window also make up the response's ETag, letting clients
+revalidate with ``If-None-Match`` and get a ``304 Not Modified``.
+"""
+
+import threading
+import time
+
+
+class ResponseCache:
+    """
+    Serialized responses keyed by name, valid for the current ingest
+    generation and freshness window.
+    """
+    def __init__(self, max_age_secs=60):
+        self.max_age_secs = max_age_secs
+        self.generation = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def bump(self):
+        """Invalidate everything and return the new generation; called after each ingest."""
+        with self._lock:
+            self.generation += 1
+            self._entries = {}
+            return self.generation
+
+    def __len__(self):
+        return len(self._entries)
+
+    def key(self, name):
+        return (name, self.generation, int(time.time() // self.max_age_secs))
+
+    @staticmethod
+    def etag(key):
+        return "-".join(str(part) for part in key)
+
+    def get(self, key, build):
+        """Return the cached body for ``key``, building it with ``build()`` if needed."""
+        body = self._entries.get(key)
+        if body is None:
+            # build outside the lock; concurrent misses just build twice
+            body = build()
+            with self._lock:
+                _name, generation, window = key
+                if generation == self.generation:
+                    # older freshness windows can never be asked for again
+                    self._entries = {
+                        k: v for k, v in self._entries.items() if k[2] == window
+                    }
+                    self._entries[key] = body
+        return body
@@ -0,0 +1,404 @@
+"""History retention — downsample old snapshots into coarser tiers and drop them.
+
+Raw ``gpu_snapshots`` rows older than the raw retention window are folded into
+1-hour rows, 1-hour rows older than their window into 1-day rows, and 1-day
+rows are deleted once past theirs (kept forever by default). Per-GPU and
+per-user samples and per-user daily usage totals are deleted after their own
+windows. Each pass works through the monthly partitions in small per-window
+transactions so ingest never waits long on the write lock, then hands freed
+pages back with an incremental vacuum.
+
+A month past every finite window is dropped by deleting its file. Its rows
+in tiers kept forever (a window of None: by default the 1-day rows and the
+per-user daily totals) are first moved into that year's partition, e.g.
+``2025.db``, which queries attach like any other.
+
+The compactor thread is started by ``serve.py`` (``start_compactor``);
+other ways of running the app, and the tests, only compact when
+/api/admin/retention is POSTed to.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+from . import history
+
+# (source table, destination table, destination bucket secs, config key);
+# a destination of None means rows past retention are simply deleted
+_TIERS = [
+    ("gpu_snapshots", "gpu_snapshots_hourly", 3600,
+     "HISTORY_RAW_RETENTION_DAYS"),
+    ("gpu_snapshots_hourly", "gpu_snapshots_daily", 86400,
+     "HISTORY_HOURLY_RETENTION_DAYS"),
+    ("gpu_snapshots_daily", None, None,
+     "HISTORY_DAILY_RETENTION_DAYS"),
+    ("gpu_samples", None, None,
+     "HISTORY_GPU_SAMPLE_RETENTION_DAYS"),
+    ("gpu_user_samples", None, None,
+     "HISTORY_GPU_SAMPLE_RETENTION_DAYS"),
+    ("user_usage_daily", None, None,
+     "HISTORY_USAGE_RETENTION_DAYS"),
+]
+
+# tables the cluster history and waste stats are built from
+_SNAPSHOT_TABLES = ("gpu_snapshots", "gpu_snapshots_hourly", "gpu_snapshots_daily")
+
+DEFAULT_CONFIG = {
+    "HISTORY_RETENTION_ENABLED": True,
+    "HISTORY_RETENTION_INTERVAL_SECS": 3600,
+    "HISTORY_RAW_RETENTION_DAYS": 14,
+    "HISTORY_HOURLY_RETENTION_DAYS": 365,
+    "HISTORY_DAILY_RETENTION_DAYS": None,
+    "HISTORY_GPU_SAMPLE_RETENTION_DAYS": 365,
+    "HISTORY_USAGE_RETENTION_DAYS": None,
+}
+
+# how many destination buckets to fold per transaction
+_BUCKETS_PER_BATCH = 24
+# pause between transactions so queued ingest writes get the lock
+_BATCH_PAUSE_SECS = 0.05
+_VACUUM_PAGES_PER_STEP = 1000
+
+_config = dict(DEFAULT_CONFIG)
+_run_lock = threading.Lock()
+_compactor_thread = None
+_last_run = None
+
+
+def _fold_sql(source, dest):
+    """Aggregate a window of ``source`` rows into ``dest`` buckets.
+
+    Rows landing in an already compacted bucket (e.g. late reports) are merged
+    in, weighted by sample_count.
+    """
+    # raw total_gpus/free_gpus are INTEGER columns; a float weight keeps
+    # SQLite from truncating their averages with integer division
+    if source == "gpu_snapshots":
+        weight, count = "1.0", "COUNT(*)"
+    else:
+        weight, count = "sample_count * 1.0", "SUM(sample_count)"
+    merged = ", ".join(
+        f"{col} = ({col} * sample_count + excluded.{col} * excluded.sample_count)"
+        f" * 1.0 / (sample_count + excluded.sample_count)"
+        for col in ("total_gpus", "free_gpus", "avg_gpu_memory_percent",
+                    "avg_gpu_util", "cpu_percent")
+    )
+    return f"""
+        INSERT INTO {dest}
+          (timestamp, hostname, total_gpus, free_gpus,
+           avg_gpu_memory_percent, avg_gpu_util, cpu_percent, sample_count)
+        SELECT
+          CAST(timestamp / ? AS INTEGER) * ? AS bucket_ts,
+          hostname,
+          SUM(total_gpus * {weight}) / SUM({weight}),
+          SUM(free_gpus * {weight}) / SUM({weight}),
+          SUM(avg_gpu_memory_percent * {weight}) / SUM({weight}),
+          SUM(avg_gpu_util * {weight}) / SUM({weight}),
+          SUM(cpu_percent * {weight}) / SUM({weight}),
+          {count}
+        FROM {source}
+        WHERE timestamp >= ? AND timestamp < ?
+        GROUP BY bucket_ts, hostname
+        ON CONFLICT (timestamp, hostname) DO UPDATE SET
+          {merged},
+          sample_count = sample_count + excluded.sample_count
+    """
+
+
+def _connect(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _compact_tier(db_path, source, dest, bucket_secs, retention_days, now, partition_end):
+    """Fold or delete everything in one partition's ``source`` older than the retention window."""
+    stats = {"rows_compacted": 0, "rows_deleted": 0}
+    if retention_days is None:
+        return stats
+
+    cutoff = now - retention_days * 86400
+    if dest is None and partition_end <= cutoff:
+        # the whole month is past retention; SQLite empties a table cheaply
+        conn = _connect(db_path)
+        try:
+            with conn:
+                stats["rows_deleted"] = conn.execute(f"DELETE FROM {source}").rowcount
+        finally:
+            conn.close()
+        if stats["rows_deleted"] and source in _SNAPSHOT_TABLES:
+            history.invalidate_cached_buckets(0, partition_end)
+        return stats
+
+    if bucket_secs:
+        # only fold complete buckets so a bucket is never split across passes
+        cutoff = (cutoff // bucket_secs) * bucket_secs
+        batch_secs = bucket_secs * _BUCKETS_PER_BATCH
+    else:
+        batch_secs = 86400 * _BUCKETS_PER_BATCH
+
+    while True:
+        conn = _connect(db_path)
+        try:
+            with conn:
+                oldest = conn.execute(
+                    f"SELECT MIN(timestamp) FROM {source} WHERE timestamp < ?",
+                    (cutoff,),
+                ).fetchone()[0]
+                if oldest is None:
+                    break
+
+                start = (oldest // batch_secs) * batch_secs
+                end = min(start + batch_secs, cutoff)
+                if dest is not None:
+                    conn.execute(
+                        _fold_sql(source, dest),
+                        (bucket_secs, bucket_secs, start, end),
+                    )
+                deleted = conn.execute(
+                    f"DELETE FROM {source} WHERE timestamp >= ? AND timestamp < ?",
+                    (start, end),
+                ).rowcount
+        finally:
+            conn.close()
+
+        if deleted and source in _SNAPSHOT_TABLES:
+            # cached history buckets were built from the rows just rewritten
+            history.invalidate_cached_buckets(start, end)
+        if dest is not None:
+            stats["rows_compacted"] += deleted
+        else:
+            stats["rows_deleted"] += deleted
+        time.sleep(_BATCH_PAUSE_SECS)
+
+    return stats
+
+
+def _incremental_vacuum(db_path):
+    """Release free pages back to the filesystem a chunk at a time."""
+    released = 0
+    conn = _connect(db_path)
+    try:
+        while True:
+            free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if free_pages == 0:
+                break
+            step = min(free_pages, _VACUUM_PAGES_PER_STEP)
+            conn.execute(f"PRAGMA incremental_vacuum({step})").fetchall()
+            released += step
+            time.sleep(_BATCH_PAUSE_SECS)
+    finally:
+        conn.close()
+    return released
+
+
+def _kept_forever():
+    """Tables whose rows are never dropped (a retention of None)."""
+    return [
+        source for source, _dest, _bucket, config_key in _TIERS
+        if _config[config_key] is None
+    ]
+
+
+def _partition_expired(name, partition_end, now):
+    """Whether partition ``name``, ending at ``partition_end``, is past every finite window."""
+    days = [
+        _config[config_key] for _source, _dest, _bucket, config_key in _TIERS
+        if _config[config_key] is not None
+    ]
+    if not days or ("-" not in name and _kept_forever()):
+        # nothing ever expires, or a yearly partition holding rows kept forever
+        return False
+    return partition_end <= now - max(days) * 86400
+
+
+def _archive_partition(name, tables):
+    """Copy ``tables`` of monthly partition ``name`` into its year's partition."""
+    archive_path = history.ensure_partition(name.split("-")[0])
+    conn = _connect(history.partition_path(name))
+    try:
+        conn.execute("ATTACH DATABASE ? AS archive", (archive_path,))
+        with conn:
+            for table in tables:
+                columns = ", ".join(
+                    row["name"] for row in conn.execute(f"PRAGMA main.table_info({table})")
+                    # raw snapshots get new ids in the archive
+                    if row["name"] != "id"
+                )
+                # OR IGNORE: a pass that stopped before deleting the month
+                # copies its rows again
+                conn.execute(
+                    f"""INSERT OR IGNORE INTO archive.{table} ({columns})
+                        SELECT {columns} FROM main.{table}"""
+                )
+    finally:
+        conn.close()
+
+
+def run_compaction(now=None):
+    """Run one full retention pass over every partition; returns the run summary."""
+    global _last_run
+    if now is None:
+        now = time.time()
+
+    with _run_lock:
+        summary = {
+            "started_at": time.time(),
+            "finished_at": None,
+            "rows_compacted": 0,
+            "rows_deleted": 0,
+            "partitions_dropped": 0,
+            "pages_vacuumed": 0,
+            "error": None,
+        }
+        try:
+            for name in history.list_partitions():
+                partition_start, partition_end = history.partition_bounds(name)
+                db_path = history.partition_path(name)
+                # fold first, so an expired month's rows reach the tiers kept
+                # forever before it is archived
+                for source, dest, bucket_secs, config_key in _TIERS:
+                    stats = _compact_tier(
+                        db_path, source, dest, bucket_secs, _config[config_key],
+                        now, partition_end,
+                    )
+                    summary["rows_compacted"] += stats["rows_compacted"]
+                    summary["rows_deleted"] += stats["rows_deleted"]
+
+                if _partition_expired(name, partition_end, now):
+                    if _kept_forever():
+                        _archive_partition(name, _kept_forever())
+                    history.drop_partition(name)
+                    history.invalidate_cached_buckets(partition_start, partition_end)
+                    summary["partitions_dropped"] += 1
+                    continue
+                summary["pages_vacuumed"] += _incremental_vacuum(db_path)
+            summary["pages_vacuumed"] += _incremental_vacuum(history.get_db_path())
+        except Exception as e:
+            summary["error"] = str(e)
+            print(f"History retention error: {e}")
+        summary["finished_at"] = time.time()
+        _last_run = summary
+    return summary
+
+
+def _compactor_loop(interval_secs):
+    while True:
+        run_compaction()
+        time.sleep(interval_secs)
+
+
+def vacuum():
+    """
+    Switch history files from before incremental auto-vacuum over to it with
+    a full VACUUM, which rewrites each one and blocks writers to it while it
+    runs; returns ``{path: bytes freed}`` of the files vacuumed.
+    """
+    freed = {}
+    with _run_lock:
+        for db_path in history.db_file_paths():
+            conn = _connect(db_path)
+            try:
+                if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+                    continue
+                size = os.path.getsize(db_path)
+                conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+                conn.execute("VACUUM")
+            finally:
+                conn.close()
+            freed[db_path] = size - os.path.getsize(db_path)
+    return freed
+
+
+def init_retention(app):
+    """Pick up retention settings."""
+    for key, default in DEFAULT_CONFIG.items():
+        _config[key] = app.config.get(key, default)
+
+
+def start_compactor():
+    """Start the background compactor, once, unless HISTORY_RETENTION_ENABLED is off."""
+    global _compactor_thread
+    if not _config["HISTORY_RETENTION_ENABLED"] or _compactor_thread is not None:
+        return
+
+    _compactor_thread = threading.Thread(
+        target=_compactor_loop,
+        args=(_config["HISTORY_RETENTION_INTERVAL_SECS"],),
+        name="history-retention",
+        daemon=True,
+    )
+    _compactor_thread.start()
+
+
+def _file_sizes(db_path):
+    wal_path = db_path + "-wal"
+    return {
+        "file_bytes": os.path.getsize(db_path),
+        "wal_bytes": os.path.getsize(wal_path) if os.path.exists(wal_path) else 0,
+    }
+
+
+def retention_status():
+    """Per-tier row counts and time ranges, DB and partition sizes and the last run summary."""
+    db_path = history.get_db_path()
+    tiers = {
+        source: {
+            "table": source,
+            "retention_days": _config[config_key],
+            "rows": 0,
+            "oldest": None,
+            "newest": None,
+        }
+        for source, _dest, _bucket_secs, config_key in _TIERS
+    }
+    partitions = []
+
+    for name in history.list_partitions():
+        partition_path = history.partition_path(name)
+        conn = _connect(partition_path)
+        try:
+            for source, tier in tiers.items():
+                row = conn.execute(
+                    f"""SELECT COUNT(*) AS rows, MIN(timestamp) AS oldest,
+                               MAX(timestamp) AS newest
+                        FROM {source}"""
+                ).fetchone()
+                if not row["rows"]:
+                    continue
+                tier["rows"] += row["rows"]
+                if tier["oldest"] is None or row["oldest"] < tier["oldest"]:
+                    tier["oldest"] = row["oldest"]
+                if tier["newest"] is None or row["newest"] > tier["newest"]:
+                    tier["newest"] = row["newest"]
+        finally:
+            conn.close()
+        partitions.append({"name": name, "path": partition_path, **_file_sizes(partition_path)})
+
+    conn = _connect(db_path)
+    try:
+        auto_vacuum = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        freelist_count = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    finally:
+        conn.close()
+
+    return {
+        "enabled": _config["HISTORY_RETENTION_ENABLED"],
+        "interval_secs": _config["HISTORY_RETENTION_INTERVAL_SECS"],
+        "tiers": list(tiers.values()),
+        "db": {
+            "path": db_path,
+            **_file_sizes(db_path),
+            # "none" until a POST with vacuum=1 switches an old database over
+            "auto_vacuum": {0: "none", 1: "full", 2: "incremental"}[auto_vacuum],
+            "page_size": page_size,
+            "page_count": page_count,
+            "freelist_pages": freelist_count,
+        },
+        "partitions": partitions,
+        "last_run": _last_run,
+    }
@@ -0,0 +1,46 @@
+"""Serve the dashboard with waitress, plus the push server for long requests.
+
+Live streams and /api/wait-for-gpus waiters are served by the push server
+(see stream.py), one event loop thread on a port of its own, so they hold no
+waitress threads and waitress only needs ``REQUEST_THREADS`` for ingest,
+dashboard polls and everything else. The history compactor (see
+retention.py) is started here too.
+
+    python -m cluster_dash_server.serve --host 0.0.0.0 --port 8080
+"""
+
+import argparse
+
+import waitress
+
+from . import create_app
+from . import retention
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--push-port", type=int,
+                        help="the push server's port (default: --port + 1)")
+    parser.add_argument("--instance-path",
+                        help="the server's instance folder (default: Flask's default)")
+    args = parser.parse_args()
+
+    app = create_app(instance_path=args.instance_path)
+    push = app.extensions["push_server"]
+    if push.port is None:
+        # not already started from the config's PUSH_PORT
+        push_port = args.push_port if args.push_port is not None else args.port + 1
+        push.start(args.host, push_port)
+    retention.start_compactor()
+    threads = app.config["REQUEST_THREADS"]
+    print(
+        f"Serving on {args.host}:{args.port} with {threads} threads, "
+        f"live streams and waiters on port {push.port}"
+    )
+    waitress.serve(app, host=args.host, port=args.port, threads=threads)
+
+
+if __name__ == "__main__":
+    main()
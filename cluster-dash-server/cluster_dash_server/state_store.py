@@ -0,0 +1,253 @@
+"""Copy-on-write store of the latest HostState per host.
+
+Ingest threads publish by building a new snapshot (a fresh, never mutated
+mapping) under a writer lock and swapping it in with a single attribute
+assignment. Readers just take ``store.snapshot()`` and iterate it without any
+lock; they always see one consistent version, even while ingests land.
+
+``DurableStateStore`` additionally keeps every host's latest report in a
+SQLite ``latest_state`` table, so the dashboard is repopulated straight away
+after a restart, and several server processes pointed at the same instance
+folder can serve reads: each one picks up the others' ingests by polling the
+table for rows with a newer version.
+
+Snapshot versions are counted per process: whatever a publish or a refresh
+adds goes in under a version above everything already in the snapshot, so a
+client holding ``since=<version>`` gets every host that changed after it,
+however the processes' writes interleave. Each process's versions only mean
+something to that process (a client switching processes should start over
+with a full payload).
+"""
+
+import collections
+import json
+import os
+import sqlite3
+import threading
+import time
+from types import MappingProxyType
+
+from . import metrics
+from .free_gpus import reindex_host
+from .host_state import HostState
+
+Snapshot = collections.namedtuple(
+    "Snapshot",
+    [
+        "version",        # bumped on every publish or refresh bringing changes
+        "hosts",          # read-only {hostname: HostState}
+        "host_versions",  # read-only {hostname: snapshot version it last changed in}
+        "sorted_hosts",   # ((hostname, HostState), ...) sorted by hostname
+        "free_by_model",  # read-only {model: {hostname: (free GpuState, ...)}}
+        "free_version",   # bumped whenever the set of free GPUs changes
+    ],
+)
+
+_EMPTY = Snapshot(0, MappingProxyType({}), MappingProxyType({}), (), MappingProxyType({}), 0)
+
+
+class LatestStateStore:
+    """Latest HostState per host, published copy-on-write."""
+    def __init__(self):
+        self._snapshot = _EMPTY
+        self._write_lock = threading.Lock()
+        # {hostname: order of its latest report}, to skip older ones
+        self._report_order = {}
+
+    def snapshot(self):
+        return self._snapshot
+
+    def publish(self, state):
+        """Swap in a snapshot containing ``state``; returns the new version."""
+        with self._write_lock:
+            self._apply([(state, self._snapshot.version + 1)])
+            return self._snapshot.version
+
+    def _apply(self, entries):
+        """
+        Swap in a snapshot with each ``(state, order)`` applied under the
+        next snapshot version, skipping any whose ``order`` is not past what
+        the host already has. Caller holds the write lock.
+        """
+        old = self._snapshot
+        version = old.version + 1
+        hosts = dict(old.hosts)
+        host_versions = dict(old.host_versions)
+        free_by_model = dict(old.free_by_model)
+        copied_models = set()
+        free_changed = False
+        changed = False
+
+        for state, order in entries:
+            if order <= self._report_order.get(state.hostname, 0):
+                continue
+            if reindex_host(free_by_model, copied_models, hosts.get(state.hostname), state):
+                free_changed = True
+            hosts[state.hostname] = state
+            host_versions[state.hostname] = version
+            self._report_order[state.hostname] = order
+            changed = True
+
+        if not changed:
+            return False
+        self._snapshot = Snapshot(
+            version,
+            MappingProxyType(hosts),
+            MappingProxyType(host_versions),
+            tuple(sorted(hosts.items(), key=lambda x: x[0])),
+            MappingProxyType(free_by_model),
+            old.free_version + 1 if free_changed else old.free_version,
+        )
+        return True
+
+
+_CREATE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS latest_state (
+    hostname TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    received_timestamp REAL NOT NULL,
+    report TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_latest_state_version ON latest_state(version);
+"""
+
+# reads are tiny and frequent; let SQLite serve them from a shared mapping
+_MMAP_SIZE = 64 * 1024 * 1024
+
+
+class DurableStateStore(LatestStateStore):
+    """
+    LatestStateStore backed by a SQLite ``latest_state`` table.
+
+    Row versions are allocated in the database so they are global across
+    every process sharing the file, and order each host's reports; snapshot
+    versions stay local (see above). ``snapshot()`` checks for other processes'
+    writes at most every ``refresh_secs`` and calls ``on_change(snapshot)``
+    when it picks some up, so callers can drop caches and wake streams.
+    """
+    def __init__(self, db_path, refresh_secs=1.0, on_change=None):
+        super().__init__()
+        self.db_path = db_path
+        self.refresh_secs = refresh_secs
+        self.on_change = on_change
+        self._next_refresh = 0
+        # every row up to this version has been loaded; kept apart from the
+        # snapshot version since our own publishes can run ahead of it
+        self._synced_version = 0
+        # row versions above it that we wrote ourselves, so refreshes skip them
+        self._own_versions = set()
+
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_CREATE_TABLE_SQL)
+        finally:
+            conn.close()
+        self._refresh()
+
+    def _connect(self):
+        # autocommit; transactions are opened explicitly below
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        conn.execute(f"PRAGMA mmap_size={_MMAP_SIZE}")
+        return conn
+
+    def snapshot(self):
+        if self.refresh_secs is not None and time.time() >= self._next_refresh:
+            self._refresh()
+        return self._snapshot
+
+    def _refresh(self):
+        """Load rows we have not seen yet (all of them on first call)."""
+        self._next_refresh = time.time() + (self.refresh_secs or 0)
+        with metrics.SQLITE_SECONDS.time(op="state_refresh"):
+            conn = self._connect()
+            try:
+                rows = conn.execute(
+                    "SELECT version, report FROM latest_state WHERE version > ?",
+                    (self._synced_version,),
+                ).fetchall()
+            finally:
+                conn.close()
+        if not rows:
+            return
+
+        own = self._own_versions
+        entries = [
+            (HostState(json.loads(report)), version)
+            for version, report in rows
+            if version not in own
+        ]
+        with self._write_lock:
+            self._synced_version = max(
+                self._synced_version, max(version for version, _report in rows)
+            )
+            self._own_versions = {v for v in own if v > self._synced_version}
+            changed = self._apply(entries)
+            snapshot = self._snapshot
+        if changed and self.on_change is not None:
+            self.on_change(snapshot)
+
+    def _persist(self, state, report):
+        """Upsert ``state``'s row under the next global version; returns it."""
+        conn = self._connect()
+        try:
+            # take the write lock up front so version allocation can't race
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                version = conn.execute(
+                    "SELECT COALESCE(MAX(version), 0) + 1 FROM latest_state"
+                ).fetchone()[0]
+                conn.execute(
+                    """INSERT INTO latest_state
+                         (hostname, version, received_timestamp, report)
+                       VALUES (?, ?, ?, ?)
+                       ON CONFLICT (hostname) DO UPDATE SET
+                         version = excluded.version,
+                         received_timestamp = excluded.received_timestamp,
+                         report = excluded.report""",
+                    (state.hostname, version, state.received_timestamp, report),
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.close()
+        return version
+
+    def publish(self, state):
+        """Persist ``state`` under the next global version, then swap it in."""
+        report = json.dumps(state.report)
+        with metrics.SQLITE_SECONDS.time(op="state_write"):
+            db_version = self._persist(state, report)
+
+        with self._write_lock:
+            self._mark_own(db_version)
+            self._apply([(state, db_version)])
+            return self._snapshot.version
+
+    def _mark_own(self, db_version):
+        """
+        Note that we wrote row ``db_version``, so refreshes don't load it
+        back. While no other process has written in between, this just moves
+        the synced version along. Caller holds the write lock.
+        """
+        if db_version <= self._synced_version:
+            return  # a refresh already picked it up
+        self._own_versions.add(db_version)
+        while self._synced_version + 1 in self._own_versions:
+            self._synced_version += 1
+            self._own_versions.discard(self._synced_version)
+
+
+def open_store(app, on_change=None):
+    """The latest-state store configured for ``app``."""
+    if not app.config["LATEST_STATE_PERSIST"]:
+        return LatestStateStore()
+    os.makedirs(app.instance_path, exist_ok=True)
+    return DurableStateStore(
+        os.path.join(app.instance_path, "latest_state.db"),
+        refresh_secs=app.config["LATEST_STATE_REFRESH_SECS"],
+        on_change=on_change,
+    )
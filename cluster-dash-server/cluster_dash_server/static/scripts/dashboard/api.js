@@ -5,15 +5,28 @@
  * It uses the modern fetch() API instead of XMLHttpRequest.
  */
 
+// Event stream URL, set by the server (its push server runs on another port)
+const STREAM_URL = document.querySelector('meta[name="stream-url"]')?.content || "/api/stream";
+
+// URL, ETag and body of the last dashboard response, for conditional requests
+let lastUrl = null;
+let lastEtag = null;
+let lastData = null;
+
 /**
  * Fetch the unified dashboard data from the server.
  *
  * The response includes all server statuses, CPU data, GPU data,
  * and computed summaries - everything the dashboard needs in one call.
  *
+ * @param {number} [since] - `version` of the last response already applied;
+ *   when given, only hosts that reported since then are sent in full
  * @returns {Promise<Object>} Dashboard data with structure:
  *   {
  *     timestamp: number,
+ *     version: number,
+ *     full: boolean,          // false for a delta response
+ *     statuses: { [hostname]: { status, last_seen_mins } },  // deltas only
  *     servers: {
  *       [hostname]: {
  *         status: "online" | "offline",
@@ -25,14 +38,67 @@
  *     }
  *   }
  *
+ * Sends the last ETag as If-None-Match; if nothing has changed the server
+ * answers 304 and the previous data is returned without re-downloading it.
+ *
  * @throws {Error} If the network request fails
  */
-export async function fetchDashboardData() {
-    const response = await fetch("/api/dashboard-data");
+export async function fetchDashboardData(since = 0) {
+    const url = since > 0 ? `/api/dashboard-data?since=${since}` : "/api/dashboard-data";
+
+    const headers = {};
+    if (url === lastUrl && lastEtag && lastData) {
+        headers['If-None-Match'] = lastEtag;
+    }
+
+    const response = await fetch(url, { headers, cache: 'no-store' });
+
+    if (response.status === 304) {
+        return lastData;
+    }
 
     if (!response.ok) {
         throw new Error(`API request failed: ${response.status} ${response.statusText}`);
     }
 
-    return response.json();
+    lastData = await response.json();
+    lastEtag = response.headers.get('ETag');
+    lastUrl = url;
+    return lastData;
+}
+
+/**
+ * Open the Server-Sent Events stream of dashboard updates.
+ *
+ * Each `update` event carries a payload in the same format as
+ * fetchDashboardData (full first, then deltas). The browser reconnects by
+ * itself when the server rotates the stream; `onUnavailable` is called if
+ * the stream is refused (e.g. the server's stream cap is reached) or
+ * EventSource is not supported.
+ *
+ * @param {number} since - `version` already applied (0 for a full payload)
+ * @param {function(Object): void} onUpdate - Called with each payload
+ * @param {function(): void} onUnavailable - Called once the stream gives up
+ * @returns {EventSource|null} The open stream, or null if unsupported
+ */
+export function openDashboardStream(since, onUpdate, onUnavailable) {
+    if (!window.EventSource) {
+        onUnavailable();
+        return null;
+    }
+
+    const url = since > 0 ? `${STREAM_URL}?since=${since}` : STREAM_URL;
+    const source = new EventSource(url);
+
+    source.addEventListener('update', (event) => {
+        onUpdate(JSON.parse(event.data));
+    });
+    source.onerror = () => {
+        // CONNECTING means the browser is already retrying on its own
+        if (source.readyState === EventSource.CLOSED) {
+            onUnavailable();
+        }
+    };
+
+    return source;
 }
@@ -6,7 +6,13 @@
  * utilization bars, and user lists.
  */
 
-import { formatMemory, getUsageLevel, escapeHtml } from './utils.js';
+import {
+    formatMemory,
+    getUsageLevel,
+    escapeHtml,
+    upsertHostElement,
+    removeHostElement,
+} from './utils.js';
 
 /**
  * Render GPU detail panels for all servers.
@@ -46,6 +52,34 @@ export function renderGpuDetails(container, servers) {
     }, 150);
 }
 
+/**
+ * Re-render only the panels for hosts that changed, in place (no fade).
+ * Falls back to a full render if the panels are not on screen yet.
+ *
+ * @param {HTMLElement} container - The DOM element holding the panels
+ * @param {Object} servers - Full merged server data
+ * @param {string[]} changedHostnames - Hosts whose panel needs redrawing
+ * @param {string[]} removedHostnames - Hosts whose panel should go
+ */
+export function updateGpuDetails(container, servers, changedHostnames, removedHostnames) {
+    if (Object.keys(servers).length === 0 || !container.querySelector('.server-detail-panel')) {
+        renderGpuDetails(container, servers);
+        return;
+    }
+
+    removedHostnames.forEach(hostname => removeHostElement(container, hostname));
+
+    changedHostnames.forEach(hostname => {
+        const panel = createServerPanel(hostname, servers[hostname]);
+        // keep the highlight if this panel was the scroll target
+        const existing = document.getElementById(`server-${hostname}`);
+        if (existing && existing.classList.contains('is-target')) {
+            panel.classList.add('is-target');
+        }
+        upsertHostElement(container, panel);
+    });
+}
+
 /**
  * Create a detail panel for one server showing all its GPUs.
  *
@@ -57,6 +91,7 @@ function createServerPanel(hostname, server) {
     const panel = document.createElement('div');
     panel.className = `server-detail-panel status-${server.status}`;
     panel.id = `server-${hostname}`;
+    panel.dataset.hostname = hostname;
 
     const statusBadge = server.status === 'online'
         ? '<span class="badge bg-success">Online</span>'
@@ -3,18 +3,20 @@
  *
  * This is the main module that:
  * 1. Initializes the dashboard on page load
- * 2. Fetches data from the API
- * 3. Renders the summary cards and GPU details
+ * 2. Fetches data from the API (full on first load, then per-host deltas)
+ * 3. Renders the summary cards and GPU details (only the hosts that changed)
  * 4. Updates the header with cluster-wide summary
- * 5. Manages auto-refresh with live indicator
+ * 5. Keeps it live via the server's event stream, falling back to
+ *    polling with a live indicator when the stream is unavailable
  */
 
-import { fetchDashboardData } from './api.js';
-import { renderSummaryCards } from './summaryCards.js';
-import { renderGpuDetails } from './gpuDetails.js';
+import { fetchDashboardData, openDashboardStream } from './api.js';
+import { renderSummaryCards, updateSummaryCards } from './summaryCards.js';
+import { renderGpuDetails, updateGpuDetails } from './gpuDetails.js';
 
 // Configuration
 const REFRESH_INTERVAL_MS = 30000; // 30 seconds
+const STREAM_RETRY_MS = 300000; // retry the event stream every 5 minutes while polling
 
 // DOM element references (set in init)
 let summaryCardsContainer = null;
@@ -23,8 +25,14 @@ let lastUpdateEl = null;
 let clusterSummaryEl = null;
 let liveIndicatorEl = null;
 
-// Refresh timer
+// Refresh timer (only runs while the event stream is unavailable)
 let refreshTimer = null;
+let streamRetryTimer = null;
+let eventStream = null;
+
+// Merged server data and the API version it reflects (0 = nothing loaded)
+let serverState = {};
+let stateVersion = 0;
 
 /**
  * Initialize the dashboard.
@@ -53,8 +61,8 @@ async function init() {
     // Load and render data
     await refreshData();
 
-    // Start auto-refresh
-    startAutoRefresh();
+    // Go live: push updates if we can, otherwise poll
+    startLiveUpdates();
 }
 
 /**
@@ -62,22 +70,17 @@ async function init() {
  */
 async function refreshData() {
     try {
-        // Fetch data from API
-        const data = await fetchDashboardData();
-
-        // Render both sections
-        renderSummaryCards(summaryCardsContainer, data.servers);
-        renderGpuDetails(gpuDetailsContainer, data.servers);
-
-        // Update header elements
-        updateClusterSummary(data.servers);
-        updateLastUpdateBadge();
-        setLiveIndicatorState('live');
+        // Fetch data from API (a delta once we have a baseline)
+        const data = await fetchDashboardData(stateVersion);
+        renderUpdate(data);
 
     } catch (error) {
         console.error('Failed to fetch dashboard data:', error);
         setLiveIndicatorState('error');
 
+        // Start over with a full fetch once the server is back
+        stateVersion = 0;
+
         // Show error in the summary section
         summaryCardsContainer.innerHTML = `
             <div class="col-12 text-center py-5">
@@ -91,6 +94,111 @@ async function refreshData() {
     }
 }
 
+/**
+ * Merge a full or delta payload into the dashboard and redraw what changed.
+ *
+ * @param {Object} data - Payload from the API or the event stream
+ */
+function renderUpdate(data) {
+    const changes = applyUpdate(data);
+
+    if (changes.missing) {
+        // a delta mentions a host we never got in full (possible when several
+        // server processes share the load); start over from a full payload
+        stateVersion = 0;
+        refreshData();
+        return;
+    }
+
+    // Render both sections
+    if (changes.full) {
+        renderSummaryCards(summaryCardsContainer, serverState);
+        renderGpuDetails(gpuDetailsContainer, serverState);
+    } else {
+        updateSummaryCards(summaryCardsContainer, serverState, changes.cards, changes.removed);
+        updateGpuDetails(gpuDetailsContainer, serverState, changes.panels, changes.removed);
+    }
+
+    // Update header elements
+    updateClusterSummary(serverState);
+    updateLastUpdateBadge();
+    setLiveIndicatorState('live');
+}
+
+/**
+ * Merge an API response into `serverState`.
+ *
+ * Full responses replace the state. Deltas replace the hosts that reported,
+ * drop hosts missing from `statuses`, and patch status/last-seen on the rest.
+ *
+ * @param {Object} data - Response from fetchDashboardData
+ * @returns {{full: boolean, cards: string[], panels: string[], removed: string[], missing: boolean}}
+ *   Hosts whose summary card / detail panel need redrawing, removed hosts,
+ *   and whether `statuses` named a host we have no data for
+ */
+function applyUpdate(data) {
+    stateVersion = data.version;
+
+    if (data.full) {
+        serverState = data.servers;
+        return { full: true, cards: [], panels: [], removed: [], missing: false };
+    }
+
+    const reported = Object.keys(data.servers);
+    const cards = new Set(reported);
+    const panels = new Set(reported);
+    Object.assign(serverState, data.servers);
+
+    const removed = Object.keys(serverState).filter(hostname => !(hostname in data.statuses));
+    removed.forEach(hostname => delete serverState[hostname]);
+
+    let missing = false;
+    Object.entries(data.statuses).forEach(([hostname, { status, last_seen_mins }]) => {
+        const server = serverState[hostname];
+        if (!server) {
+            missing = true;
+            return;
+        }
+
+        // cards show the last-seen age; panels only show online/offline
+        if (server.last_seen_mins !== last_seen_mins || server.status !== status) {
+            cards.add(hostname);
+        }
+        if (server.status !== status) {
+            panels.add(hostname);
+        }
+        server.status = status;
+        server.last_seen_mins = last_seen_mins;
+    });
+
+    return { full: false, cards: [...cards], panels: [...panels], removed, missing };
+}
+
+/**
+ * Subscribe to the server's event stream, polling instead if it is refused.
+ */
+function startLiveUpdates() {
+    if (eventStream) {
+        eventStream.close();
+    }
+    eventStream = openDashboardStream(stateVersion, (data) => {
+        stopAutoRefresh();
+        renderUpdate(data);
+    }, () => {
+        if (eventStream) {
+            eventStream.close();
+            eventStream = null;
+        }
+        startAutoRefresh();
+        if (!streamRetryTimer && window.EventSource) {
+            streamRetryTimer = setTimeout(() => {
+                streamRetryTimer = null;
+                startLiveUpdates();
+            }, STREAM_RETRY_MS);
+        }
+    });
+}
+
 /**
  * Start the auto-refresh timer.
  */
@@ -103,6 +211,16 @@ function startAutoRefresh() {
     }, REFRESH_INTERVAL_MS);
 }
 
+/**
+ * Stop the auto-refresh timer (the event stream is delivering updates).
+ */
+function stopAutoRefresh() {
+    if (refreshTimer) {
+        clearInterval(refreshTimer);
+        refreshTimer = null;
+    }
+}
+
 /**
  * Update the cluster-wide summary line in the header.
  * Shows: "X/Y servers online · Z/W GPUs free"
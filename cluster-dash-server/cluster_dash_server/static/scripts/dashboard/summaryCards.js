@@ -5,7 +5,13 @@
  * a card for each server with quick status info.
  */
 
-import { formatDuration, getAvailabilityLevel, escapeHtml } from './utils.js';
+import {
+    formatDuration,
+    getAvailabilityLevel,
+    escapeHtml,
+    upsertHostElement,
+    removeHostElement,
+} from './utils.js';
 
 // Track currently selected server for highlight state
 let selectedHostname = null;
@@ -57,6 +63,32 @@ export function renderSummaryCards(container, servers) {
     }, 150);
 }
 
+/**
+ * Re-render only the cards for hosts that changed, in place (no fade).
+ * Falls back to a full render if the cards are not on screen yet.
+ *
+ * @param {HTMLElement} container - The DOM element holding the cards
+ * @param {Object} servers - Full merged server data
+ * @param {string[]} changedHostnames - Hosts whose card needs redrawing
+ * @param {string[]} removedHostnames - Hosts whose card should go
+ */
+export function updateSummaryCards(container, servers, changedHostnames, removedHostnames) {
+    if (Object.keys(servers).length === 0 || !container.querySelector('.summary-card-item')) {
+        renderSummaryCards(container, servers);
+        return;
+    }
+
+    removedHostnames.forEach(hostname => removeHostElement(container, hostname));
+
+    changedHostnames.forEach(hostname => {
+        const card = createServerCard(hostname, servers[hostname]);
+        if (hostname === selectedHostname) {
+            card.querySelector('.server-card').classList.add('is-selected');
+        }
+        upsertHostElement(container, card);
+    });
+}
+
 /**
  * Create a single server summary card element.
  *
@@ -73,6 +105,7 @@ function createServerCard(hostname, server) {
     // Create wrapper column
     const col = document.createElement('div');
     col.className = 'summary-card-item';
+    col.dataset.hostname = hostname;
 
     // GPU metrics section - show error or normal stats
     const gpuMetrics = gpu_error
@@ -107,3 +107,36 @@ export function escapeHtml(str) {
     div.textContent = str;
     return div.innerHTML;
 }
+
+/**
+ * Replace the child of `container` tagged with the same `data-hostname` as
+ * `el`, or insert `el` so the children stay sorted by hostname.
+ *
+ * @param {HTMLElement} container - Parent whose children carry data-hostname
+ * @param {HTMLElement} el - New element with data-hostname set
+ */
+export function upsertHostElement(container, el) {
+    const hostname = el.dataset.hostname;
+    const children = Array.from(container.children);
+
+    const existing = children.find(child => child.dataset.hostname === hostname);
+    if (existing) {
+        existing.replaceWith(el);
+        return;
+    }
+
+    const next = children.find(child => child.dataset.hostname > hostname);
+    container.insertBefore(el, next || null);
+}
+
+/**
+ * Remove the child of `container` tagged with `data-hostname` = hostname.
+ *
+ * @param {HTMLElement} container - Parent whose children carry data-hostname
+ * @param {string} hostname - Host to remove
+ */
+export function removeHostElement(container, hostname) {
+    Array.from(container.children)
+        .filter(child => child.dataset.hostname === hostname)
+        .forEach(child => child.remove());
+}
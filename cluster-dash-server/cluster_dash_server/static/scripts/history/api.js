@@ -1,5 +1,19 @@
-export async function fetchHistoryData(hours = 24) {
-    const response = await fetch(`/api/history-data?hours=${hours}`);
+export async function fetchHistoryData(hours = 24, maxPoints = null) {
+    let url = `/api/history-data?hours=${hours}&format=columns`;
+    if (maxPoints) {
+        url += `&max_points=${maxPoints}`;
+    }
+    const response = await fetch(url);
+
+    if (!response.ok) {
+        throw new Error(`API request failed: ${response.status} ${response.statusText}`);
+    }
+
+    return response.json();
+}
+
+export async function fetchIdleAllocations() {
+    const response = await fetch('/api/idle-allocations');
 
     if (!response.ok) {
         throw new Error(`API request failed: ${response.status} ${response.statusText}`);
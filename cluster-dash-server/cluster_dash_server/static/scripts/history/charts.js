@@ -165,33 +165,29 @@ export function createUtilizationChart(canvas) {
     });
 }
 
+// {x, y} points from the columnar series' timestamps and one value array
+function points(timestamps, values) {
+    const out = new Array(timestamps.length);
+    for (let i = 0; i < timestamps.length; i++) {
+        out[i] = { x: timestamps[i] * 1000, y: values[i] };
+    }
+    return out;
+}
+
 export function updateAllCharts(freeGpusChart, serverBreakdownChart, utilizationChart, data) {
+    // columnar series: parallel arrays per metric, per-host arrays indexed like hosts
     const series = data.series;
+    const timestamps = series.timestamps;
 
     // free GPUs over time
-    freeGpusChart.data.datasets[0].data = series.map(p => ({
-        x: p.timestamp * 1000,
-        y: p.free_gpus,
-    }));
-    freeGpusChart.data.datasets[1].data = series.map(p => ({
-        x: p.timestamp * 1000,
-        y: p.total_gpus,
-    }));
+    freeGpusChart.data.datasets[0].data = points(timestamps, series.free_gpus);
+    freeGpusChart.data.datasets[1].data = points(timestamps, series.total_gpus);
     freeGpusChart.update();
 
-    // per-server breakdown (stacked)
-    const serverNames = new Set();
-    series.forEach(p => {
-        Object.keys(p.servers || {}).forEach(s => serverNames.add(s));
-    });
-    const sortedServers = [...serverNames].sort();
-
-    serverBreakdownChart.data.datasets = sortedServers.map((name, i) => ({
+    // per-server breakdown (stacked); hosts arrive sorted by name
+    serverBreakdownChart.data.datasets = series.hosts.map((name, i) => ({
         label: name,
-        data: series.map(p => ({
-            x: p.timestamp * 1000,
-            y: (p.servers[name]?.free_gpus) ?? 0,
-        })),
+        data: points(timestamps, series.host_free_gpus[i].map(v => v ?? 0)),
         borderColor: SERVER_COLORS[i % SERVER_COLORS.length],
         backgroundColor: SERVER_COLORS[i % SERVER_COLORS.length] + '20',
         fill: true,
@@ -204,13 +200,7 @@ export function updateAllCharts(freeGpusChart, serverBreakdownChart, utilization
     serverBreakdownChart.update();
 
     // utilization
-    utilizationChart.data.datasets[0].data = series.map(p => ({
-        x: p.timestamp * 1000,
-        y: p.avg_gpu_util,
-    }));
-    utilizationChart.data.datasets[1].data = series.map(p => ({
-        x: p.timestamp * 1000,
-        y: p.avg_gpu_memory_percent,
-    }));
+    utilizationChart.data.datasets[0].data = points(timestamps, series.avg_gpu_util);
+    utilizationChart.data.datasets[1].data = points(timestamps, series.avg_gpu_memory_percent);
     utilizationChart.update();
 }
@@ -1,4 +1,5 @@
-import { fetchHistoryData } from './api.js';
+import { fetchHistoryData, fetchIdleAllocations } from './api.js';
+import { escapeHtml, formatMemory } from '../dashboard/utils.js';
 import {
     createFreeGpusChart,
     createServerBreakdownChart,
@@ -23,10 +24,13 @@ async function init() {
 }
 
 async function refreshData() {
+    refreshIdleAllocations();
     try {
-        const data = await fetchHistoryData(currentHours);
+        // about one point per pixel of chart width is all a line chart can show
+        const width = document.getElementById('free-gpus-chart').clientWidth;
+        const data = await fetchHistoryData(currentHours, Math.max(200, width));
 
-        if (data.series.length < 2) {
+        if (data.series.timestamps.length < 2) {
             showEmptyState();
             return;
         }
@@ -42,6 +46,61 @@ async function refreshData() {
     }
 }
 
+async function refreshIdleAllocations() {
+    const subtitle = document.getElementById('idle-subtitle');
+    try {
+        const data = await fetchIdleAllocations();
+        updateIdleAllocations(data);
+    } catch (error) {
+        console.error('Failed to fetch idle allocations:', error);
+        subtitle.textContent = 'Failed to load idle allocations.';
+    }
+}
+
+function updateIdleAllocations(data) {
+    const subtitle = document.getElementById('idle-subtitle');
+    const container = document.getElementById('idle-allocations');
+    const threshold = formatIdle(data.threshold_secs);
+    const allocations = data.allocations;
+
+    if (allocations.length === 0) {
+        subtitle.textContent = `Nothing has held GPU memory without computing for over ${threshold}.`;
+        container.innerHTML = '';
+        return;
+    }
+
+    subtitle.textContent =
+        `${allocations.length} processes hold ${formatMemory(data.total_mem_mb)} of GPU memory ` +
+        `on GPUs that have done nothing for over ${threshold}.`;
+
+    const rows = allocations.map(a => `
+        <tr>
+            <td>${escapeHtml(a.hostname)}</td>
+            <td>${a.gpu_index} &middot; ${escapeHtml(a.gpu_name)}</td>
+            <td>${escapeHtml(a.username)}</td>
+            <td>${escapeHtml(a.pid)} ${escapeHtml(a.process_name)}</td>
+            <td>${formatMemory(a.mem_mb)}</td>
+            <td class="idle-duration">${formatIdle(a.idle_secs)}</td>
+        </tr>
+    `).join('');
+
+    container.innerHTML = `
+        <table class="idle-table">
+            <thead>
+                <tr><th>Server</th><th>GPU</th><th>User</th><th>Process</th><th>Memory</th><th>Idle For</th></tr>
+            </thead>
+            <tbody>${rows}</tbody>
+        </table>
+    `;
+}
+
+function formatIdle(secs) {
+    const hours = secs / 3600;
+    if (hours < 1) return `${Math.round(secs / 60)}m`;
+    if (hours < 48) return `${hours.toFixed(1)}h`;
+    return `${Math.round(hours / 24)}d`;
+}
+
 function showEmptyState() {
     document.getElementById('empty-state').style.display = '';
     document.querySelectorAll('.chart-panel').forEach(el => el.style.display = 'none');
@@ -0,0 +1,339 @@
+"""Live dashboard updates and GPU waits, pushed from one event loop.
+
+Waitress is a synchronous WSGI server: a request keeps its worker thread
+until it is answered, so a Server-Sent Events stream or a long poll served
+by waitress would tie up a thread for as long as it stays open. Both are
+instead served by ``PushServer``, a small HTTP server on a port of its own
+whose single asyncio event loop thread keeps every client's socket open and
+writes to them as updates arrive. Waitress only renders the dashboard with
+the push server's address and redirects /api/stream and /api/wait-for-gpus
+there.
+
+Ingest threads call ``notify`` with the new snapshot versions, which wakes
+the loop. Other server processes' ingests don't, so the loop also calls
+``refresh`` (which picks them up and notifies in turn) every ``poll_secs``.
+Payloads are built on the loop thread by the callbacks the app passes in;
+streams at the same version share one body through the response cache.
+Each stream is closed after ``max_secs``; ``EventSource`` reconnects on
+its own and resumes from ``Last-Event-ID``.
+"""
+
+import asyncio
+import json
+import threading
+import time
+from urllib.parse import parse_qsl, urlsplit
+
+from werkzeug.datastructures import MultiDict
+
+_REASONS = {
+    200: "OK",
+    204: "No Content",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    503: "Service Unavailable",
+}
+
+# longest a client may take to send its request line and headers
+_HEADER_TIMEOUT_SECS = 10
+_MAX_HEADER_BYTES = 16 * 1024
+
+
+class PushServer:
+    """
+    Server-Sent Events streams of dashboard updates and /api/wait-for-gpus
+    waits, all on one event loop.
+
+    ``stream_event(since)`` returns ``(version, event)``: the current
+    snapshot version and the SSE message carrying the dashboard payload
+    since ``since`` (0 for a full one). ``find_gpus(args, now)`` returns
+    ``(matched, payload)`` for a wait's query args. ``refresh()`` picks up
+    other processes' ingests. All three are called on the loop thread.
+    """
+    def __init__(self, stream_event, find_gpus, refresh, max_streams, max_secs,
+                 heartbeat_secs, coalesce_secs, max_waiters, wait_max_secs,
+                 recheck_secs, poll_secs=1.0):
+        self.stream_event = stream_event
+        self.find_gpus = find_gpus
+        self.refresh = refresh
+        self.max_streams = max_streams
+        self.max_secs = max_secs
+        self.heartbeat_secs = heartbeat_secs
+        self.coalesce_secs = coalesce_secs
+        self.max_waiters = max_waiters
+        self.wait_max_secs = wait_max_secs
+        self.recheck_secs = recheck_secs
+        self.poll_secs = poll_secs
+        self.port = None
+        self.version = 0
+        self.free_version = 0
+        self.num_streams = 0
+        self.num_waiters = 0
+        self._loop = None
+        # replaced by a fresh one each time they are set, so whoever waits
+        # on the current one wakes once per change
+        self._changed = None
+        self._free_changed = None
+
+    @property
+    def num_clients(self):
+        return self.num_streams + self.num_waiters
+
+    def start(self, host="127.0.0.1", port=0):
+        """
+        Serve on ``host``:``port`` (0 picks a free port) from a daemon
+        thread; returns the port once listening.
+        """
+        listening = threading.Event()
+        errors = []
+
+        def run():
+            try:
+                asyncio.run(self._serve(host, port, listening))
+            except Exception as ex:
+                errors.append(ex)
+                listening.set()
+
+        threading.Thread(target=run, name="push-server", daemon=True).start()
+        listening.wait()
+        if errors:
+            raise errors[0]
+        return self.port
+
+    def notify(self, version, free_version):
+        """
+        Wake the streams behind ``version`` and, if the free GPUs changed
+        (``free_version``), the waiters; safe to call from any thread.
+        """
+        if self._loop is None:
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._wake, version, free_version)
+        except RuntimeError:
+            # the loop has shut down
+            pass
+
+    def _wake(self, version, free_version):
+        if version > self.version:
+            self.version = version
+            changed, self._changed = self._changed, asyncio.Event()
+            changed.set()
+        if free_version > self.free_version:
+            self.free_version = free_version
+            changed, self._free_changed = self._free_changed, asyncio.Event()
+            changed.set()
+
+    async def _serve(self, host, port, listening):
+        self._loop = asyncio.get_running_loop()
+        self._changed = asyncio.Event()
+        self._free_changed = asyncio.Event()
+        server = await asyncio.start_server(
+            self._handle, host, port, limit=_MAX_HEADER_BYTES
+        )
+        self.port = server.sockets[0].getsockname()[1]
+        listening.set()
+        async with server:
+            while True:
+                await asyncio.sleep(self.poll_secs)
+                try:
+                    self.refresh()
+                except Exception as ex:
+                    print(f"Push server refresh error: {ex}")
+
+    async def _handle(self, reader, writer):
+        try:
+            try:
+                head = await asyncio.wait_for(
+                    reader.readuntil(b"\r\n\r\n"), _HEADER_TIMEOUT_SECS
+                )
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                    asyncio.TimeoutError):
+                return
+            request = _parse_head(head)
+            if request is None:
+                await _send_json(writer, 400, "malformed request")
+                return
+            method, path, args, headers = request
+            if method == "OPTIONS":
+                # CORS preflight: the dashboard's page is served by waitress,
+                # on another port, and reconnects with a Last-Event-ID header
+                writer.write(_response_head(204, extra=(
+                    "Access-Control-Allow-Methods: GET",
+                    "Access-Control-Allow-Headers: Last-Event-ID, Cache-Control",
+                    "Access-Control-Max-Age: 86400",
+                )))
+                await writer.drain()
+            elif method != "GET":
+                await _send_json(writer, 405, "only GET is supported")
+            elif path == "/api/stream":
+                await self._stream(reader, writer, args, headers)
+            elif path == "/api/wait-for-gpus":
+                await self._wait_for_gpus(reader, writer, args)
+            else:
+                await _send_json(writer, 404, "not found")
+        except (ConnectionError, asyncio.TimeoutError):
+            # the client went away or stopped reading
+            pass
+        except Exception as ex:
+            print(f"Push server error: {ex}")
+        finally:
+            writer.close()
+
+    async def _stream(self, reader, writer, args, headers):
+        """
+        Send an ``update`` event (a full payload first unless resuming, then
+        deltas) whenever ingests arrive, coalescing bursts. Comment heartbeats
+        keep the connection alive and statuses are refreshed about once a
+        minute even if no host reports.
+        """
+        since = _int(headers.get("last-event-id"))
+        if since is None:
+            since = args.get("since", 0, type=int)
+        if self.num_streams >= self.max_streams:
+            await _send_json(
+                writer, 503, "too many live streams; poll /api/dashboard-data instead"
+            )
+            return
+
+        self.num_streams += 1
+        closed = asyncio.ensure_future(_until_closed(reader))
+        try:
+            started = time.monotonic()
+            version, event = self.stream_event(since)
+            last_sent = time.monotonic()
+            writer.write(_response_head(200, "text/event-stream", ("X-Accel-Buffering: no",)))
+            await self._send(writer, "retry: 5000\n\n" + event)
+
+            while time.monotonic() - started < self.max_secs:
+                if self.version <= version:
+                    if await _wait_any(self._changed, closed, self.heartbeat_secs):
+                        return
+                if self.version > version:
+                    # let a burst of reports land before building the delta
+                    await asyncio.sleep(self.coalesce_secs)
+                elif time.monotonic() - last_sent < 60:
+                    await self._send(writer, ": heartbeat\n\n")
+                    continue
+                version, event = self.stream_event(version)
+                last_sent = time.monotonic()
+                await self._send(writer, event)
+        finally:
+            self.num_streams -= 1
+            closed.cancel()
+
+    async def _wait_for_gpus(self, reader, writer, args):
+        """
+        Answer with the free GPUs matching ``args`` as soon as there are
+        some, or with ``"matched": false`` once ``timeout`` (capped at
+        ``wait_max_secs``) runs out.
+        """
+        if self.num_waiters >= self.max_waiters:
+            await _send_json(writer, 503, "too many waiters; poll /api/free-gpus instead")
+            return
+
+        self.num_waiters += 1
+        closed = asyncio.ensure_future(_until_closed(reader))
+        try:
+            started = time.time()
+            deadline = started + min(args.get("timeout", 60, type=float), self.wait_max_secs)
+            matched, out = self.find_gpus(args, started)
+            while not matched:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                # recheck now and then even without a wakeup: free memory
+                # changing on GPUs that stay free doesn't move free_version
+                if await _wait_any(
+                    self._free_changed, closed, min(remaining, self.recheck_secs)
+                ):
+                    return
+                matched, out = self.find_gpus(args, time.time())
+            out["matched"] = matched
+            out["waited_secs"] = round(time.time() - started, 3)
+            await _send_json(writer, 200, out)
+        finally:
+            self.num_waiters -= 1
+            closed.cancel()
+
+    async def _send(self, writer, text):
+        writer.write(text.encode())
+        # a client that stops reading is dropped rather than buffered for
+        await asyncio.wait_for(writer.drain(), self.heartbeat_secs)
+
+
+def _parse_head(head):
+    """``(method, path, args, headers)`` of a request head, or None if malformed."""
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, _version = lines[0].split(" ")
+    except ValueError:
+        return None
+    headers = {}
+    for line in lines[1:]:
+        name, sep, value = line.partition(":")
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+    url = urlsplit(target)
+    return method, url.path, MultiDict(parse_qsl(url.query)), headers
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _response_head(status, content_type=None, extra=()):
+    lines = [
+        f"HTTP/1.1 {status} {_REASONS[status]}",
+        "Access-Control-Allow-Origin: *",
+        "Cache-Control: no-cache",
+        "Connection: close",
+    ]
+    if content_type is not None:
+        lines.append(f"Content-Type: {content_type}")
+    lines.extend(extra)
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+async def _send_json(writer, status, body):
+    """Send ``body`` (a dict, or an error message) as the whole response."""
+    if isinstance(body, str):
+        body = {"success": False, "msg": body}
+    data = json.dumps(body, separators=(",", ":")).encode()
+    writer.write(
+        _response_head(status, "application/json", (f"Content-Length: {len(data)}",))
+        + data
+    )
+    await writer.drain()
+
+
+async def _until_closed(reader):
+    """Finishes once the client closes its end (requests have no body to read)."""
+    while await reader.read(4096):
+        pass
+
+
+async def _wait_any(event, closed, timeout):
+    """Wait for ``event`` or ``timeout``; True if the client went away first."""
+    waiter = asyncio.ensure_future(event.wait())
+    try:
+        await asyncio.wait(
+            (waiter, closed), timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+        )
+    finally:
+        waiter.cancel()
+    return closed.done()
+
+
+def format_event(data, event=None, event_id=None):
+    """Encode one SSE message."""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event is not None:
+        lines.append(f"event: {event}")
+    lines.extend(f"data: {line}" for line in data.split("\n"))
+    return "\n".join(lines) + "\n\n"
@@ -0,0 +1,135 @@
+"""Per-user GPU-hour accounting, accumulated at ingest.
+
+Every report carries who has processes on which GPU. Between two consecutive
+reports from a host, each user on the earlier report is credited with the
+elapsed time once per GPU they hold (GPU-seconds) and scaled by the memory
+their processes hold (GB-seconds). Totals are added into per-day, per-host,
+per-user rows of ``user_usage_daily`` in the history partitions, so range
+queries only sum a handful of rows per user and day.
+
+Gaps longer than ``max_gap_secs`` (a host or the server was down) are only
+credited up to that long, since nobody knows what ran in between. The
+previous report survives server restarts in the latest-state store.
+"""
+
+import time
+
+from . import history
+from . import metrics
+
+DAY_SECS = 86400
+
+
+def usage_increments(previous, state, max_gap_secs):
+    """
+    ``{(day, username): (gpu_seconds, gpu_mem_gb_seconds)}`` for the interval
+    between ``previous`` and ``state`` (two reports of one host), split at UTC
+    midnights.
+    """
+    start = previous.received_timestamp
+    end = min(state.received_timestamp, start + max_gap_secs)
+    if end <= start:
+        return {}
+
+    # what ran over the interval is what the earlier report saw
+    held = {}
+    for gpu in previous.gpus:
+        for username, processes in gpu.users.items():
+            mem_mb = sum((proc.get("mem") or 0) for proc in processes.values())
+            totals = held.setdefault(username, [0, 0.0])
+            totals[0] += 1
+            totals[1] += mem_mb / 1024
+
+    increments = {}
+    if not held:
+        return increments
+    t = start
+    while t < end:
+        day = int(t // DAY_SECS) * DAY_SECS
+        chunk_end = min(end, day + DAY_SECS)
+        elapsed = chunk_end - t
+        for username, (num_gpus, mem_gb) in held.items():
+            increments[(day, username)] = (num_gpus * elapsed, mem_gb * elapsed)
+        t = chunk_end
+    return increments
+
+
+def record_usage(previous, state, max_gap_secs):
+    """Add the usage between two reports of a host into the daily totals."""
+    if previous is None:
+        return
+    increments = usage_increments(previous, state, max_gap_secs)
+    if not increments:
+        return
+
+    host_id = history.intern_host(state.hostname)
+    rows = [
+        (day, host_id, history.intern_user(username), gpu_seconds, gb_seconds)
+        for (day, username), (gpu_seconds, gb_seconds) in increments.items()
+    ]
+    with metrics.SQLITE_SECONDS.time(op="usage_write"):
+        history.write_rows({"user_usage_daily": rows})
+
+
+def query_usage_by_user(start, end=None, hostname=None, by_day=False):
+    """
+    Per-user GPU-hours and GPU-memory GB-hours over the whole UTC days
+    overlapping ``[start, end)``, most GPU-hours first, optionally for one
+    host and with a per-day breakdown.
+    """
+    if end is None:
+        end = time.time()
+    start = int(start // DAY_SECS) * DAY_SECS
+    end = -int(-end // DAY_SECS) * DAY_SECS
+
+    def build(schemas):
+        params = [start, end] * len(schemas)
+        host_filter = ""
+        if hostname is not None:
+            host_filter = "WHERE h.hostname = ?"
+            params.append(hostname)
+        days = history.union_sql(
+            schemas, "user_usage_daily",
+            "timestamp, host_id, user_id, gpu_seconds, gpu_mem_gb_seconds",
+            "timestamp >= ? AND timestamp < ?",
+        )
+        return (
+            f"""SELECT u.username, d.timestamp AS day,
+                       SUM(d.gpu_seconds) AS gpu_seconds,
+                       SUM(d.gpu_mem_gb_seconds) AS gpu_mem_gb_seconds
+                FROM ({days}) d
+                JOIN users u ON u.id = d.user_id
+                JOIN hosts h ON h.id = d.host_id
+                {host_filter}
+                GROUP BY d.user_id, d.timestamp""",
+            params,
+        )
+
+    with metrics.SQLITE_SECONDS.time(op="usage_query"):
+        rows = history.query_partitions(start, end, build)
+
+    users = {}
+    for row in rows:
+        user = users.setdefault(row["username"], {
+            "gpu_hours": 0,
+            "gpu_mem_gb_hours": 0,
+            "days": {},
+        })
+        gpu_hours = row["gpu_seconds"] / 3600
+        gb_hours = row["gpu_mem_gb_seconds"] / 3600
+        user["gpu_hours"] += gpu_hours
+        user["gpu_mem_gb_hours"] += gb_hours
+        user["days"][row["day"]] = {
+            "gpu_hours": round(gpu_hours, 3),
+            "gpu_mem_gb_hours": round(gb_hours, 3),
+        }
+
+    out = {}
+    for username, user in sorted(users.items(), key=lambda item: -item[1]["gpu_hours"]):
+        out[username] = {
+            "gpu_hours": round(user["gpu_hours"], 3),
+            "gpu_mem_gb_hours": round(user["gpu_mem_gb_hours"], 3),
+        }
+        if by_day:
+            out[username]["days"] = dict(sorted(user["days"].items()))
+    return {"start": start, "end": end, "users": out}
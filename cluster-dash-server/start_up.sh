@@ -1,4 +1,4 @@
 #!/usr/bin/env bash
 source activate cluster-dash-server
 export PYTHONPATH=${PYTHONPATH}:$(pwd)
-waitress-serve --host 0.0.0.0 --call cluster_dash_server:create_app
\ No newline at end of file
+python -m cluster_dash_server.serve --host 0.0.0.0 --port 8080
\ No newline at end of file
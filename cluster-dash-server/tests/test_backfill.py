@@ -0,0 +1,73 @@
+import json
+
+from cluster_dash_server import backfill, create_app, history
+
+
+def make_app(instance_path):
+    return create_app(
+        {"TESTING": True, "HISTORY_RETENTION_ENABLED": False},
+        instance_path=str(instance_path),
+    )
+
+
+def reports():
+    out = []
+    for i, hostname in enumerate(("host1", "host2")):
+        with open("etc/example_data1.json") as f:
+            data = json.load(f)
+        data["hostname"] = hostname
+        data["auth_code"] = "pass"
+        for gpu in data["gpu"].values():
+            gpu["uuid"] += f"-{hostname}"
+        gpu = list(data["gpu"].values())[i]
+        gpu["users"] = {"alice": {"123": {"mem": 2048, "time": 10}}}
+        gpu["used_mem"] += 2048
+        out.append(data)
+    return out
+
+
+def stored_history():
+    """Every stored snapshot and sample, by name rather than id and without timestamps."""
+    def build(schemas):
+        snapshots = history.union_sql(schemas, "gpu_snapshots", history._SNAPSHOT_COLUMNS, "1")
+        samples = history.union_sql(
+            schemas, "gpu_samples",
+            "gpu_id, used_mem_mb, gpu_util, memory_util, gpu_index", "1",
+        )
+        user_samples = history.union_sql(
+            schemas, "gpu_user_samples", "gpu_id, user_id, used_mem_mb, num_procs", "1",
+        )
+        return (
+            f"""SELECT 'snapshot', hostname, total_gpus, free_gpus,
+                       avg_gpu_memory_percent, avg_gpu_util, cpu_percent
+                FROM ({snapshots})
+                UNION ALL
+                SELECT 'gpu', h.hostname, g.uuid, g.name, g.total_mem_mb,
+                       s.used_mem_mb, s.gpu_util || ' ' || s.memory_util || ' ' || s.gpu_index
+                FROM ({samples}) s
+                JOIN gpus g ON g.id = s.gpu_id JOIN hosts h ON h.id = g.host_id
+                UNION ALL
+                SELECT 'user', h.hostname, g.uuid, u.username, s.used_mem_mb, s.num_procs, NULL
+                FROM ({user_samples}) s
+                JOIN gpus g ON g.id = s.gpu_id JOIN hosts h ON h.id = g.host_id
+                JOIN users u ON u.id = s.user_id""",
+            [],
+        )
+    return sorted(tuple(row) for row in history.query_partitions(0, None, build))
+
+
+def test_backfill_stores_what_ingest_does(tmp_path):
+    client = make_app(tmp_path / "live").test_client()
+    for report in reports():
+        assert client.post("/", json=report).status_code == 200
+    live = stored_history()
+
+    path = tmp_path / "reports.ndjson"
+    path.write_text("".join(json.dumps(report) + "\n" for report in reports()))
+    make_app(tmp_path / "backfilled")
+    totals = backfill.run([str(path)])
+    assert totals["rejected"] == 0
+    loaded = stored_history()
+
+    assert len(live) == 2 + 4 + 2
+    assert loaded == live
@@ -0,0 +1,93 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from cluster_dash_server import create_app, response_cache
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    # hold the cache's freshness window still, so only ingests change ETags
+    monkeypatch.setattr(response_cache, "time", SimpleNamespace(time=lambda: 1e9))
+    return create_app(
+        {"TESTING": True, "HISTORY_RETENTION_ENABLED": False},
+        instance_path=str(tmp_path / "instance"),
+    ).test_client()
+
+
+def report(hostname="molgpu02"):
+    with open("etc/example_data1.json") as f:
+        data = json.load(f)
+    data["hostname"] = hostname
+    data["auth_code"] = "pass"
+    return data
+
+
+@pytest.mark.parametrize("path", ["/api/dashboard-data", "/api/gpu-summary"])
+def test_unchanged_responses_revalidate_with_304(client, path):
+    assert client.post("/", json=report()).status_code == 200
+    first = client.get(path)
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+    assert first.headers["Cache-Control"] == "no-cache"
+
+    again = client.get(path, headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.data == b""
+    assert again.headers["ETag"] == etag
+
+    # a report comes in: the old ETag no longer matches
+    assert client.post("/", json=report("molgpu03")).status_code == 200
+    changed = client.get(path, headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert b"molgpu03" in changed.data
+
+
+def test_since_sends_only_hosts_that_reported_after(client):
+    for hostname in ("molgpu02", "molgpu03"):
+        assert client.post("/", json=report(hostname)).status_code == 200
+    full = client.get("/api/dashboard-data").get_json()
+    assert full["full"]
+    assert sorted(full["servers"]) == ["molgpu02", "molgpu03"]
+    assert "statuses" not in full
+
+    assert client.post("/", json=report("molgpu03")).status_code == 200
+    delta = client.get(f"/api/dashboard-data?since={full['version']}").get_json()
+    assert not delta["full"]
+    assert delta["version"] > full["version"]
+    assert list(delta["servers"]) == ["molgpu03"]
+    assert delta["servers"]["molgpu03"]["gpus"] == full["servers"]["molgpu03"]["gpus"]
+    # every host's status, so the client can spot hosts going offline
+    assert {name: status["status"] for name, status in delta["statuses"].items()} == {
+        "molgpu02": "online", "molgpu03": "online",
+    }
+
+    unchanged = client.get(f"/api/dashboard-data?since={delta['version']}").get_json()
+    assert unchanged["servers"] == {}
+    # a version from before a restart gets everything
+    restarted = client.get(f"/api/dashboard-data?since={delta['version'] + 100}").get_json()
+    assert restarted["full"]
+    assert sorted(restarted["servers"]) == ["molgpu02", "molgpu03"]
+
+
+def test_every_endpoint_reports_the_same_host_summary(client):
+    data = report()
+    busy = data["gpu"]["0_NVIDIA-GeForce-RTX-3090_66667c"]
+    busy.update(used_mem=busy["total_mem"] / 2, gpu_util=90)
+    assert client.post("/", json=data).status_code == 200
+
+    summary = client.get("/api/dashboard-data").get_json()["servers"]["molgpu02"]["summary"]
+    assert summary == {
+        "total_gpus": 2, "free_gpus": 1, "avg_gpu_memory_percent": 25, "avg_gpu_util": 45,
+    }
+    line = client.get("/api/gpu-summary").get_data(as_text=True).splitlines()[1]
+    assert line.startswith("molgpu02\t2\t1\t")
+    # GPU memory and CPU
+    assert "25%" in line and "44%" in line
+
+    (bucket,) = client.get("/api/history-data?hours=1").get_json()["series"]
+    assert bucket["servers"]["molgpu02"] == {"total_gpus": 2, "free_gpus": 1, "avg_gpu_util": 45}
+    free = client.get("/api/free-gpus").get_json()
+    assert [gpu["index"] for host in free["hosts"] for gpu in host["gpus"]] == [1]
@@ -0,0 +1,50 @@
+import json
+
+from cluster_dash_server import create_app
+
+
+def report(hostname, model="NVIDIA GeForce RTX 3090", busy=()):
+    with open("etc/example_data1.json") as f:
+        data = json.load(f)
+    data["hostname"] = hostname
+    data["auth_code"] = "pass"
+    for gpu in data["gpu"].values():
+        gpu["uuid"] += f"-{hostname}"
+        gpu["name"] = model
+        if gpu["index"] in busy:
+            gpu.update(used_mem=gpu["total_mem"] * 0.9, gpu_util=95)
+    return data
+
+
+def found(client, query=""):
+    out = client.get(f"/api/free-gpus?{query}").get_json()
+    assert out["total"] == sum(len(host["gpus"]) for host in out["hosts"])
+    return [(host["hostname"], [gpu["index"] for gpu in host["gpus"]]) for host in out["hosts"]]
+
+
+def test_free_gpus_follow_each_report(tmp_path):
+    client = create_app(
+        {"TESTING": True, "HISTORY_RETENTION_ENABLED": False},
+        instance_path=str(tmp_path / "instance"),
+    ).test_client()
+    assert found(client) == []
+    for data in (
+        report("a"),
+        report("b", model="NVIDIA A100", busy=(0,)),
+        report("c", busy=(0, 1)),
+    ):
+        assert client.post("/", json=data).status_code == 200
+
+    # hosts with the most matching GPUs first
+    assert found(client) == [("a", [0, 1]), ("b", [1])]
+    assert found(client, "model=a100") == [("b", [1])]
+    assert found(client, "model=3090&count=2") == [("a", [0, 1])]
+    assert found(client, "min_free_mem_mb=24000") == [("a", [0, 1]), ("b", [1])]
+    assert found(client, "min_free_mem_mb=25000") == []
+    assert found(client, "max_age_secs=-1") == []
+
+    # reports move GPUs in and out of the index
+    assert client.post("/", json=report("a", busy=(1,))).status_code == 200
+    assert client.post("/", json=report("c")).status_code == 200
+    assert found(client) == [("c", [0, 1]), ("a", [0]), ("b", [1])]
+    assert found(client, "model=3090&count=2") == [("c", [0, 1])]
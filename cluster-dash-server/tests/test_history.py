@@ -0,0 +1,49 @@
+import json
+import sqlite3
+import time
+
+from cluster_dash_server import create_app, history
+from cluster_dash_server.host_state import HostState
+
+
+def make_app(instance_path):
+    return create_app(
+        {"TESTING": True, "HISTORY_RETENTION_ENABLED": False},
+        instance_path=str(instance_path),
+    )
+
+
+def report(hostname="host1"):
+    with open("etc/example_data1.json") as f:
+        data = json.load(f)
+    data["hostname"] = hostname
+    data["auth_code"] = "pass"
+    return data
+
+
+def test_second_instance_gets_its_own_gpu_history(tmp_path):
+    for instance in ("a", "b"):
+        client = make_app(tmp_path / instance).test_client()
+        assert client.post("/", json=report()).status_code == 200
+        gpus = client.get("/api/gpu-history").get_json()["gpus"]
+        assert len(gpus) == len(report()["gpu"]), instance
+
+
+def test_gpu_moved_to_another_slot_keeps_its_id(tmp_path):
+    client = make_app(tmp_path / "instance").test_client()
+    data = report()
+    data.pop("auth_code")
+    data["received_timestamp"] = now = time.time()
+    history.write_rows(history.snapshot_rows(now, HostState(data)))
+
+    # swap the first two GPUs' slots a second later, in the same time bucket
+    first, second = list(data["gpu"].values())[:2]
+    first["index"], second["index"] = second["index"], first["index"]
+    history.write_rows(history.snapshot_rows(now + 1, HostState(data)))
+
+    with sqlite3.connect(history.get_db_path()) as conn:
+        num_gpus = conn.execute("SELECT COUNT(*) FROM gpus").fetchone()[0]
+    assert num_gpus == len(data["gpu"])
+    gpus = client.get("/api/gpu-history").get_json()["gpus"]
+    assert gpus[first["uuid"]]["index"] == first["index"]
+    assert gpus[second["uuid"]]["index"] == second["index"]
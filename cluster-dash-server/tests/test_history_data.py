@@ -0,0 +1,126 @@
+import json
+import time
+
+from cluster_dash_server import backfill, create_app, history
+from cluster_dash_server.host_state import HostState
+
+# yesterday midnight; buckets this old are closed
+START = (int(time.time()) // 86400 - 1) * 86400
+STEPS = 12
+
+
+def make_client(tmp_path, **config):
+    return create_app(
+        {"TESTING": True, "HISTORY_RETENTION_ENABLED": False, **config},
+        instance_path=str(tmp_path / "instance"),
+    ).test_client()
+
+
+def record(hostname, timestamp, busy=()):
+    with open("etc/example_data1.json") as f:
+        data = json.load(f)
+    data["hostname"] = hostname
+    data["received_timestamp"] = timestamp
+    for gpu in data["gpu"].values():
+        gpu["uuid"] += f"-{hostname}"
+        if gpu["index"] in busy:
+            gpu.update(used_mem=gpu["total_mem"] / 2, gpu_util=90)
+    history.write_rows(history.snapshot_rows(timestamp, HostState(data)))
+
+
+def record_fleet():
+    """host1 every 5 minutes, all free; host2 every other time, one GPU busy."""
+    for step in range(STEPS):
+        record("host1", START + step * 300)
+        if step % 2 == 0:
+            record("host2", START + step * 300, busy=(0,))
+
+
+def history_data(client, query):
+    response = client.get(f"/api/history-data?start={START}&end={START + STEPS * 300}&{query}")
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_columns_match_the_per_bucket_series(tmp_path):
+    client = make_client(tmp_path)
+    record_fleet()
+
+    columns = history_data(client, "format=columns")["series"]
+    assert columns["bucket_secs"] == 300
+    assert columns["timestamps"] == [START + step * 300 for step in range(STEPS)]
+    assert columns["hosts"] == ["host1", "host2"]
+    assert columns["total_gpus"] == [4, 2] * (STEPS // 2)
+    assert columns["free_gpus"] == [3, 2] * (STEPS // 2)
+    assert columns["host_free_gpus"] == [[2] * STEPS, [1, None] * (STEPS // 2)]
+    assert columns["host_avg_gpu_util"][1][:2] == [45.0, None]
+
+    series = history_data(client, "")["series"]
+    assert len(series) == STEPS
+    for i, bucket in enumerate(series):
+        assert bucket["timestamp"] == columns["timestamps"][i]
+        for metric in ("total_gpus", "free_gpus", "avg_gpu_util", "avg_gpu_memory_percent"):
+            assert bucket[metric] == columns[metric][i]
+        for h, hostname in enumerate(columns["hosts"]):
+            if columns["host_free_gpus"][h][i] is None:
+                assert hostname not in bucket["servers"]
+            else:
+                assert bucket["servers"][hostname] == {
+                    "total_gpus": columns["host_total_gpus"][h][i],
+                    "free_gpus": columns["host_free_gpus"][h][i],
+                    "avg_gpu_util": columns["host_avg_gpu_util"][h][i],
+                }
+
+
+def test_downsampled_columns_stay_aligned(tmp_path):
+    client = make_client(tmp_path)
+    record_fleet()
+
+    columns = history_data(client, "format=columns&max_points=10")["series"]
+    timestamps = columns["timestamps"]
+    assert 2 < len(timestamps) <= 10
+    assert timestamps[0] == START and timestamps[-1] == START + (STEPS - 1) * 300
+    for metric in ("total_gpus", "free_gpus", "avg_gpu_util", "avg_gpu_memory_percent"):
+        assert len(columns[metric]) == len(timestamps)
+    for per_host in (columns["host_total_gpus"], columns["host_free_gpus"]):
+        assert [len(values) for values in per_host] == [len(timestamps)] * 2
+    for i, ts in enumerate(timestamps):
+        step = (ts - START) // 300
+        assert columns["free_gpus"][i] == (3 if step % 2 == 0 else 2)
+        assert columns["host_free_gpus"][1][i] == (1 if step % 2 == 0 else None)
+
+
+def test_cached_buckets_are_dropped_when_history_is_rewritten(tmp_path):
+    client = make_client(tmp_path, HISTORY_CACHE_PERSIST=True)
+    record_fleet()
+    before = history_data(client, "format=columns")
+    assert before["stats"]["peak_free_gpus"] == 3
+
+    # rows slipped in behind the cache's back don't show: closed buckets
+    # are served from it
+    record("host3", START)
+    stale = history_data(client, "format=columns")
+    assert (stale["series"], stale["stats"]) == (before["series"], before["stats"])
+    history.invalidate_cached_buckets(START, START + 300)
+    after = history_data(client, "format=columns")
+    assert after["series"]["hosts"] == ["host1", "host2", "host3"]
+    assert after["series"]["total_gpus"][:2] == [6, 2]
+    assert after["stats"]["peak_free_gpus"] == 5
+
+    # a restarted server starts from the cache on disk
+    record("host4", START + 600)
+    client = make_client(tmp_path, HISTORY_CACHE_PERSIST=True)
+    assert "host4" not in history_data(client, "format=columns")["series"]["hosts"]
+
+    # a backfill drops the buckets it loaded into, on disk too
+    with open("etc/example_data1.json") as f:
+        data = json.load(f)
+    data.update(hostname="host5", timestamp=START + 900)
+    path = tmp_path / "reports.ndjson"
+    path.write_text(json.dumps(data) + "\n")
+    assert backfill.run([str(path)])["rows"] > 0
+    series = history_data(client, "format=columns")["series"]
+    assert series["hosts"] == ["host1", "host2", "host3", "host5"]
+    assert series["total_gpus"][3] == 4
+    client = make_client(tmp_path, HISTORY_CACHE_PERSIST=True)
+    assert history_data(client, "format=columns")["series"] == series
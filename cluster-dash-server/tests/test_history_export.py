@@ -0,0 +1,79 @@
+import csv
+import io
+import json
+import time
+
+from cluster_dash_server import create_app, history
+from cluster_dash_server.host_state import HostState
+
+# yesterday midnight, so exports up to now include it all
+START = (int(time.time()) // 86400 - 1) * 86400
+
+
+def make_client(tmp_path):
+    return create_app(
+        {"TESTING": True, "HISTORY_RETENTION_ENABLED": False},
+        instance_path=str(tmp_path / "instance"),
+    ).test_client()
+
+
+def record(hostname, timestamp):
+    with open("etc/example_data1.json") as f:
+        data = json.load(f)
+    data["hostname"] = hostname
+    data["received_timestamp"] = timestamp
+    for gpu in data["gpu"].values():
+        gpu["uuid"] += f"-{hostname}"
+    history.write_rows(history.snapshot_rows(timestamp, HostState(data)))
+
+
+def export(client, query):
+    """The CSV and NDJSON exports for ``query``, as lists of string dicts."""
+    out = []
+    for fmt in ("csv", "ndjson"):
+        response = client.get(f"/api/history/export?format={fmt}&{query}")
+        assert response.status_code == 200
+        text = response.get_data(as_text=True)
+        if fmt == "csv":
+            assert response.mimetype == "text/csv"
+            out.append(list(csv.DictReader(io.StringIO(text))))
+        else:
+            assert response.mimetype == "application/x-ndjson"
+            out.append([
+                {k: "" if v is None else str(v) for k, v in json.loads(line).items()}
+                for line in text.splitlines()
+            ])
+    return out
+
+
+def test_csv_and_ndjson_exports_match(tmp_path):
+    client = make_client(tmp_path)
+    for step in range(3):
+        for hostname in ("host1", "host2"):
+            record(hostname, START + step * 300)
+
+    rows, ndjson_rows = export(client, f"kind=hosts&start={START + 300}&end={START + 900}")
+    assert rows == ndjson_rows
+    assert [(row["timestamp"], row["hostname"]) for row in rows] == [
+        (str(float(START + step * 300)), hostname)
+        for step in (1, 2)
+        for hostname in ("host1", "host2")
+    ]
+    assert list(rows[0]) == list(history.EXPORT_COLUMNS["hosts"])
+    assert rows[0]["total_gpus"] == "2" and rows[0]["free_gpus"] == "2"
+
+    rows, ndjson_rows = export(client, "kind=gpus&hostname=host2")
+    assert rows == ndjson_rows
+    assert len(rows) == 3 * 2
+    assert {row["hostname"] for row in rows} == {"host2"}
+    assert sorted({row["gpu_index"] for row in rows}) == ["0", "1"]
+    assert all(row["uuid"].endswith("-host2") for row in rows)
+
+
+def test_empty_export_is_just_the_header(tmp_path):
+    client = make_client(tmp_path)
+    response = client.get("/api/history/export?format=csv")
+    assert response.get_data(as_text=True).strip() == ",".join(history.EXPORT_COLUMNS["hosts"])
+    assert client.get("/api/history/export?format=ndjson").data == b""
+    assert client.get("/api/history/export?format=xml").status_code == 400
+    assert client.get("/api/history/export?kind=users").status_code == 400
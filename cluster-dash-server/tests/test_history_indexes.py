@@ -0,0 +1,41 @@
+import time
+
+import pytest
+
+from cluster_dash_server import create_app, history
+
+PLAN_INDEXES = {
+    "gpu_snapshots": "idx_snapshots_host_time",
+    "gpu_snapshots_hourly": "idx_snapshots_hourly_host_time",
+    "gpu_snapshots_daily": "idx_snapshots_daily_host_time",
+}
+
+
+@pytest.mark.parametrize("days", [1, 40])
+def test_host_history_searches_covering_indexes(tmp_path, days):
+    create_app(
+        {"PASSCODE": "test", "HISTORY_RETENTION_ENABLED": False},
+        instance_path=str(tmp_path / "instance"),
+    )
+    end = time.time()
+    start = end - days * 86400
+    # one partition per month the range touches
+    for ts in range(int(start), int(end) + 86400, 86400):
+        history.ensure_partition(history.partition_name(ts))
+
+    names = history.partitions_for_range(start, end)[:history._MAX_ATTACHED]
+    with history._attached(names) as (conn, schemas):
+        params = (3600, 3600) + ("host0000", start, end) * (history._TIER_ARMS * len(schemas))
+        plan = [
+            row[-1] for row in
+            conn.execute("EXPLAIN QUERY PLAN " + history.host_history_sql(schemas), params)
+        ]
+
+    searches = [line for line in plan if line.startswith(("SCAN", "SEARCH"))]
+    for table, index in PLAN_INDEXES.items():
+        # "SEARCH <table> ..." (or "<schema>.<table>" in some SQLite versions)
+        lines = [line for line in searches if line.split()[1].split(".")[-1] == table]
+        # once per attached month
+        assert len(lines) == len(schemas), plan
+        for line in lines:
+            assert f"USING COVERING INDEX {index} (hostname=? AND timestamp>? AND timestamp<?)" in line, line
@@ -0,0 +1,23 @@
+from cluster_dash_server import create_app, host_events
+from cluster_dash_server.host_events import OFFLINE, ONLINE, StatusChange
+
+
+def test_each_change_is_recorded_once(tmp_path):
+    create_app(
+        {"TESTING": True, "HISTORY_RETENTION_ENABLED": False},
+        instance_path=str(tmp_path / "instance"),
+    )
+    online = StatusChange("host1", ONLINE, 1000.0, 1000.0)
+    offline = StatusChange("host1", OFFLINE, 1300.0, 1000.0)
+
+    assert host_events.record_event(online)
+    # another process recording the same change
+    assert not host_events.record_event(online)
+    assert host_events.record_event(offline)
+    assert not host_events.record_event(StatusChange("host1", OFFLINE, 1310.0, 1000.0))
+
+    assert host_events.latest_statuses() == {"host1": (OFFLINE, 1000.0)}
+    out = host_events.query_events(0, 2000)
+    assert [(event["status"], event["timestamp"]) for event in out["events"]] == [
+        (ONLINE, 1000.0), (OFFLINE, 1300.0),
+    ]
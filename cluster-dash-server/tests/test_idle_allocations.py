@@ -0,0 +1,50 @@
+from cluster_dash_server.host_state import HostState
+from cluster_dash_server.idle_allocations import IdleAllocationTracker
+
+
+def make_state(received_timestamp, proc_time, gpu_util=0, mem=2048):
+    return HostState({
+        "hostname": "h1",
+        "received_timestamp": received_timestamp,
+        "cpu": {"cpu_percent": 10, "num_cpus": 8},
+        "gpu": {
+            "0_NVIDIA-GeForce-RTX-3090_aaaaaa": {
+                "name": "NVIDIA GeForce RTX 3090",
+                "uuid": "GPU-aaaaaa",
+                "index": 0,
+                "total_mem": 24576,
+                "used_mem": mem,
+                "users": {"alice": {"1234": {"mem": mem, "time": proc_time, "name": "python"}}},
+                "gpu_util": gpu_util,
+                "memory_util": 0,
+            },
+        },
+    })
+
+
+def make_tracker():
+    return IdleAllocationTracker(threshold_secs=600, max_gpu_util=5, min_mem_mb=1024,
+                                 stale_secs=3600, max_allocations=100)
+
+
+def test_unchanged_gpus_are_skipped(monkeypatch):
+    tracker = make_tracker()
+    updated = []
+    update_gpu = tracker._update_gpu
+    monkeypatch.setattr(tracker, "_update_gpu",
+                        lambda host, gpu, timestamp: (updated.append(timestamp),
+                                                      update_gpu(host, gpu, timestamp)))
+
+    tracker.update(make_state(1000, proc_time=10))
+    # only the process's running time moved on
+    tracker.update(make_state(1300, proc_time=310))
+    tracker.update(make_state(1700, proc_time=710))
+    assert updated == [1000]
+    [(_, last_seen, allocation)] = tracker.flagged(now=1700)
+    assert last_seen == 1700 and allocation.idle_since == 1000
+
+    # memory changes and busy GPUs are still picked up
+    tracker.update(make_state(1800, proc_time=810, mem=4096))
+    tracker.update(make_state(1900, proc_time=910, mem=4096, gpu_util=90))
+    assert updated == [1000, 1800, 1900]
+    assert tracker.flagged(now=1900, min_idle_secs=0) == []
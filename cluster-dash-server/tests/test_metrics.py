@@ -0,0 +1,57 @@
+import json
+
+from cluster_dash_server import create_app
+
+
+def report(auth_code="pass"):
+    with open("etc/example_data1.json") as f:
+        data = json.load(f)
+    data["auth_code"] = auth_code
+    return data
+
+
+def scrape(client):
+    """The /metrics samples as ``{'name{labels}': value}``."""
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    samples = {}
+    for line in response.get_data(as_text=True).splitlines():
+        if line and not line.startswith("#"):
+            sample, value = line.rsplit(" ", 1)
+            samples[sample] = float(value)
+    return samples
+
+
+def test_metrics_count_ingests_requests_and_state(tmp_path):
+    client = create_app(
+        {"TESTING": True, "HISTORY_RETENTION_ENABLED": False},
+        instance_path=str(tmp_path / "instance"),
+    ).test_client()
+    # metrics are process-wide, so compare against what earlier tests left
+    before = scrape(client)
+
+    assert client.post("/", json=report()).status_code == 200
+    assert client.post("/", json=report("wrong")).status_code == 400
+    assert client.get("/api/gpu-summary").status_code == 200
+    after = scrape(client)
+
+    def added(sample):
+        return after.get(sample, 0) - before.get(sample, 0)
+
+    assert added('cluster_dash_ingest_reports_total{hostname="molgpu02"}') == 1
+    assert added('cluster_dash_ingest_rejected_total{reason="auth"}') == 1
+    assert added(
+        'cluster_dash_request_seconds_count{method="GET",route="/api/gpu-summary",status="200"}'
+    ) == 1
+    assert added(
+        'cluster_dash_request_seconds_count{method="POST",route="/",status="400"}'
+    ) == 1
+    for stage in ("parse", "validate", "publish", "history"):
+        assert added(f'cluster_dash_ingest_stage_seconds_count{{stage="{stage}"}}') >= 1
+    assert added('cluster_dash_sqlite_seconds_count{op="history_write"}') >= 1
+
+    # gauges are read at scrape time
+    assert after["cluster_dash_state_hosts"] == 1
+    assert after["cluster_dash_state_gpus"] == 2
+    assert after['cluster_dash_db_size_bytes{db="history"}'] > 0
@@ -0,0 +1,17 @@
+import time
+
+import flask
+
+from cluster_dash_server.profiling import Profiler
+
+
+def test_captures_in_the_same_second_keep_their_own_files(tmp_path):
+    profiler = Profiler(flask.Flask(__name__), str(tmp_path), max_secs=5)
+    names = []
+    for _ in range(3):
+        names.append(profiler.start("sample", 0.1))
+        while profiler.status()["running"] is not None:
+            time.sleep(0.01)
+
+    assert len(set(names)) == 3
+    assert profiler.files() == names[::-1]
@@ -0,0 +1,62 @@
+import json
+
+from cluster_dash_server import create_app
+from cluster_dash_server.report_hints import ReportPacer
+
+
+def make_pacer(**limits):
+    return ReportPacer(**{
+        "idle_secs": 300,
+        "live_secs": 30,
+        "max_secs": 540,
+        "max_reports_per_sec": 50,
+        "max_in_flight": 2,
+        "viewer_secs": 90,
+        **limits,
+    })
+
+
+def test_a_poll_speeds_reports_up_for_a_while():
+    pacer = make_pacer()
+    assert pacer.interval(1000)[0] == 300
+    assert pacer.interval(1000, live_viewers=1)[0] == 30
+
+    pacer.viewer_seen(1000)
+    assert pacer.interval(1000)[0] == 30
+    assert pacer.interval(1045)[0] == 165
+    assert pacer.interval(1090)[0] == 300
+
+
+def test_fleet_stays_under_the_rate_limit():
+    pacer = make_pacer(max_reports_per_sec=10)
+    assert pacer.interval(1000, live_viewers=3, num_hosts=100)[0] == 30
+    assert pacer.interval(1000, live_viewers=3, num_hosts=1000)[0] == 100
+    assert pacer.interval(1000, num_hosts=10000)[0] == 540
+
+
+def test_caller_is_not_counted_in_flight():
+    pacer = make_pacer(max_in_flight=1, rate_window_secs=1e9)
+    with pacer.ingest(), pacer.ingest():
+        # just the one other ingest allowed
+        assert pacer.hints(1000) == {"next_report_secs": 300, "backoff_secs": 0}
+        with pacer.ingest():
+            assert pacer.hints(1000)["next_report_secs"] == 540
+    # /metrics asks from outside any ingest
+    with pacer.ingest():
+        assert pacer.interval(1000)[0] == 300
+
+
+def test_ingest_replies_carry_hints(tmp_path):
+    client = create_app(
+        {"TESTING": True, "HISTORY_RETENTION_ENABLED": False},
+        instance_path=str(tmp_path / "instance"),
+    ).test_client()
+    with open("etc/example_data1.json") as f:
+        report = json.load(f)
+    report["auth_code"] = "pass"
+
+    out = client.post("/", json=report).get_json()
+    assert (out["next_report_secs"], out["backoff_secs"]) == (300, 0)
+    client.get("/api/dashboard-data")
+    out = client.post("/", json=report).get_json()
+    assert 30 <= out["next_report_secs"] < 35
@@ -0,0 +1,121 @@
+import sqlite3
+import time
+
+from cluster_dash_server import create_app, history, retention
+
+HOUR = 3600
+DAY = 86400
+
+
+def make_app(tmp_path, **config):
+    return create_app(
+        {"TESTING": True, "HISTORY_RETENTION_ENABLED": False, **config},
+        instance_path=str(tmp_path / "instance"),
+    )
+
+
+def raw_snapshots(start, free_gpus):
+    """One raw snapshot of host1 (8 GPUs) every 5 minutes from ``start``."""
+    return [
+        (start + i * 300, "host1", 8, free, 50.0, 40.0, 10.0)
+        for i, free in enumerate(free_gpus)
+    ]
+
+
+def hourly_averages(start):
+    """host1's ``(total_gpus, free_gpus)`` averaged over the hour from ``start``."""
+    (row,) = history._cluster_history_rows(start, start + HOUR, HOUR)
+    return row[2], row[3]
+
+
+def test_compaction_keeps_fractional_averages(tmp_path):
+    make_app(tmp_path, HISTORY_RAW_RETENTION_DAYS=1)
+    now = time.time()
+    start = (int(now) // HOUR - 48) * HOUR
+    # integer columns whose average isn't
+    history.write_rows({"gpu_snapshots": raw_snapshots(start, [1, 2])})
+    assert hourly_averages(start) == (8.0, 1.5)
+
+    summary = retention.run_compaction(now)
+    assert summary["error"] is None
+    assert summary["rows_compacted"] == 2
+    with sqlite3.connect(history.partition_path(history.partition_name(start))) as conn:
+        row = conn.execute(
+            "SELECT total_gpus, free_gpus, sample_count FROM gpu_snapshots_hourly"
+        ).fetchone()
+    assert row == (8.0, 1.5, 2)
+    assert hourly_averages(start) == (8.0, 1.5)
+
+
+def test_expired_month_keeps_the_tiers_kept_forever(tmp_path):
+    make_app(
+        tmp_path,
+        HISTORY_RAW_RETENTION_DAYS=1,
+        HISTORY_HOURLY_RETENTION_DAYS=2,
+        HISTORY_GPU_SAMPLE_RETENTION_DAYS=2,
+    )
+    now = time.time()
+    start = (int(now) // DAY - 100) * DAY
+    month = history.partition_name(start)
+    history.write_rows({
+        "gpu_snapshots": raw_snapshots(start, [1, 2, 3, 2]),
+        "gpu_samples": [(start, 1, 100, 50, 10, 0)],
+        "user_usage_daily": [(start, 1, 1, 3600.0, 7200.0)],
+    })
+
+    summary = retention.run_compaction(now)
+    assert summary["error"] is None
+    assert summary["partitions_dropped"] == 1
+    year = month[:4]
+    assert month not in history.list_partitions()
+    assert year in history.list_partitions()
+
+    with sqlite3.connect(history.partition_path(year)) as conn:
+        assert conn.execute(
+            "SELECT timestamp, free_gpus, sample_count FROM gpu_snapshots_daily"
+        ).fetchall() == [(start, 2.0, 4)]
+        assert conn.execute("SELECT COUNT(*) FROM user_usage_daily").fetchone()[0] == 1
+        assert conn.execute("SELECT COUNT(*) FROM gpu_samples").fetchone()[0] == 0
+    # queries attach the yearly partition like a monthly one
+    series = history.query_cluster_history(start=start, end=start + DAY, max_points=1)
+    assert series[0]["free_gpus"] == 2.0
+
+    # a yearly partition holding rows kept forever is never dropped
+    assert retention.run_compaction(now + 400 * DAY)["partitions_dropped"] == 0
+    assert year in history.list_partitions()
+
+
+def test_new_history_db_vacuums_incrementally(tmp_path):
+    client = make_app(tmp_path).test_client()
+    status = client.get("/api/admin/retention", headers={"X-Auth-Code": "pass"}).get_json()
+    assert status["db"]["auto_vacuum"] == "incremental"
+
+
+def test_vacuum_is_an_admin_action(tmp_path):
+    # a history DB from before incremental auto-vacuum
+    (tmp_path / "instance").mkdir()
+    conn = sqlite3.connect(tmp_path / "instance" / "gpu_history.db")
+    conn.execute("CREATE TABLE filler (data BLOB)")
+    with conn:
+        conn.execute("INSERT INTO filler VALUES (zeroblob(1000000))")
+    with conn:
+        conn.execute("DROP TABLE filler")
+    conn.close()
+
+    client = make_app(tmp_path).test_client()
+    headers = {"X-Auth-Code": "pass"}
+    # partitions, like a new entity DB, start out incremental
+    history.ensure_partition("2026-01")
+    assert client.get("/api/admin/retention").status_code == 403
+    status = client.get("/api/admin/retention", headers=headers).get_json()
+    assert status["db"]["auto_vacuum"] == "none"
+    assert status["db"]["freelist_pages"] > 0
+
+    out = client.post("/api/admin/retention?vacuum=1", headers=headers).get_json()
+    assert list(out["vacuumed"]) == [history.get_db_path()]
+    assert out["vacuumed"][history.get_db_path()] > 500000
+    assert out["db"]["auto_vacuum"] == "incremental"
+    assert out["db"]["freelist_pages"] == 0
+    # nothing left to switch over
+    out = client.post("/api/admin/retention?vacuum=1", headers=headers).get_json()
+    assert out["vacuumed"] == {}
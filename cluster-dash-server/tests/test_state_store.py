@@ -0,0 +1,182 @@
+import sys
+import threading
+import time
+
+from cluster_dash_server import state_store
+from cluster_dash_server.host_state import HostState
+from cluster_dash_server.state_store import DurableStateStore, LatestStateStore
+
+
+def make_state(hostname, received_timestamp=None, busy_gpus=None):
+    gpus = {}
+    for index, busy in enumerate(busy_gpus or ()):
+        gpus[f"{index}_gpu"] = {
+            "name": f"GPU model {index % 2}",
+            "uuid": f"{hostname}-{index}",
+            "index": index,
+            "total_mem": 24000,
+            "used_mem": 20000 if busy else 0,
+            "gpu_util": 90 if busy else 0,
+        }
+    return HostState({
+        "hostname": hostname,
+        "received_timestamp": received_timestamp or time.time(),
+        "cpu": {"cpu_percent": 10, "num_cpus": 8},
+        "gpu": gpus,
+    })
+
+
+def check_snapshot(snapshot):
+    """Assert ``snapshot``'s fields all describe the same set of reports."""
+    assert len(snapshot.hosts) == len(snapshot.host_versions) == len(snapshot.sorted_hosts)
+    names = [name for name, _state in snapshot.sorted_hosts]
+    assert names == sorted(names)
+    for name, state in snapshot.sorted_hosts:
+        assert snapshot.hosts[name] is state
+        assert 0 < snapshot.host_versions[name] <= snapshot.version
+
+    indexed = {}
+    for model, hosts in snapshot.free_by_model.items():
+        assert hosts
+        for hostname, gpus in hosts.items():
+            assert all(gpu.name == model for gpu in gpus)
+            indexed.setdefault(hostname, []).extend(gpus)
+    for name, state in snapshot.sorted_hosts:
+        assert sorted(indexed.pop(name, []), key=id) == sorted(state.free_gpu_states, key=id)
+    assert not indexed
+
+
+def test_refresh_moves_version_past_own_publishes(tmp_path):
+    # two server processes sharing one instance folder, neither refreshing
+    # on its own
+    db_path = str(tmp_path / "latest_state.db")
+    changes = []
+    a = DurableStateStore(db_path, refresh_secs=None, on_change=changes.append)
+    b = DurableStateStore(db_path, refresh_secs=None)
+
+    # b's report gets the lower row version, but a publishes before seeing it
+    b.publish(make_state("h1"))
+    a.publish(make_state("h2"))
+    since = a.snapshot().version
+
+    a._refresh()
+    snapshot = a.snapshot()
+    assert snapshot.version > since
+    assert snapshot.host_versions["h1"] > since
+    assert snapshot.host_versions["h2"] <= since
+    # the change callback (which wakes streams and waiters) saw the new version
+    assert changes[-1].version == snapshot.version
+
+
+def test_older_rows_do_not_replace_newer_reports(tmp_path):
+    db_path = str(tmp_path / "latest_state.db")
+    a = DurableStateStore(db_path, refresh_secs=None)
+    b = DurableStateStore(db_path, refresh_secs=None)
+
+    b.publish(make_state("h1", 100))
+    a.publish(make_state("h1", 200))
+    version = a.snapshot().version
+
+    # b's row for h1 was written first, so a keeps its own later report
+    a._refresh()
+    assert a.snapshot().hosts["h1"].received_timestamp == 200
+    assert a.snapshot().version == version
+
+    b._refresh()
+    assert b.snapshot().hosts["h1"].received_timestamp == 200
+
+
+def test_restart_loads_every_host(tmp_path):
+    db_path = str(tmp_path / "latest_state.db")
+    a = DurableStateStore(db_path, refresh_secs=None)
+    a.publish(make_state("h1"))
+    a.publish(make_state("h2"))
+
+    restarted = DurableStateStore(db_path, refresh_secs=None)
+    snapshot = restarted.snapshot()
+    assert sorted(snapshot.hosts) == ["h1", "h2"]
+    assert all(version <= snapshot.version for version in snapshot.host_versions.values())
+
+
+def test_processes_see_each_others_reports_but_do_not_reload_their_own(tmp_path, monkeypatch):
+    db_path = str(tmp_path / "latest_state.db")
+    # refresh on every snapshot
+    a = DurableStateStore(db_path, refresh_secs=0)
+    b = DurableStateStore(db_path, refresh_secs=0)
+    loaded = []
+
+    def load(report):
+        loaded.append(report["hostname"])
+        return HostState(report)
+    monkeypatch.setattr(state_store, "HostState", load)
+
+    b.publish(make_state("h1"))
+    a.publish(make_state("h2"))
+    a.publish(make_state("h3"))
+    assert sorted(a.snapshot().hosts) == ["h1", "h2", "h3"]
+    assert sorted(b.snapshot().hosts) == ["h1", "h2", "h3"]
+    # each store parsed only the other's rows
+    assert sorted(loaded) == ["h1", "h2", "h3"]
+
+    del loaded[:]
+    a.publish(make_state("h1"))
+    received = a.snapshot().hosts["h1"].received_timestamp
+    assert b.snapshot().hosts["h1"].received_timestamp == received
+    assert loaded == ["h1"]
+
+    # a process starting later loads everything either of them wrote
+    del loaded[:]
+    c = DurableStateStore(db_path, refresh_secs=0)
+    assert sorted(c.snapshot().hosts) == ["h1", "h2", "h3"]
+    assert sorted(loaded) == ["h1", "h2", "h3"]
+
+
+def test_readers_never_see_a_torn_snapshot():
+    store = LatestStateStore()
+    # each host flips between having both its GPUs free, one or none, so
+    # every publish moves the free-GPU index too
+    states = [
+        make_state(f"h{i}", busy_gpus=busy)
+        for i in range(20)
+        for busy in ((False, False), (True, False), (True, True))
+    ]
+    num_writers, publishes = 2, 1500
+    writing = threading.Barrier(num_writers + 1)
+    errors = []
+
+    def writer(offset):
+        writing.wait()
+        for i in range(publishes):
+            store.publish(states[(offset + i * 7) % len(states)])
+
+    def reader():
+        last = store.snapshot()
+        try:
+            while any(thread.is_alive() for thread in writers):
+                snapshot = store.snapshot()
+                check_snapshot(snapshot)
+                assert snapshot.version >= last.version
+                assert snapshot.free_version >= last.free_version
+                last = snapshot
+        except AssertionError as ex:
+            errors.append(ex)
+
+    writers = [threading.Thread(target=writer, args=(n,)) for n in range(num_writers)]
+    readers = [threading.Thread(target=reader) for _ in range(4)]
+    # switch threads as often as possible, to catch readers mid-publish
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        # writers first, so readers find them alive
+        for thread in writers + readers:
+            thread.start()
+        writing.wait()
+        for thread in writers + readers:
+            thread.join()
+    finally:
+        sys.setswitchinterval(switch_interval)
+    assert not errors, errors[0]
+
+    final = store.snapshot()
+    check_snapshot(final)
+    assert final.version == num_writers * publishes
@@ -0,0 +1,90 @@
+import http.client
+import json
+
+import pytest
+
+from cluster_dash_server import create_app
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app(
+        {"TESTING": True, "HISTORY_RETENTION_ENABLED": False, "PUSH_PORT": 0,
+         "STREAM_MAX_CLIENTS": 2, "STREAM_COALESCE_SECS": 0},
+        instance_path=str(tmp_path / "instance"),
+    )
+    return app
+
+
+def report(hostname="host1"):
+    with open("etc/example_data1.json") as f:
+        data = json.load(f)
+    data["hostname"] = hostname
+    data["auth_code"] = "pass"
+    return data
+
+
+def open_stream(port, path="/api/stream"):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    conn.request("GET", path)
+    return conn, conn.getresponse()
+
+
+def read_event(response):
+    """The next event's fields, skipping comments and the retry hint."""
+    fields = {}
+    while True:
+        line = response.fp.readline().decode().rstrip("\n")
+        if line:
+            name, _sep, value = line.partition(": ")
+            fields[name] = value
+        elif "data" in fields:
+            return fields
+        else:
+            fields = {}
+
+
+def test_streams_share_one_loop_and_get_deltas(app):
+    push = app.extensions["push_server"]
+    client = app.test_client()
+    client.post("/", json=report("host1"))
+
+    streams = [open_stream(push.port) for _ in range(2)]
+    for _conn, response in streams:
+        assert response.status == 200
+        assert response.getheader("Content-Type") == "text/event-stream"
+        first = json.loads(read_event(response)["data"])
+        assert first["full"] and list(first["servers"]) == ["host1"]
+    assert push.num_streams == 2
+
+    # past the cap
+    _conn, refused = open_stream(push.port)
+    assert refused.status == 503
+
+    client.post("/", json=report("host2"))
+    for _conn, response in streams:
+        event = read_event(response)
+        delta = json.loads(event["data"])
+        assert not delta["full"] and list(delta["servers"]) == ["host2"]
+        assert int(event["id"]) == delta["version"]
+    for conn, _response in streams:
+        conn.close()
+
+
+def test_waitress_redirects_to_the_push_server(app):
+    push = app.extensions["push_server"]
+    client = app.test_client()
+    response = client.get("/api/stream?since=3")
+    assert response.status_code == 307
+    assert response.location == f"http://localhost:{push.port}/api/stream?since=3"
+    assert f'content="http://localhost:{push.port}/api/stream"' in client.get("/").text
+
+
+def test_stream_unavailable_without_push_server(tmp_path):
+    app = create_app(
+        {"TESTING": True, "HISTORY_RETENTION_ENABLED": False},
+        instance_path=str(tmp_path / "instance"),
+    )
+    client = app.test_client()
+    assert client.get("/api/stream").status_code == 503
+    assert 'content="/api/stream"' in client.get("/").text
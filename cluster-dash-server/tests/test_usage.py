@@ -0,0 +1,33 @@
+import json
+
+from cluster_dash_server import create_app, usage
+from cluster_dash_server.host_state import HostState
+
+MIDNIGHT = 1792368000  # 2026-10-19 00:00 UTC
+
+
+def make_state(received_timestamp):
+    with open("etc/example_data1.json") as f:
+        data = json.load(f)
+    data.pop("auth_code")
+    list(data["gpu"].values())[0]["users"] = {"alice": {"123": {"mem": 2048, "time": 10}}}
+    data["received_timestamp"] = received_timestamp
+    return HostState(data)
+
+
+def test_usage_is_split_at_midnight_and_added_up(tmp_path):
+    create_app(
+        {"TESTING": True, "HISTORY_RETENTION_ENABLED": False},
+        instance_path=str(tmp_path / "instance"),
+    )
+    # 150 s either side of midnight, then 300 s more into the new day
+    for start in (MIDNIGHT - 150, MIDNIGHT + 150):
+        usage.record_usage(make_state(start), make_state(start + 300), max_gap_secs=600)
+
+    out = usage.query_usage_by_user(MIDNIGHT - 3600, MIDNIGHT + 3600, by_day=True)
+    alice = out["users"]["alice"]
+    assert alice["gpu_hours"] == round(600 / 3600, 3)
+    assert alice["days"] == {
+        MIDNIGHT - 86400: {"gpu_hours": round(150 / 3600, 3), "gpu_mem_gb_hours": round(2 * 150 / 3600, 3)},
+        MIDNIGHT: {"gpu_hours": round(450 / 3600, 3), "gpu_mem_gb_hours": round(2 * 450 / 3600, 3)},
+    }
@@ -0,0 +1,82 @@
+import http.client
+import json
+import threading
+import time
+
+import pytest
+
+from cluster_dash_server import create_app
+
+
+@pytest.fixture
+def app(tmp_path):
+    return create_app(
+        {"TESTING": True, "HISTORY_RETENTION_ENABLED": False, "PUSH_PORT": 0,
+         "WAIT_MAX_CLIENTS": 200},
+        instance_path=str(tmp_path / "instance"),
+    )
+
+
+def report():
+    with open("etc/example_data1.json") as f:
+        data = json.load(f)
+    data["auth_code"] = "pass"
+    return data
+
+
+def wait(port, query):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    try:
+        conn.request("GET", "/api/wait-for-gpus?" + query)
+        response = conn.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        conn.close()
+
+
+def test_many_waiters_wake_on_one_loop(app):
+    push = app.extensions["push_server"]
+    threads_before = threading.active_count()
+    replies = []
+
+    def waiter():
+        replies.append(wait(push.port, "model=3090&timeout=20"))
+
+    waiters = [threading.Thread(target=waiter) for _ in range(150)]
+    for t in waiters:
+        t.start()
+    while push.num_waiters < len(waiters):
+        time.sleep(0.01)
+    # only the test's own client threads were added
+    assert threading.active_count() == threads_before + len(waiters)
+
+    started = time.time()
+    app.test_client().post("/", json=report())
+    for t in waiters:
+        t.join()
+    assert time.time() - started < 5
+    assert all(status == 200 and out["matched"] for status, out in replies)
+    assert {out["total"] for _status, out in replies} == {2}
+
+
+def test_timeout_without_a_match(app):
+    push = app.extensions["push_server"]
+    status, out = wait(push.port, "model=NOPE&timeout=0.2")
+    assert status == 200
+    assert not out["matched"] and out["hosts"] == []
+    assert out["waited_secs"] >= 0.2
+
+
+def test_waitress_redirects_to_the_push_server(app, tmp_path):
+    push = app.extensions["push_server"]
+    response = app.test_client().get("/api/wait-for-gpus?model=3090&timeout=5")
+    assert response.status_code == 307
+    assert response.location == (
+        f"http://localhost:{push.port}/api/wait-for-gpus?model=3090&timeout=5"
+    )
+
+    without_push = create_app(
+        {"TESTING": True, "HISTORY_RETENTION_ENABLED": False},
+        instance_path=str(tmp_path / "other"),
+    )
+    assert without_push.test_client().get("/api/wait-for-gpus").status_code == 503